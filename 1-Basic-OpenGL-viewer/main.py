@@ -2,32 +2,29 @@ from OpenGL.GL import *
 from glfw.GLFW import *
 import glm
 import numpy as np
+import os
+import sys
+
+# shader.py and the other modules shared by every viewer live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils import Utils
-from vao import prepare_vao_frame
-from shader import load_shaders, g_vertex_shader_src, g_fragment_shader_src
-
-def draw_center_frame(vao, MVP, MVP_loc):
-    glUniformMatrix4fv(MVP_loc, 1, GL_FALSE, glm.value_ptr(MVP))
-    glBindVertexArray(vao)
-    glDrawArrays(GL_LINES, 0, 4)
-
-def draw_frame_grid(vao, MVP, MVP_loc):
-    for i in range(-100, 100):
-        if i == 0:
-            continue
-
-        T = glm.translate(glm.vec3(0.1*i, 0., 0.))
-        MVP_z = MVP*T
-        glUniformMatrix4fv(MVP_loc, 1, GL_FALSE, glm.value_ptr(MVP_z))
-        glBindVertexArray(vao)
-        glDrawArrays(GL_LINES, 2, 4)
-
-        T = glm.translate(glm.vec3(0., 0., 0.1*i))
-        MVP_x = MVP*T
-        glUniformMatrix4fv(MVP_loc, 1, GL_FALSE, glm.value_ptr(MVP_x))
-        glBindVertexArray(vao)
-        glDrawArrays(GL_LINES, 0, 2)
+from vao import prepare_vao_frame, prepare_vao_grid
+from shader import load_shaders, g_program_cache, g_vertex_shader_src, g_vertex_shader_src_overlay, g_fragment_shader_src
+from render_queue import CameraBuffer, RenderQueue
+from frame_pacer import FramePacer
+from profiler import Profiler
+
+WINDOW_TITLE = '2020057692'
+MAX_ANIMATION_FPS = 60      # frame rate cap of continuous redraws, None for uncapped
+PROFILE_EXPORT_PATH = 'profile.csv'     # rolling export of the profiled frames, '.csv' or '.json' (None: no export)
+
+def draw_center_frame(queue, program, vao, M):
+    queue.submit(program, vao, lambda: glDrawArrays(GL_LINES, 0, 4), {'M': M})
+
+def draw_frame_grid(queue, program, vao, vertex_count, M):
+    # the whole grid is a single vertex buffer, drawn in one call
+    queue.submit(program, vao, lambda: glDrawArrays(GL_LINES, 0, vertex_count), {'M': M})
 
 def main():
     # initialize glfw
@@ -39,53 +36,81 @@ def main():
     glfwWindowHint(GLFW_OPENGL_FORWARD_COMPAT, GL_TRUE) # for macOS
 
     # create a window and OpenGL context
-    window = glfwCreateWindow(1600, 1600, '2020057692', None, None)
+    window = glfwCreateWindow(1600, 1600, WINDOW_TITLE, None, None)
     if not window:
         glfwTerminate()
         return
     glfwMakeContextCurrent(window)
 
+    # redraw only when input or window events change the picture
+    pacer = FramePacer(window, MAX_ANIMATION_FPS)
+
     # register event callbacks
     utils = Utils()
-    glfwSetKeyCallback(window, utils.key_callback)
-    glfwSetCursorPosCallback(window, utils.cursor_callback)
-    glfwSetMouseButtonCallback(window, utils.button_callback)
-    glfwSetScrollCallback(window, utils.scroll_callback)
+    glfwSetKeyCallback(window, pacer.wrap(utils.key_callback))
+    glfwSetCursorPosCallback(window, pacer.wrap(utils.cursor_callback))
+    glfwSetMouseButtonCallback(window, pacer.wrap(utils.button_callback))
+    glfwSetScrollCallback(window, pacer.wrap(utils.scroll_callback))
 
     # load shaders
     shader_program = load_shaders(g_vertex_shader_src, g_fragment_shader_src)
-
-    # get uniform locations
-    MVP_loc = glGetUniformLocation(shader_program, 'MVP')
+    shader_for_overlay = load_shaders(g_vertex_shader_src_overlay, g_fragment_shader_src)
+    g_program_cache.report()
+
+    # camera uniforms shared by every program, draws sorted to skip redundant state changes
+    camera = CameraBuffer()
+    render_queue = RenderQueue()
+    profiler = Profiler(export_path=PROFILE_EXPORT_PATH)
+    window_title = WINDOW_TITLE
     
     # prepare vaos
     vao_center_frame = prepare_vao_frame(coordinate_axis=True)
-    vao_frame_grid = prepare_vao_frame(coordinate_axis=False)
+    vao_frame_grid, grid_vertex_count = prepare_vao_grid(100, .1, 10.0)
 
     # loop until the user closes the window
     while not glfwWindowShouldClose(window):
-        # render
-
-        # enable depth test (we'll see details later)
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glEnable(GL_DEPTH_TEST)
-
-        glUseProgram(shader_program)
-
-        # projection & view matrix
-        P = utils.get_projection_matrix()
-        V = utils.get_view_matrix()
-
-        I = glm.mat4()
-        draw_center_frame(vao_center_frame, P*V*I, MVP_loc)
-        draw_frame_grid(vao_frame_grid, P*V*I, MVP_loc)
-        
-
-        # swap front and back buffers
-        glfwSwapBuffers(window)
-
-        # poll events
-        glfwPollEvents()
+        pacer.on_demand = utils.render_on_demand
+        profiler.set_enabled(utils.profiling)
+        if pacer.should_draw(animating=False):
+            profiler.begin_frame()
+
+            # render
+
+            # enable depth test (we'll see details later)
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            glEnable(GL_DEPTH_TEST)
+
+            # projection & view matrix
+            P = utils.get_projection_matrix()
+            V = utils.get_view_matrix()
+            camera.update(P, V, glm.vec3(glm.inverse(V)[3]))
+            profiler.count('bytes_uploaded', camera.SIZE)
+
+            I = glm.mat4()
+            with profiler.phase('submit'):
+                draw_center_frame(render_queue, shader_program, vao_center_frame, I)
+                draw_frame_grid(render_queue, shader_program, vao_frame_grid, grid_vertex_count, I)
+            with profiler.phase('flush'):
+                render_queue.flush()
+            profiler.count('draw_calls', render_queue.num_draws)
+            profiler.count('uniform_uploads', render_queue.num_uniform_uploads)
+            profiler.count('bytes_uploaded', render_queue.uniform_bytes)
+            profiler.draw_overlay(shader_for_overlay)
+
+            title = f'{WINDOW_TITLE} - state changes: {render_queue.num_issued} issued, {render_queue.num_eliminated} eliminated'
+            if profiler.enabled and profiler.frames:
+                title += f' - {profiler.get_title()}'
+            if title != window_title:
+                glfwSetWindowTitle(window, title)
+                window_title = title
+
+            # swap front and back buffers
+            with profiler.phase('swap'):
+                glfwSwapBuffers(window)
+            profiler.end_frame()
+
+        # wait for events, or poll them when rendering continuously
+        pacer.wait_events(animating=False)
 
     # terminate glfw
     glfwTerminate()
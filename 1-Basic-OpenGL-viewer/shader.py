@@ -1,69 +0,0 @@
-from OpenGL.GL import *
-
-g_vertex_shader_src = '''
-#version 330 core
-layout (location = 0) in vec3 vin_pos; 
-layout (location = 1) in vec3 vin_color; 
-out vec4 vout_color;
-uniform mat4 MVP;
-void main()
-{
-    // 3D points in homogeneous coordinates
-    vec4 p3D_in_hcoord = vec4(vin_pos.xyz, 1.0);
-    gl_Position = MVP * p3D_in_hcoord;
-    vout_color = vec4(vin_color, 1.);
-}
-'''
-
-g_fragment_shader_src = '''
-#version 330 core
-in vec4 vout_color;
-out vec4 FragColor;
-void main()
-{
-    FragColor = vout_color;
-}
-'''
-
-def load_shaders(vertex_shader_source, fragment_shader_source):
-    # build and compile our shader program
-    # ------------------------------------
-    
-    # vertex shader 
-    vertex_shader = glCreateShader(GL_VERTEX_SHADER)    # create an empty shader object
-    glShaderSource(vertex_shader, vertex_shader_source) # provide shader source code
-    glCompileShader(vertex_shader)                      # compile the shader object
-    
-    # check for shader compile errors
-    success = glGetShaderiv(vertex_shader, GL_COMPILE_STATUS)
-    if (not success):
-        infoLog = glGetShaderInfoLog(vertex_shader)
-        print("ERROR::SHADER::VERTEX::COMPILATION_FAILED\n" + infoLog.decode())
-        
-    # fragment shader
-    fragment_shader = glCreateShader(GL_FRAGMENT_SHADER)    # create an empty shader object
-    glShaderSource(fragment_shader, fragment_shader_source) # provide shader source code
-    glCompileShader(fragment_shader)                        # compile the shader object
-    
-    # check for shader compile errors
-    success = glGetShaderiv(fragment_shader, GL_COMPILE_STATUS)
-    if (not success):
-        infoLog = glGetShaderInfoLog(fragment_shader)
-        print("ERROR::SHADER::FRAGMENT::COMPILATION_FAILED\n" + infoLog.decode())
-
-    # link shaders
-    shader_program = glCreateProgram()               # create an empty program object
-    glAttachShader(shader_program, vertex_shader)    # attach the shader objects to the program object
-    glAttachShader(shader_program, fragment_shader)
-    glLinkProgram(shader_program)                    # link the program object
-
-    # check for linking errors
-    success = glGetProgramiv(shader_program, GL_LINK_STATUS)
-    if (not success):
-        infoLog = glGetProgramInfoLog(shader_program)
-        print("ERROR::SHADER::PROGRAM::LINKING_FAILED\n" + infoLog.decode())
-        
-    glDeleteShader(vertex_shader)
-    glDeleteShader(fragment_shader)
-
-    return shader_program    # return the shader program
\ No newline at end of file
@@ -9,6 +9,8 @@ class Utils:
         self.mouse_left_down = False
         self.mouse_right_down = False
         self.is_orthogonal = False      # False: perspective (default) / True: orthogonal projection mode
+        self.render_on_demand = True    # True: redraw only on input / window events (default) / False: redraw continuously
+        self.profiling = False          # per-frame timings and counters, shown in the window title and an overlay
         
         # Variables related to the view, projection
         self.azimuth = 60
@@ -46,6 +48,10 @@ class Utils:
             if action==GLFW_PRESS or action==GLFW_REPEAT:
                 if key==GLFW_KEY_V:
                     self.is_orthogonal = not self.is_orthogonal
+                if key==GLFW_KEY_O:
+                    self.render_on_demand = not self.render_on_demand
+                if key==GLFW_KEY_P:
+                    self.profiling = not self.profiling
 
     def cursor_callback(self, window, xpos, ypos):
         # Orbit: Rotate the camera around the target point.
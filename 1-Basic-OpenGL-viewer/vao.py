@@ -1,5 +1,6 @@
 from OpenGL.GL import *
 import glm
+import numpy as np
 import ctypes
 
 def prepare_vao_frame(coordinate_axis=False):
@@ -40,4 +41,37 @@ def prepare_vao_frame(coordinate_axis=False):
     glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), ctypes.c_void_p(3*glm.sizeof(glm.float32)))
     glEnableVertexAttribArray(1)
 
-    return VAO
\ No newline at end of file
+    return VAO
+
+def prepare_vao_grid(num_lines, spacing, half_length):
+    # prepare vertex data (in main memory): grey lines parallel to the z and x axes at spacing * i for i in [-num_lines, num_lines) except 0,
+    # each reaching half_length to both sides, so the whole grid is drawn with a single draw call
+    offsets = spacing * np.array([i for i in range(-num_lines, num_lines) if i != 0], dtype=np.float32)
+    vertices = np.zeros((2, len(offsets), 2, 6), dtype=np.float32)
+    vertices[0, :, :, 0] = offsets[:, None]                 # lines along the z-axis
+    vertices[0, :, :, 2] = [-half_length, half_length]
+    vertices[1, :, :, 0] = [-half_length, half_length]      # lines along the x-axis
+    vertices[1, :, :, 2] = offsets[:, None]
+    vertices[..., 3:] = 0.4
+
+    # create and activate VAO (vertex array object)
+    VAO = glGenVertexArrays(1)  # create a vertex array object ID and store it to VAO variable
+    glBindVertexArray(VAO)      # activate VAO
+
+    # create and activate VBO (vertex buffer object)
+    VBO = glGenBuffers(1)   # create a buffer object ID and store it to VBO variable
+    glBindBuffer(GL_ARRAY_BUFFER, VBO)  # activate VBO as a vertex buffer object
+
+    # copy vertex data to VBO
+    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, ctypes.c_void_p(vertices.ctypes.data), GL_STATIC_DRAW) # allocate GPU memory for and copy vertex data to the currently bound vertex buffer
+
+    # configure vertex positions
+    glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), None)
+    glEnableVertexAttribArray(0)
+
+    # configure vertex colors
+    glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), ctypes.c_void_p(3*glm.sizeof(glm.float32)))
+    glEnableVertexAttribArray(1)
+
+    # vertex count drawn with GL_LINES
+    return VAO, vertices.size // 6
@@ -0,0 +1,118 @@
+import os
+
+from vao import MaterialUpload, delete_vao
+
+DEFAULT_GPU_BUDGET_BYTES = 1 << 30
+
+class Mesh:
+    def __init__(self, key, material):
+        # a material shared by every user of the same file, and its GPU buffers (None while evicted)
+        self.key = key
+        self.material = material
+        self.vao = None
+        self.upload = None          # MaterialUpload in progress, until the mesh has a VAO
+        self.buffers = []
+        self.gpu_bytes = 0
+        self.ref_count = 0
+        self.last_drawn = -1
+
+class AssetRegistry:
+    def __init__(self, load_material, gpu_budget_bytes=DEFAULT_GPU_BUDGET_BYTES):
+        self.load_material = load_material
+        self.gpu_budget_bytes = gpu_budget_bytes
+        self.meshes = {}
+        self.frame = 0
+        self.uploads = []         # meshes used without a VAO, uploaded by step_uploads in the order they were needed
+
+    def get_key(self, path):
+        # a file edited on disk is a different asset
+        path = os.path.abspath(path)
+        return path, os.stat(path).st_mtime_ns
+
+    def find(self, path):
+        try:
+            return self.meshes.get(self.get_key(path))
+        except OSError:
+            return None
+
+    def acquire(self, path):
+        # shared mesh of path with one more user, loading and uploading it on first use (None if it can't be loaded)
+        mesh = self.find(path)
+        if mesh is None:
+            try:
+                material = self.load_material(path)
+            except Exception as e:
+                print(f"Error: Could not load file {path} ({e})")
+                return None
+            mesh = self.add(path, material)
+        mesh.ref_count += 1
+        return mesh
+
+    def add(self, path, material, upload=None):
+        # register a material parsed elsewhere, optionally with its finished upload; the caller still has to acquire it
+        mesh = Mesh(self.get_key(path), material)
+        self.meshes[mesh.key] = mesh
+        if upload is not None:
+            self._set_upload(mesh, upload)
+        return mesh
+
+    def release(self, mesh):
+        # one user less; the last one frees the GPU buffers
+        mesh.ref_count -= 1
+        if mesh.ref_count <= 0:
+            self._free_gpu(mesh)
+            if self.meshes.get(mesh.key) is mesh:
+                del self.meshes[mesh.key]
+
+    def use(self, mesh):
+        # VAO to draw mesh with this frame, or None while it is being uploaded (first use, or drawn again after an eviction):
+        # the caller skips the mesh (its levels of detail share one buffer, so no coarser one is resident either)
+        # until step_uploads has copied it within the per-frame upload budget
+        if mesh.vao is None and mesh.upload is None:
+            mesh.upload = MaterialUpload(mesh.material)
+            mesh.buffers, mesh.gpu_bytes = mesh.upload.buffers, mesh.upload.total_bytes
+            self.uploads.append(mesh)
+        mesh.last_drawn = self.frame
+        return mesh.vao
+
+    def step_uploads(self, budget):
+        # copy at most budget bytes of the pending uploads to the GPU, returns the number of bytes copied
+        uploaded = 0
+        while self.uploads and uploaded < budget:
+            mesh = self.uploads[0]
+            uploaded += mesh.upload.step(budget - uploaded)
+            if mesh.upload.is_done():
+                self.uploads.pop(0)
+                self._set_upload(mesh, mesh.upload)
+                mesh.upload = None
+        return uploaded
+
+    def is_uploading(self):
+        return bool(self.uploads)
+
+    def begin_frame(self):
+        # evict least recently drawn meshes while over budget; meshes drawn in the last frame are kept
+        total = self.get_gpu_bytes()
+        for mesh in sorted(self.meshes.values(), key=lambda mesh: mesh.last_drawn):
+            if total <= self.gpu_budget_bytes or mesh.last_drawn >= self.frame:
+                break
+            if mesh.buffers:
+                total -= mesh.gpu_bytes
+                self._free_gpu(mesh)
+        self.frame += 1
+
+    def get_gpu_bytes(self):
+        return sum(mesh.gpu_bytes for mesh in self.meshes.values())
+
+    def _set_upload(self, mesh, upload):
+        mesh.vao, mesh.buffers, mesh.gpu_bytes = upload.vao, upload.buffers, upload.total_bytes
+
+    def _free_gpu(self, mesh):
+        if mesh.upload is not None:
+            # evicted or released before its upload finished
+            delete_vao(mesh.upload.vao, mesh.upload.buffers)
+            self.uploads.remove(mesh)
+            mesh.upload = None
+        elif mesh.vao is not None:
+            delete_vao(mesh.vao, mesh.buffers)
+        mesh.vao, mesh.buffers, mesh.gpu_bytes = None, [], 0
@@ -0,0 +1,175 @@
+import argparse
+import ctypes
+import os
+import sys
+import time
+
+import glm
+import numpy as np
+
+# shader.py and the other modules shared by every viewer live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from obj_loader import Material, parse_obj, parse_obj_parallel
+from vertex_format import VERTEX_LAYOUTS, get_vertex_stride, measure_packing_error, pack_vertices
+from normal_matrix import get_normal_matrix, get_normal_matrices
+
+GPU_BENCHMARK_SIZE = 256    # offscreen framebuffer size of the shader measurement, small so that vertex shading dominates
+
+def benchmark_parse_scaling(filename, worker_counts, repeat):
+    # parse throughput of the serial parser and of the process pool parser for every worker count
+    num_mb = os.path.getsize(filename) / (1 << 20)
+    print(f'obj file name: {os.path.basename(filename)} ({num_mb:.1f} MB)')
+
+    start_time = time.perf_counter()
+    with open(filename, 'rb') as file:
+        reference = parse_obj(file.read())
+    serial_time = time.perf_counter() - start_time
+    print(f'{"serial":>10}: {serial_time:8.3f} s {num_mb / serial_time:8.1f} MB/s')
+
+    for num_workers in worker_counts:
+        best_time = float('inf')
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            records = parse_obj_parallel(filename, num_workers)
+            best_time = min(best_time, time.perf_counter() - start_time)
+        identical = all(a.dtype == b.dtype and a.tobytes() == b.tobytes() for a, b in zip(records, reference))
+        print(f'{num_workers:>2} workers: {best_time:8.3f} s {num_mb / best_time:8.1f} MB/s  speedup {serial_time / best_time:5.2f}x  identical: {identical}')
+
+def benchmark_vertex_formats(filename):
+    # vertex buffer size and precision loss of every vertex layout
+    material = Material(filename)
+    vertices, bounds = material.get_vertex_pos_and_normal(), material.get_bounds()
+    reference_bytes = material.get_vertex_count() * get_vertex_stride('float32')
+    for layout in VERTEX_LAYOUTS:
+        start_time = time.perf_counter()
+        packed = pack_vertices(vertices, layout, bounds)
+        pack_time = time.perf_counter() - start_time
+        position_error, normal_error = measure_packing_error(vertices, layout, bounds)
+        print(f'{layout:>10}: {packed.nbytes / (1 << 20):8.2f} MB ({reference_bytes / max(packed.nbytes, 1):.1f}x smaller)  pack {pack_time:.3f} s  '
+              f'max position error {position_error:.2e} of bbox diagonal  max normal error {normal_error:.3f} deg')
+
+def benchmark_normal_matrix(filename, num_nodes, repeat):
+    # cost of the normal matrix per vertex in the shader (as before) vs. per node on the CPU, for num_nodes copies of a mesh
+    material = Material(filename)
+    num_vertices = material.get_vertex_count()
+    print(f'obj file name: {os.path.basename(filename)} ({num_vertices} vertices), {num_nodes} nodes')
+
+    # half rigid, half non-uniformly scaled model matrices
+    rng = np.random.default_rng(0)
+    matrices = []
+    for i in range(num_nodes):
+        R = glm.rotate(float(rng.uniform(0, 2 * np.pi)), glm.normalize(glm.vec3(*rng.normal(size=3))))
+        S = glm.scale(glm.vec3(float(rng.uniform(.1, 2)))) if i % 2 else glm.scale(glm.vec3(*rng.uniform(.1, 2, 3)))
+        matrices.append(glm.translate(glm.vec3(*rng.normal(size=3))) * R * S)
+    array = np.stack([np.frombuffer(M.to_bytes(), dtype=np.float32).reshape(4, 4) for M in matrices])
+
+    def best_time(function):
+        times = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start_time)
+        return min(times)
+
+    single_time = best_time(lambda: [get_normal_matrix(M) for M in matrices])
+    rigid_time = best_time(lambda: [get_normal_matrix(M, rigid=True) for M in matrices])
+    batch_time = best_time(lambda: get_normal_matrices(array))
+    print(f'{"per node":>10}: {single_time * 1e3:8.3f} ms per frame (get_normal_matrix)')
+    print(f'{"rigid":>10}: {rigid_time * 1e3:8.3f} ms per frame (get_normal_matrix, rigid=True)')
+    print(f'{"batched":>10}: {batch_time * 1e3:8.3f} ms per frame (get_normal_matrices)')
+
+    # the vertex shader used to invert the model matrix for every vertex drawn, now it only multiplies by a uniform
+    try:
+        shader_times = measure_normal_matrix_shaders(material, matrices, repeat)
+    except Exception as e:
+        print(f'Error: could not measure the shaders in an offscreen context ({e})')
+        return
+    for name, gpu_time in shader_times.items():
+        print(f'{name:>10}: {gpu_time * 1e3:8.3f} ms per frame on the GPU')
+    print(f'shader matrix inversions per frame: {num_vertices * num_nodes} before, 0 now; CPU normal matrices per frame: {num_nodes}')
+
+def measure_normal_matrix_shaders(material, matrices, repeat):
+    # {shader: best GPU time of drawing the mesh once per matrix} for the vertex shader inverting M per vertex (as before)
+    # and the one taking the normal matrix N as a uniform, measured with GL_TIME_ELAPSED queries in an offscreen context
+    from OpenGL.GL import (glClear, glEnable, glFinish, glDrawArrays, glDrawElementsBaseVertex, glGenQueries, glBeginQuery, glEndQuery,
+                           glGetQueryObjectui64v, GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_QUERY_RESULT,
+                           GL_TIME_ELAPSED, GL_TRIANGLES, GL_UNSIGNED_SHORT, GL_UNSIGNED_INT)
+    from offscreen import OffscreenContext
+    from vao import prepare_vao_material
+    from shader import load_shaders, g_vertex_shader_src_normal, g_fragment_shader_src_normal
+    from render_queue import CameraBuffer, RenderQueue
+
+    context = OffscreenContext(GPU_BENCHMARK_SIZE, GPU_BENCHMARK_SIZE)
+    per_vertex_src = g_vertex_shader_src_normal.replace('normalize(N * vin_normal)', 'normalize(mat3(transpose(inverse(M))) * vin_normal)')
+    programs = {'in shader': load_shaders(per_vertex_src, g_fragment_shader_src_normal),
+                'uniform N': load_shaders(g_vertex_shader_src_normal, g_fragment_shader_src_normal)}
+    camera = CameraBuffer()
+    camera.update(glm.perspective(glm.radians(45), 1, .1, 100), glm.lookAt(glm.vec3(0, 0, 8), glm.vec3(0), glm.vec3(0, 1, 0)), glm.vec3(0, 0, 8))
+    render_queue = RenderQueue()
+    vao = prepare_vao_material(material)
+
+    first_index, count, base_vertex = material.get_lod(0)
+    if material.indexed:
+        index_type = GL_UNSIGNED_SHORT if material.indices.dtype == np.uint16 else GL_UNSIGNED_INT
+        offset = ctypes.c_void_p(first_index * material.indices.itemsize)
+        draw = lambda: glDrawElementsBaseVertex(GL_TRIANGLES, count, index_type, offset, base_vertex)
+    else:
+        draw = lambda: glDrawArrays(GL_TRIANGLES, 0, count)
+    # the mesh scaled to a unit size, each node's matrix applied on top
+    uniforms = [{'M': M * material.get_position_transform(), 'N': get_normal_matrix(M * material.get_position_transform()),
+                 'material_color': glm.vec3(1)} for M in matrices]
+
+    glEnable(GL_DEPTH_TEST)
+    query = glGenQueries(1)[0]
+    times = {}
+    for name, program in programs.items():
+        best = float('inf')
+        # one more round than asked: the first one warms up (and some drivers report a bogus first query)
+        for i in range(repeat + 1):
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            glFinish()
+            glBeginQuery(GL_TIME_ELAPSED, query)
+            for node_uniforms in uniforms:
+                render_queue.submit(program, vao, draw, node_uniforms)
+            render_queue.flush()
+            glEndQuery(GL_TIME_ELAPSED)
+            nanoseconds = ctypes.c_uint64()
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(nanoseconds))
+            if i > 0:
+                best = min(best, nanoseconds.value / 1e9)
+        times[name] = best
+    context.destroy()
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description='obj viewer benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parse_scaling = subparsers.add_parser('parse-scaling', help='serial vs. multi-process obj parsing')
+    parse_scaling.add_argument('filename')
+    parse_scaling.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parse_scaling.add_argument('--repeat', type=int, default=3)
+
+    vertex_formats = subparsers.add_parser('vertex-formats', help='size and precision of the vertex buffer layouts')
+    vertex_formats.add_argument('filename')
+
+    normal_matrix = subparsers.add_parser('normal-matrix', help='normal matrix cost in the vertex shader vs. on the CPU')
+    normal_matrix.add_argument('filename')
+    normal_matrix.add_argument('--nodes', type=int, default=1000)
+    normal_matrix.add_argument('--repeat', type=int, default=3)
+    normal_matrix.add_argument('--platform', choices=['egl', 'osmesa'], default=os.environ.get('PYOPENGL_PLATFORM', 'egl'),
+                               help="offscreen context of the shader measurement: 'egl' (GPU or software EGL) or 'osmesa'")
+
+    args = parser.parse_args()
+    if args.command == 'parse-scaling':
+        benchmark_parse_scaling(args.filename, args.workers, args.repeat)
+    elif args.command == 'vertex-formats':
+        benchmark_vertex_formats(args.filename)
+    elif args.command == 'normal-matrix':
+        # PyOpenGL picks its platform when it is first imported, nothing using OpenGL is imported before this
+        os.environ['PYOPENGL_PLATFORM'] = args.platform
+        benchmark_normal_matrix(args.filename, args.nodes, args.repeat)
+
+if __name__ == "__main__":
+    main()
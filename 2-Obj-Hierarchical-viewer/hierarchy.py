@@ -1,7 +1,7 @@
 import glm
 
 class Node:
-    def __init__(self, parent, shape_transform, color):
+    def __init__(self, parent, shape_transform, color, mesh=None):
         # hierarchy
         self.parent = parent
         self.children = []
@@ -15,6 +15,7 @@ class Node:
         # shape
         self.shape_transform = shape_transform
         self.color = color
+        self.mesh = mesh    # shared Mesh from the asset registry, or None for an empty node
 
     def set_transform(self, transform):
         self.transform = transform
@@ -33,4 +34,6 @@ class Node:
     def get_shape_transform(self):
         return self.shape_transform
     def get_color(self):
-        return self.color
\ No newline at end of file
+        return self.color
+    def get_mesh(self):
+        return self.mesh
\ No newline at end of file
@@ -2,19 +2,55 @@ from OpenGL.GL import *
 from glfw.GLFW import *
 import glm
 import numpy as np
+import ctypes
+import functools
 import os
+import sys
 
-from vao import prepare_vao_frame, prepare_vao_material
-from shader import load_shaders, g_vertex_shader_src, g_vertex_shader_src_normal, g_fragment_shader_src, g_fragment_shader_src_normal
-from obj_loader import Material
+# shader.py and the other modules shared by every viewer live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vao import prepare_vao_frame, prepare_vao_grid, MaterialUpload, InstanceBuffer
+from shader import load_shaders, g_program_cache, g_vertex_shader_src, g_vertex_shader_src_normal, g_vertex_shader_src_instanced, g_vertex_shader_src_overlay, g_fragment_shader_src, g_fragment_shader_src_normal
+from obj_loader import Material, StreamingMaterial
+from mesh_cache import MeshCache
+from asset_loader import AssetLoader
+from asset_registry import AssetRegistry
 from hierarchy import Node
+from render_queue import CameraBuffer, RenderQueue
+from normal_matrix import get_normal_matrix, get_normal_matrices
+from culling import cull_boxes
+from frame_pacer import FramePacer
+from profiler import Profiler
 
 PROJECT_DIR = os.path.dirname( os.path.abspath( __file__ ) )
-
-g_single_material = None
-g_vao_single_material = None
+WINDOW_TITLE = '2020057692'
+UPLOAD_BUDGET_BYTES = 8 << 20   # GPU upload per frame, for dropped meshes
+STREAM_THRESHOLD_BYTES = 256 << 20  # dropped obj files larger than this are streamed with bounded memory
+PARALLEL_PARSE_BYTES = 32 << 20     # dropped obj files larger than this are parsed on all cores
+GPU_MEMORY_BUDGET_BYTES = 1 << 30   # least recently drawn meshes are evicted from GPU memory above this
+VERTEX_LAYOUT = 'quantized'         # vertex buffer format of parsed meshes: 'float32', 'half' or 'quantized'
+MAX_ANIMATION_FPS = 60              # frame rate cap of the hierarchical model animation, None for uncapped
+PROFILE_EXPORT_PATH = 'profile.csv' # rolling export of the profiled frames, '.csv' or '.json' (None: no export)
+
+g_mesh_cache = MeshCache()
+g_single_mesh = None
+g_loaded_meshes = []        # every dropped mesh, in load order
+g_loading_paths = set()     # dropped files being parsed or uploaded
+g_material_uploads = []     # (path, upload) of dropped meshes waiting for their GPU upload
+g_window_title = WINDOW_TITLE
+g_render_queue = RenderQueue()
 g_hierarchical_mode = False
 g_wireframe_mode = False
+g_lod_enabled = True
+g_instancing_enabled = True # draw hierarchical model nodes sharing a mesh with one instanced call
+g_lod_pixel_scale = 1.      # pixels per unit of size at clip w = 1, updated every frame
+g_lod_triangles = [0, 0]    # triangles drawn / triangles at full resolution in the last frame
+g_culling_enabled = True
+g_cull_counts = [0, 0]      # meshes culled / drawn in the last frame
+g_render_on_demand = True   # redraw only on input, window events, loads and animation, instead of every loop iteration
+g_profiling_enabled = False
+g_profiler = Profiler(export_path=PROFILE_EXPORT_PATH)
 
 # Manage inputs
 g_mouse_left_down = False
@@ -52,7 +88,7 @@ def get_projection_matrix():
 
 # callbacks
 def key_callback(window, key, scancode, action, mods):
-    global g_is_orthogonal, g_single_material, g_hierarchical_mode, g_wireframe_mode
+    global g_is_orthogonal, g_single_mesh, g_hierarchical_mode, g_wireframe_mode, g_lod_enabled, g_instancing_enabled, g_culling_enabled, g_render_on_demand, g_profiling_enabled
     if key==GLFW_KEY_ESCAPE and action==GLFW_PRESS:
         glfwSetWindowShouldClose(window, GLFW_TRUE);
     else:
@@ -60,10 +96,32 @@ def key_callback(window, key, scancode, action, mods):
             if key==GLFW_KEY_V:
                 g_is_orthogonal = not g_is_orthogonal
             if key==GLFW_KEY_H:
-                g_single_material = None
+                g_single_mesh = None
                 g_hierarchical_mode = True
+            if key==GLFW_KEY_TAB and g_loaded_meshes:
+                # cycle through dropped meshes
+                idx = g_loaded_meshes.index(g_single_mesh) if g_single_mesh in g_loaded_meshes else -1
+                g_single_mesh = g_loaded_meshes[(idx + 1) % len(g_loaded_meshes)]
+            if key==GLFW_KEY_X and g_single_mesh in g_loaded_meshes:
+                # unload the shown dropped mesh
+                g_loaded_meshes.remove(g_single_mesh)
+                g_asset_registry.release(g_single_mesh)
+                g_single_mesh = g_loaded_meshes[-1] if g_loaded_meshes else None
             if key==GLFW_KEY_Z:
                 g_wireframe_mode = not g_wireframe_mode
+            if key==GLFW_KEY_L:
+                g_lod_enabled = not g_lod_enabled
+            if key==GLFW_KEY_I:
+                g_instancing_enabled = not g_instancing_enabled
+            if key==GLFW_KEY_F:
+                g_culling_enabled = not g_culling_enabled
+            if key==GLFW_KEY_O:
+                g_render_on_demand = not g_render_on_demand
+            if key==GLFW_KEY_P:
+                g_profiling_enabled = not g_profiling_enabled
+            if key==GLFW_KEY_C:
+                g_mesh_cache.invalidate()
+                print("mesh cache cleared")
             if key==GLFW_KEY_1:
                 print(f"g_cam_front: {g_cam_target - g_cam_front * g_zoom}, g_cam_target: {g_cam_target}, g_cam_up: {g_cam_up}")
 
@@ -109,63 +167,229 @@ def scroll_callback(window, xoffset, yoffset):
     # Zoom: Move the camera forward the target point (zoom in) and backward away from the target point (zoom out).
     g_zoom = max(g_zoom - yoffset * .1, 1.)
 
+def load_dropped_material(path):
+    # runs on a loader thread; very large files are streamed instead of parsed in one piece
+    if os.path.getsize(path) > STREAM_THRESHOLD_BYTES:
+        return StreamingMaterial(path)
+    num_workers = (os.cpu_count() or 1) if os.path.getsize(path) > PARALLEL_PARSE_BYTES else 1
+    return Material(path, cache=g_mesh_cache, num_workers=num_workers, vertex_layout=VERTEX_LAYOUT)
+
+# finished loads wake up the render loop waiting for events
+g_asset_loader = AssetLoader(load_dropped_material, on_finished=glfwPostEmptyEvent)
+g_asset_registry = AssetRegistry(load_dropped_material, GPU_MEMORY_BUDGET_BYTES)
+
 def drag_and_drop_callback(window, paths):
-    global g_single_material, g_vao_single_material
-    g_single_material = Material(paths[0])
-    g_vao_single_material = prepare_vao_material(g_single_material)
+    global g_single_mesh
+    # parse every dropped file in the background, the render loop uploads them when ready
+    for path in paths:
+        mesh = g_asset_registry.find(path)
+        if mesh in g_loaded_meshes:
+            # already loaded and unchanged on disk: show it again without re-parsing
+            g_single_mesh = mesh
+        elif mesh is not None:
+            g_single_mesh = g_asset_registry.acquire(path)
+            g_loaded_meshes.append(g_single_mesh)
+        elif path not in g_loading_paths:
+            g_loading_paths.add(path)
+            g_asset_loader.submit(path)
+
+def upload_dropped_materials():
+    # returns whether anything was loaded or uploaded, i.e. the frame needs a redraw
+    global g_single_mesh
+    finished = g_asset_loader.get_finished()
+    changed = bool(finished or g_material_uploads or g_asset_registry.is_uploading())
+    for path, material in finished:
+        if material is not None:
+            g_material_uploads.append((path, MaterialUpload(material)))
+        else:
+            g_loading_paths.discard(path)
+
+    # copy at most UPLOAD_BUDGET_BYTES per frame to the GPU, so large meshes never stall a frame
+    budget = UPLOAD_BUDGET_BYTES
+    while g_material_uploads and budget > 0:
+        path, upload = g_material_uploads[0]
+        num_bytes = upload.step(budget)
+        budget -= num_bytes
+        g_profiler.count('bytes_uploaded', num_bytes)
+        if upload.is_done():
+            g_material_uploads.pop(0)
+            g_loading_paths.discard(path)
+            g_asset_registry.add(path, upload.material, upload)
+            # show the most recently loaded mesh
+            g_single_mesh = g_asset_registry.acquire(path)
+            g_loaded_meshes.append(g_single_mesh)
+
+    # meshes the registry uploads on use (evicted ones drawn again) share the same budget
+    num_bytes = g_asset_registry.step_uploads(budget)
+    g_profiler.count('bytes_uploaded', num_bytes)
+    return changed
+
+def update_window_title(window):
+    global g_window_title
+    num_loading = g_asset_loader.num_pending + len(g_material_uploads)
+    if num_loading == 0:
+        title = WINDOW_TITLE
+    elif g_material_uploads:
+        title = f'{WINDOW_TITLE} - loading {num_loading} asset(s), uploading {g_material_uploads[0][1].get_progress() * 100:.0f}%'
+    else:
+        title = f'{WINDOW_TITLE} - loading {num_loading} asset(s)'
+
+    # triangle count savings of level of detail selection in the last frame
+    num_drawn, num_full = g_lod_triangles
+    if num_full:
+        title += f' - lod {"on" if g_lod_enabled else "off"}: {num_drawn} / {num_full} triangles ({(1 - num_drawn / num_full) * 100:.0f}% saved)'
+    g_lod_triangles[:] = [0, 0]
+    # meshes skipped by frustum culling in the last frame
+    num_culled, num_drawn = g_cull_counts
+    title += f' - culling {"on" if g_culling_enabled else "off"}: {num_culled} culled, {num_drawn} drawn'
+    g_cull_counts[:] = [0, 0]
+    # GL state changes the render queue issued and skipped in the last frame
+    title += f' - state changes: {g_render_queue.num_issued} issued, {g_render_queue.num_eliminated} eliminated'
+    # frame time breakdown averaged over the profiled frames
+    if g_profiler.enabled and g_profiler.frames:
+        title += f' - {g_profiler.get_title()}'
+    if title != g_window_title:
+        glfwSetWindowTitle(window, title)
+        g_window_title = title
 
 # draw functions
-def draw_center_frame(vao, MVP, MVP_loc):
-    glUniformMatrix4fv(MVP_loc, 1, GL_FALSE, glm.value_ptr(MVP))
-    glBindVertexArray(vao)
-    glDrawArrays(GL_LINES, 0, 4)
-
-def draw_frame_grid(vao, MVP, MVP_loc):
-    for i in range(-1000, 1000):
-        if i == 0:
-            continue
-
-        T = glm.translate(glm.vec3(0.1*i, 0., 0.))
-        MVP_z = MVP*T
-        glUniformMatrix4fv(MVP_loc, 1, GL_FALSE, glm.value_ptr(MVP_z))
-        glBindVertexArray(vao)
-        glDrawArrays(GL_LINES, 2, 4)
+def draw_center_frame(program, vao, M):
+    g_render_queue.submit(program, vao, lambda: glDrawArrays(GL_LINES, 0, 4), {'M': M})
+
+def draw_frame_grid(program, vao, vertex_count, M):
+    # the whole grid is a single vertex buffer, drawn in one call
+    g_render_queue.submit(program, vao, lambda: glDrawArrays(GL_LINES, 0, vertex_count), {'M': M})
+
+def cull_meshes(meshes, matrices, VP):
+    # visibility of meshes drawn with model matrices (in obj coordinates), their bounds tested against the view frustum in one batch
+    if not meshes:
+        return np.zeros(0, dtype=bool)
+    if g_culling_enabled:
+        bounds = np.array([mesh.material.bounds for mesh in meshes])
+        radii = np.array([mesh.material.radius for mesh in meshes])
+        # glm matrices are column-major, so their bytes read row-major are the transposed matrix
+        array = np.stack([np.frombuffer(M.to_bytes(), dtype=np.float32).reshape(4, 4) for M in matrices])
+        visible = cull_boxes(VP, array, bounds[:, 0], bounds[:, 1], radii)
+    else:
+        visible = np.ones(len(meshes), dtype=bool)
+    num_drawn = int(np.count_nonzero(visible))
+    g_cull_counts[0] += len(meshes) - num_drawn
+    g_cull_counts[1] += num_drawn
+    return visible
+
+def cull_nodes(nodes, VP):
+    # nodes with a mesh inside the view frustum
+    nodes = [node for node in nodes if node.get_mesh() is not None]
+    matrices = [node.get_global_transform() * node.get_shape_transform() for node in nodes]
+    visible = cull_meshes([node.get_mesh() for node in nodes], matrices, VP)
+    return [node for node, is_visible in zip(nodes, visible) if is_visible]
+
+def select_lod(material, M, VP):
+    # level of detail of a material drawn with model matrix M (in obj coordinates), from the projected size of its bounding sphere
+    if not g_lod_enabled or material.get_lod_count() == 1:
+        return 0
+    center, radius = material.get_bounding_sphere()
+    clip_center = VP * M * glm.vec4(*center, 1)
+    scale = max(glm.length(glm.vec3(M[0])), glm.length(glm.vec3(M[1])), glm.length(glm.vec3(M[2])))
+    pixel_radius = radius * scale * g_lod_pixel_scale / max(clip_center.w, 1e-6)
+    return material.select_lod(pixel_radius)
+
+def draw_material(material, level=0, num_instances=None):
+    # indexed materials are drawn through their EBO, others as a plain triangle list; instanced if num_instances is given
+    first_index, count, base_vertex = material.get_lod(level)
+    if material.indexed:
+        index_type = GL_UNSIGNED_SHORT if material.indices.dtype == np.uint16 else GL_UNSIGNED_INT
+        offset = ctypes.c_void_p(first_index * material.indices.itemsize)
+        if num_instances is None:
+            glDrawElementsBaseVertex(GL_TRIANGLES, count, index_type, offset, base_vertex)
+        else:
+            glDrawElementsInstancedBaseVertex(GL_TRIANGLES, count, index_type, offset, num_instances, base_vertex)
+    else:
+        if num_instances is None:
+            glDrawArrays(GL_TRIANGLES, 0, count)
+        else:
+            glDrawArraysInstanced(GL_TRIANGLES, 0, count, num_instances)
+    g_lod_triangles[0] += material.get_triangle_count(level) * (num_instances or 1)
+    g_lod_triangles[1] += material.get_triangle_count() * (num_instances or 1)
 
-        T = glm.translate(glm.vec3(0., 0., 0.1*i))
-        MVP_x = MVP*T
-        glUniformMatrix4fv(MVP_loc, 1, GL_FALSE, glm.value_ptr(MVP_x))
-        glBindVertexArray(vao)
-        glDrawArrays(GL_LINES, 0, 2)
+def draw_instances(instance_buffer, first_instance, material, level, num_instances):
+    instance_buffer.bind(first_instance)
+    draw_material(material, level, num_instances)
 
-def draw_single_material(vao, VP, unif_locs):
+def draw_single_material(mesh, VP, program):
     # scale sample single meshes to smaller size
     M = glm.scale((0.5, 0.5, 0.5))
-    MVP = VP * M
+    if not cull_meshes([mesh], [M], VP)[0]:
+        return
+    level = select_lod(mesh.material, M, VP)
+    M = M * mesh.material.get_position_transform()
+    color = glm.vec3(1, 1, 1)
 
-    glBindVertexArray(vao)
-    # set uniform values
-    glUniformMatrix4fv(unif_locs['M'], 1, GL_FALSE, glm.value_ptr(M))
-    glUniformMatrix4fv(unif_locs['MVP'], 1, GL_FALSE, glm.value_ptr(MVP))
-    glUniform3f(unif_locs['material_color'], 1, 1, 1)
-    
-    glDrawArrays(GL_TRIANGLES, 0, g_single_material.get_vertex_count())
+    vao = g_asset_registry.use(mesh)
+    if vao is None:
+        # being uploaded (again, if it was evicted), drawn once it is done
+        return
 
-def draw_node(vao, node, vertex_count, VP, unif_locs):
+    # a uniform scale and a translation only (the dequantizing position transform is one too): the upper 3x3 of M is a valid normal matrix
+    g_render_queue.submit(program, vao, functools.partial(draw_material, mesh.material, level),
+                          {'M': M, 'N': get_normal_matrix(M, rigid=True), 'material_color': color}, tuple(color))
+
+def draw_node(node, VP, program):
+    mesh = node.get_mesh()
+    if mesh is None:
+        return
     # apply global transform to node's transform
     M = node.get_global_transform() * node.get_shape_transform()
-    MVP = VP * M
+    level = select_lod(mesh.material, M, VP)
+    M = M * mesh.material.get_position_transform()
     color = node.get_color()
 
-    glBindVertexArray(vao)
-    # set uniform values
-    glUniformMatrix4fv(unif_locs['M'], 1, GL_FALSE, glm.value_ptr(M))
-    glUniformMatrix4fv(unif_locs['MVP'], 1, GL_FALSE, glm.value_ptr(MVP))
-    glUniform3f(unif_locs['material_color'], color.r, color.g, color.b)
-    
-    glDrawArrays(GL_TRIANGLES, 0, vertex_count)
+    vao = g_asset_registry.use(mesh)
+    if vao is None:
+        # being uploaded (again, if it was evicted), drawn once it is done
+        return
+
+    # parent rotations and non-uniform shape scales build up in M, so the normal matrix is its inverse transpose
+    g_render_queue.submit(program, vao, functools.partial(draw_material, mesh.material, level),
+                          {'M': M, 'N': get_normal_matrix(M), 'material_color': color}, tuple(color))
+
+def draw_nodes_instanced(nodes, VP, program, instance_buffer):
+    # group nodes by mesh (and level of detail), every group is drawn with a single instanced call
+    groups = {}
+    for node in nodes:
+        mesh = node.get_mesh()
+        if mesh is None:
+            continue
+        M = node.get_global_transform() * node.get_shape_transform()
+        level = select_lod(mesh.material, M, VP)
+        groups.setdefault((mesh, level), []).append((M * mesh.material.get_position_transform(), node.get_color()))
+    if not groups:
+        return
+
+    # per-instance model matrix (column-major), color and normal matrix of every group, uploaded at once
+    instances = np.empty((sum(len(group) for group in groups.values()), 28), dtype=np.float32)
+    i = 0
+    for group in groups.values():
+        for M, color in group:
+            instances[i, :16] = np.frombuffer(M.to_bytes(), dtype=np.float32)
+            instances[i, 16:19] = color
+            i += 1
+    # normal matrices of all instances in one batch
+    instances[:, 19:] = get_normal_matrices(instances[:, :16].reshape(-1, 4, 4)).reshape(-1, 9)
+    instance_buffer.upload(instances)
+    g_profiler.count('bytes_uploaded', instances.nbytes)
+
+    first_instance = 0
+    for (mesh, level), group in groups.items():
+        vao = g_asset_registry.use(mesh)
+        # groups of meshes still being uploaded are skipped
+        if vao is not None:
+            g_render_queue.submit(program, vao, functools.partial(draw_instances, instance_buffer, first_instance, mesh.material, level, len(group)))
+        first_instance += len(group)
 
 # main function
 def main():
+    global g_lod_pixel_scale
     # initialize glfw
     if not glfwInit():
         return
@@ -175,111 +399,156 @@ def main():
     glfwWindowHint(GLFW_OPENGL_FORWARD_COMPAT, GL_TRUE) # for macOS
 
     # create a window and OpenGL context
-    window = glfwCreateWindow(1600, 1600, '2020057692', None, None)
+    window = glfwCreateWindow(1600, 1600, WINDOW_TITLE, None, None)
     if not window:
         glfwTerminate()
         return
     glfwMakeContextCurrent(window)
 
+    # redraw only when input, window events, loads or the animation change the picture
+    pacer = FramePacer(window, MAX_ANIMATION_FPS)
+
     # register event callbacks
-    glfwSetKeyCallback(window, key_callback)
-    glfwSetCursorPosCallback(window, cursor_callback)
-    glfwSetMouseButtonCallback(window, button_callback)
-    glfwSetScrollCallback(window, scroll_callback)
-    glfwSetDropCallback(window, drag_and_drop_callback)
+    glfwSetKeyCallback(window, pacer.wrap(key_callback))
+    glfwSetCursorPosCallback(window, pacer.wrap(cursor_callback))
+    glfwSetMouseButtonCallback(window, pacer.wrap(button_callback))
+    glfwSetScrollCallback(window, pacer.wrap(scroll_callback))
+    glfwSetDropCallback(window, pacer.wrap(drag_and_drop_callback))
 
     # load shaders
     shader_for_frame = load_shaders(g_vertex_shader_src, g_fragment_shader_src)
     shader_for_mat = load_shaders(g_vertex_shader_src_normal, g_fragment_shader_src_normal)
+    shader_for_instances = load_shaders(g_vertex_shader_src_instanced, g_fragment_shader_src_normal, defines={'INSTANCED': 1})
+    shader_for_overlay = load_shaders(g_vertex_shader_src_overlay, g_fragment_shader_src)
+    g_program_cache.report()
 
-    # get uniform locations
-    MVP_loc_frame = glGetUniformLocation(shader_for_frame, 'MVP')
-    unif_names = ['MVP', 'M', 'view_pos', 'material_color']
-    unif_locs_mat = {}
-    for name in unif_names:
-        unif_locs_mat[name] = glGetUniformLocation(shader_for_mat, name)
-
-    # load materials for hierarchical model
-    tray = Material(os.path.join(PROJECT_DIR, 'obj_files', 'Tray.obj'))
-    spinning_top1 = Material(os.path.join(PROJECT_DIR, 'obj_files', 'Top_jack.obj'))
-    spinning_top2 = Material(os.path.join(PROJECT_DIR, 'obj_files', 'Jack_in_the_Box.obj'))
-    sword = Material(os.path.join(PROJECT_DIR, 'obj_files', 'Sword.obj'))
+    # camera uniforms shared by every program
+    camera = CameraBuffer()
 
     # prepare vaos
     vao_center_frame = prepare_vao_frame(coordinate_axis=True)
-    vao_frame_grid = prepare_vao_frame(coordinate_axis=False)
-    vao_tray = prepare_vao_material(tray)
-    vao_spinning_top1 = prepare_vao_material(spinning_top1)
-    vao_spinning_top2 = prepare_vao_material(spinning_top2)
-    vao_sword = prepare_vao_material(sword)
-
-    # create a hierarchical model - Node(parent, shape_transform, color)
-    node_base = Node(None, glm.rotate(np.radians(270), (1, 0, 0)) * glm.scale((.3, .3, .3)), glm.vec3(0,0,0.5))
-    node_spinning_top1 = Node(node_base, glm.translate((-1.05,0.1,0.7)) * glm.rotate(np.radians(270), (1, 0, 0)) * glm.scale((.1, .1, .1)), glm.vec3(0.9294, 0.6745, 0.6941))
-    node_spinning_top2 = Node(node_base, glm.translate((0.3,0.08,-0.1)) * glm.scale((.25, .25, .25)), glm.vec3(0.2902, 0.6588, 0.8471))
+    vao_frame_grid, grid_vertex_count = prepare_vao_grid(1000, .1, 100.0)
+    instance_buffer = InstanceBuffer()
+
+    # meshes for hierarchical model, shared by every node drawing them
+    obj_dir = os.path.join(PROJECT_DIR, 'obj_files')
+    tray_path = os.path.join(obj_dir, 'Tray.obj')
+    spinning_top1_path = os.path.join(obj_dir, 'Top_jack.obj')
+    spinning_top2_path = os.path.join(obj_dir, 'Jack_in_the_Box.obj')
+    sword_path = os.path.join(obj_dir, 'Sword.obj')
+    if not os.path.exists(spinning_top2_path):
+        # Jack_in_the_Box.obj is not shipped with obj_files; reuse the first top's mesh
+        spinning_top2_path = spinning_top1_path
+
+    # create a hierarchical model - Node(parent, shape_transform, color, mesh)
+    node_base = Node(None, glm.rotate(np.radians(270), (1, 0, 0)) * glm.scale((.3, .3, .3)), glm.vec3(0,0,0.5), g_asset_registry.acquire(tray_path))
+    node_spinning_top1 = Node(node_base, glm.translate((-1.05,0.1,0.7)) * glm.rotate(np.radians(270), (1, 0, 0)) * glm.scale((.1, .1, .1)), glm.vec3(0.9294, 0.6745, 0.6941), g_asset_registry.acquire(spinning_top1_path))
+    node_spinning_top2 = Node(node_base, glm.translate((0.3,0.08,-0.1)) * glm.scale((.25, .25, .25)), glm.vec3(0.2902, 0.6588, 0.8471), g_asset_registry.acquire(spinning_top2_path))
     nodes_sword = []
     for i in range(3):
-        node_sword = Node(node_spinning_top1, glm.rotate(np.radians(90), (1, 0, 0)) * glm.scale((0.008, 0.008, 0.008)), glm.vec3(1, 0, 0))
+        node_sword = Node(node_spinning_top1, glm.rotate(np.radians(90), (1, 0, 0)) * glm.scale((0.008, 0.008, 0.008)), glm.vec3(1, 0, 0), g_asset_registry.acquire(sword_path))
         nodes_sword.append(node_sword)
     for i in range(3):
-        node_sword = Node(node_spinning_top2, glm.rotate(np.radians(90), (1, 0, 0)) * glm.scale((0.008, 0.008, 0.008)), glm.vec3(1, 0, 0))
+        node_sword = Node(node_spinning_top2, glm.rotate(np.radians(90), (1, 0, 0)) * glm.scale((0.008, 0.008, 0.008)), glm.vec3(1, 0, 0), g_asset_registry.acquire(sword_path))
         nodes_sword.append(node_sword)
+    nodes = [node_base, node_spinning_top1, node_spinning_top2] + nodes_sword
 
     # loop until the user closes the window
     while not glfwWindowShouldClose(window):
-        # enable depth test (we'll see details later)
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glEnable(GL_DEPTH_TEST)
-
-        # render in "wireframe mode"
-        if g_wireframe_mode:
-            glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
-        else:
-            glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
-
-        glUseProgram(shader_for_frame)
-
-        # projection & view matrix
-        P = get_projection_matrix()
-        view_pos, V = get_view_matrix()
-
-        M = glm.mat4()
-        draw_center_frame(vao_center_frame, P*V*M, MVP_loc_frame)
-        draw_frame_grid(vao_frame_grid, P*V*M, MVP_loc_frame)
-
-        glUseProgram(shader_for_mat)
-        glUniform3f(unif_locs_mat['view_pos'], view_pos.x, view_pos.y, view_pos.z)
-
-        if g_single_material:
-            draw_single_material(g_vao_single_material, P*V, unif_locs_mat)
-        elif g_hierarchical_mode:
-            t = glfwGetTime()
-
-            # set local transformations of each node
-            node_base.set_transform(glm.rotate(np.radians(np.sin(t) * 30), (1,0,0)))
-            node_spinning_top1.set_transform(glm.rotate(t * 1, (0,1,0)) * glm.translate((np.sin(t) * 0.4, 0, np.sin(t) * 0.4)) * glm.rotate(t * 1, (0,1,0)))
-            node_spinning_top2.set_transform(glm.rotate(t * 2, (0,1,0)) * glm.translate((np.cos(t) * 0.8, 0, np.cos(t) * 0.8)) * glm.rotate(t * 2, (0,1,0)))
-            for i in range(6):
-                sign1 = 1 if i % 2 == 0 else -1
-                sign2 = 1 if i % 3 == 0 else -1
-                nodes_sword[i].set_transform(glm.translate((sign1 * 0.15, 0.8 + sign1 * np.sin(t * 5) * 0.1, sign1 * sign2 * 0.15)))
-
-            # recursively update global transformations of all nodes
-            node_base.update_tree_global_transform()
+        pacer.on_demand = g_render_on_demand
+        animating = g_hierarchical_mode and not g_single_mesh
+        g_profiler.set_enabled(g_profiling_enabled)
+
+        # a frame is profiled from here, so that uploads are part of the frame they are drawn in; canceled if nothing is drawn
+        g_profiler.begin_frame()
+
+        # upload meshes parsed in the background, redrawing while uploads make progress
+        with g_profiler.phase('upload'):
+            uploaded = upload_dropped_materials()
+        if uploaded:
+            pacer.mark_dirty()
+
+        if pacer.should_draw(animating):
+
+            # evict meshes unused over the GPU memory budget
+            g_asset_registry.begin_frame()
+            update_window_title(window)
+
+            # enable depth test (we'll see details later)
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            glEnable(GL_DEPTH_TEST)
+
+            # render in "wireframe mode"
+            if g_wireframe_mode:
+                glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
+            else:
+                glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+
+            # projection & view matrix
+            P = get_projection_matrix()
+            view_pos, V = get_view_matrix()
+            camera.update(P, V, view_pos)
+            g_profiler.count('bytes_uploaded', camera.SIZE)
+            # projected size of one unit at clip w = 1, in framebuffer pixels
+            g_lod_pixel_scale = P[1][1] * glfwGetFramebufferSize(window)[1] / 2
+
+            M = glm.mat4()
+            draw_center_frame(shader_for_frame, vao_center_frame, M)
+            draw_frame_grid(shader_for_frame, vao_frame_grid, grid_vertex_count, M)
+
+            if g_single_mesh:
+                with g_profiler.phase('submit'):
+                    draw_single_material(g_single_mesh, P*V, shader_for_mat)
+            elif g_hierarchical_mode:
+                t = glfwGetTime()
+
+                # set local transformations of each node
+                with g_profiler.phase('transforms'):
+                    node_base.set_transform(glm.rotate(np.radians(np.sin(t) * 30), (1,0,0)))
+                    node_spinning_top1.set_transform(glm.rotate(t * 1, (0,1,0)) * glm.translate((np.sin(t) * 0.4, 0, np.sin(t) * 0.4)) * glm.rotate(t * 1, (0,1,0)))
+                    node_spinning_top2.set_transform(glm.rotate(t * 2, (0,1,0)) * glm.translate((np.cos(t) * 0.8, 0, np.cos(t) * 0.8)) * glm.rotate(t * 2, (0,1,0)))
+                    for i in range(6):
+                        sign1 = 1 if i % 2 == 0 else -1
+                        sign2 = 1 if i % 3 == 0 else -1
+                        nodes_sword[i].set_transform(glm.translate((sign1 * 0.15, 0.8 + sign1 * np.sin(t * 5) * 0.1, sign1 * sign2 * 0.15)))
+
+                    # recursively update global transformations of all nodes
+                    node_base.update_tree_global_transform()
             
-            draw_node(vao_tray, node_base, tray.get_vertex_count(), P*V, unif_locs_mat)
-            draw_node(vao_spinning_top1, node_spinning_top1, spinning_top1.get_vertex_count(), P*V, unif_locs_mat)
-            draw_node(vao_spinning_top2, node_spinning_top2, spinning_top2.get_vertex_count(), P*V, unif_locs_mat)
-            for i in range(6):
-                draw_node(vao_sword, nodes_sword[i], sword.get_vertex_count(), P*V, unif_locs_mat)
-
-        # swap front and back buffers
-        glfwSwapBuffers(window)
+                # skip nodes outside the view frustum
+                with g_profiler.phase('cull'):
+                    visible_nodes = cull_nodes(nodes, P*V)
+                with g_profiler.phase('submit'):
+                    if g_instancing_enabled:
+                        draw_nodes_instanced(visible_nodes, P*V, shader_for_instances, instance_buffer)
+                    else:
+                        for node in visible_nodes:
+                            draw_node(node, P*V, shader_for_mat)
+
+            # issue the frame's draws sorted by program, VAO and material
+            with g_profiler.phase('flush'):
+                g_render_queue.flush()
+            g_profiler.count('draw_calls', g_render_queue.num_draws)
+            g_profiler.count('uniform_uploads', g_render_queue.num_uniform_uploads)
+            g_profiler.count('bytes_uploaded', g_render_queue.uniform_bytes)
+            g_profiler.draw_overlay(shader_for_overlay)
+
+            # swap front and back buffers
+            with g_profiler.phase('swap'):
+                glfwSwapBuffers(window)
+            g_profiler.end_frame()
+
+            # meshes skipped while they are being uploaded are drawn in a later frame
+            if g_asset_registry.is_uploading():
+                pacer.mark_dirty()
+        else:
+            g_profiler.cancel_frame()
 
-        # poll events
-        glfwPollEvents()
+        # wait for events, or poll them while animating / uploading
+        pacer.wait_events(animating)
 
     # terminate glfw
+    g_asset_loader.shutdown()
     glfwTerminate()
 
 if __name__ == "__main__":
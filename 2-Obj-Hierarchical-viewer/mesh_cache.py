@@ -0,0 +1,121 @@
+import numpy as np
+import hashlib
+import os
+import struct
+
+from obj_loader import LOD_LEVEL_TYPE
+from vertex_format import VERTEX_LAYOUTS, get_vertex_dtype
+
+DEFAULT_CACHE_DIR = os.environ.get('OBJ_VIEWER_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'obj_viewer'))
+DEFAULT_MAX_BYTES = 512 << 20
+
+# file layout: fixed size header, level of detail table, vertex buffer packed in its vertex layout, optional uint16/uint32 index buffer.
+# both buffers are the exact contents of the GPU buffers, uploaded straight from the memory map
+_MAGIC = b'OBJCACHE'
+# magic, index itemsize, vertex buffer records, index count, faces with 3 / 4 / more vertices, level count,
+# vertex layout (index in VERTEX_LAYOUTS), bounding box lower and upper corners, bounding sphere radius
+_HEADER = struct.Struct('<8sIQQQQQII7d')
+_HEADER_SIZE = 128                     # keeps the vertex buffer aligned inside the memory map
+_INDEX_TYPES = {0: None, 2: np.uint16, 4: np.uint32}
+
+class MeshCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def get_entry_path(self, filename, version):
+        # <path hash>-<identity hash>.mesh, identity = (path, size, mtime, loader version)
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        identity = f'{path}|{stat.st_size}|{stat.st_mtime_ns}|{version}'
+        return os.path.join(self.cache_dir, f'{self._hash(path)}-{self._hash(identity)}.mesh')
+
+    def load(self, filename, version):
+        # memory-map a cached (vertex_buffer, indices, face_counts, levels, vertex_layout, bounds, radius), or None on a miss
+        try:
+            entry = self.get_entry_path(filename, version)
+            with open(entry, 'rb') as file:
+                header = _HEADER.unpack(file.read(_HEADER.size))
+                magic, index_size, vertex_records, index_count, face_counts, num_levels, layout_id = *header[:4], header[4:7], *header[7:9]
+                bounds, radius = np.reshape(header[9:15], (2, 3)), header[15]
+                file.seek(_HEADER_SIZE)
+                levels = np.frombuffer(file.read(num_levels * LOD_LEVEL_TYPE.itemsize), dtype=LOD_LEVEL_TYPE)
+        except (OSError, struct.error, ValueError):
+            return None
+        if magic != _MAGIC or index_size not in _INDEX_TYPES or layout_id >= len(VERTEX_LAYOUTS) or len(levels) != num_levels:
+            return None
+
+        vertex_layout = VERTEX_LAYOUTS[layout_id]
+        vertex_offset = _HEADER_SIZE + levels.nbytes
+        vertices = np.memmap(entry, dtype=get_vertex_dtype(vertex_layout), mode='r', offset=vertex_offset, shape=(vertex_records,))
+        indices = None
+        if _INDEX_TYPES[index_size] is not None:
+            indices = np.memmap(entry, dtype=_INDEX_TYPES[index_size], mode='r', offset=vertex_offset + vertices.nbytes, shape=(index_count,))
+        # mark as most recently used
+        os.utime(entry)
+        return vertices, indices, face_counts, levels, vertex_layout, bounds, radius
+
+    def store(self, filename, version, vertices, indices, face_counts, levels, vertex_layout, bounds, radius):
+        # vertices: vertex buffer already packed in vertex_layout
+        entry = self.get_entry_path(filename, version)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # older entries of the same file can never be hit again
+        self.invalidate(filename)
+
+        index_size = 0 if indices is None else indices.itemsize
+        index_count = 0 if indices is None else len(indices)
+        header = _HEADER.pack(_MAGIC, index_size, len(vertices), index_count, *face_counts, len(levels),
+                              VERTEX_LAYOUTS.index(vertex_layout), *np.ravel(bounds), radius)
+        # write to a temporary file first so readers never map a partial entry
+        tmp = f'{entry}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as file:
+            file.write(header.ljust(_HEADER_SIZE, b'\0'))
+            file.write(np.ascontiguousarray(levels, dtype=LOD_LEVEL_TYPE).tobytes())
+            file.write(np.ascontiguousarray(vertices).tobytes())
+            if indices is not None:
+                file.write(np.ascontiguousarray(indices).tobytes())
+        os.replace(tmp, entry)
+        self.evict()
+
+    def evict(self):
+        # remove least recently used entries until the cache fits in max_bytes
+        entries = self._list_entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def invalidate(self, filename=None):
+        # drop every entry of filename, or the whole cache if filename is None
+        prefix = None if filename is None else self._hash(os.path.abspath(filename)) + '-'
+        for path, _, _ in self._list_entries():
+            if prefix is None or os.path.basename(path).startswith(prefix):
+                self._remove(path)
+
+    def _list_entries(self):
+        # (path, size, last use) of every cache entry
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if name.endswith('.mesh'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _hash(self, text):
+        return hashlib.sha1(text.encode()).hexdigest()[:16]
@@ -1,68 +1,627 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
 import numpy as np
-import glm
 import os
+import shutil
+import tempfile
+import time
+import weakref
+from vertex_format import (NORMAL_TOLERANCE_DEGREES, POSITION_TOLERANCE, get_position_transform, get_vertex_stride, measure_packing_error,
+                           pack_vertices, unpack_vertices)
+
+# bump whenever the parsed buffer layout changes, so stale mesh cache entries are never hit
+OBJ_LOADER_VERSION = 5
+# bytes of obj text parsed at once by StreamingMaterial
+STREAM_CHUNK_BYTES = 16 << 20
+
+# level of detail chain of indexed materials
+LOD_MAX_LEVELS = 4              # simplified levels generated below the full resolution mesh
+LOD_FIRST_CELL = 1 / 128        # clustering cell size of the first simplified level, relative to the bbox diagonal; doubles per level
+LOD_MIN_REDUCTION = 0.75        # a level is kept only with at most this fraction of the previous level's triangles
+LOD_TOLERANCE_PIXELS = 1.       # default screen-space error a material may show before a finer level is drawn
+# one row per level: index range in the index buffer (or vertex count of unindexed materials), first vertex, geometric error
+LOD_LEVEL_TYPE = np.dtype([('first_index', '<i8'), ('index_count', '<i8'), ('base_vertex', '<i8'), ('vertex_count', '<i8'), ('error', '<f8')])
+
+# byte values used by the bulk tokenizer
+_NEWLINE = ord('\n')
+_CR = ord('\r')
+_SPACE = ord(' ')
+_TAB = ord('\t')
+_SLASH = ord('/')
+
+def _is_blank(values):
+    return (values == _SPACE) | (values == _TAB)
+
+def _split_lines(buf):
+    # byte offset of the first character and of the terminating '\n' of every line
+    # (buf always ends with '\n' followed by two padding bytes)
+    ends = np.flatnonzero(buf[:-2] == _NEWLINE)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    return starts, ends
+
+def _gather_records(buf, starts, ends, selected, keyword_len):
+    # concatenate the selected lines without their keyword, keeping '\n' as record separator
+    mask = np.repeat(selected, ends - starts + 1)
+    for i in range(keyword_len):
+        mask[starts[selected] + i] = False
+    return buf[:-2][mask]
+
+def _find_tokens(text):
+    # start offset of every whitespace separated token, and the number of tokens in every record of text
+    blank = _is_blank(text) | (text == _CR) | (text == _NEWLINE)
+    token_start = ~blank
+    token_start[1:] &= blank[:-1]
+    token_starts = np.flatnonzero(token_start)
+    record_ends = np.flatnonzero(text == _NEWLINE)
+    record_of_token = np.searchsorted(record_ends, token_starts)
+    return token_starts, np.bincount(record_of_token, minlength=len(record_ends))
+
+def _parse_vectors(text):
+    # first three components of every record, e.g. 'v x y z [w]'
+    num_records = np.count_nonzero(text == _NEWLINE)
+    values = np.fromstring(text.tobytes(), dtype=np.float64, sep=' ')
+    if len(values) == 3 * num_records:
+        vectors = values.reshape(-1, 3)
+    else:
+        _, counts = _find_tokens(text)
+        offsets = np.cumsum(counts) - counts
+        vectors = values[offsets[:, None] + np.arange(3)]
+    # parse as double and round once, exactly like float() followed by float32 conversion
+    return vectors.astype(np.float32)
+
+def _parse_faces(text):
+    # number of corners of every face, and the raw (vertex_pos_idx, texture_coor_idx, vertex_normal_idx) of every corner.
+    # corners may be written as v, v/vt, v//vn or v/vt/vn; a missing index is stored as 0
+    raw = text.tobytes().replace(b'//', b'/0/')
+    text = np.frombuffer(raw, dtype=np.uint8)
+    token_starts, face_sizes = _find_tokens(text)
+    slashes = np.flatnonzero(text == _SLASH)
+    values = np.fromstring(raw.replace(b'/', b' '), dtype=np.int64, sep=' ')
+
+    if len(slashes) == 2 * len(token_starts) and len(values) == 3 * len(token_starts):
+        return face_sizes, values.reshape(-1, 3)
+    # scatter the 1, 2 or 3 fields of every corner into its row
+    num_fields = np.bincount(np.searchsorted(token_starts, slashes, side='right') - 1, minlength=len(token_starts)) + 1
+    if num_fields.max(initial=1) > 3 or num_fields.sum() != len(values):
+        raise ValueError("malformed face corner, expected v, v/vt, v//vn or v/vt/vn")
+    corners = np.zeros((len(token_starts), 3), dtype=np.int64)
+    corner = np.repeat(np.arange(len(token_starts)), num_fields)
+    field = np.arange(len(values)) - np.repeat(np.cumsum(num_fields) - num_fields, num_fields)
+    corners[corner, field] = values
+    return face_sizes, corners
+
+def _parse_obj_records(data):
+    # tokenize 'v', 'vt', 'vn' and 'f' records of obj file contents at once.
+    # besides the records, returns for every face the number of v / vt / vn records in data before it,
+    # and the total number of v / vt / vn records, which resolve relative (negative) indices
+    buf = np.frombuffer(data + b'\n\0\0', dtype=np.uint8)
+    starts, ends = _split_lines(buf)
+
+    first, second, third = buf[starts], buf[starts + 1], buf[starts + 2]
+    is_v = (first == ord('v')) & _is_blank(second)
+    is_vt = (first == ord('v')) & (second == ord('t')) & _is_blank(third)
+    is_vn = (first == ord('v')) & (second == ord('n')) & _is_blank(third)
+    is_f = (first == ord('f')) & _is_blank(second)
+
+    positions = _parse_vectors(_gather_records(buf, starts, ends, is_v, 2))
+    normals = _parse_vectors(_gather_records(buf, starts, ends, is_vn, 3))
+    face_sizes, corners = _parse_faces(_gather_records(buf, starts, ends, is_f, 2))
+
+    kinds = np.stack((is_v, is_vt, is_vn), axis=1)
+    records_before = np.cumsum(kinds, axis=0) - kinds
+    return positions, normals, face_sizes, corners, records_before[is_f], kinds.sum(axis=0)
+
+def resolve_corners(corners, face_sizes, face_bases):
+    # 1-based and relative (negative) obj indices -> 0-based indices, -1 where the corner has no such index
+    bases = np.repeat(face_bases, face_sizes, axis=0)
+    return np.where(corners > 0, corners - 1, np.where(corners < 0, bases + corners, -1))
+
+def parse_obj(data):
+    # positions, normals, number of corners of every face, and 0-based (v, vt, vn) indices of every corner
+    positions, normals, face_sizes, corners, face_bases, _ = _parse_obj_records(data)
+    return positions, normals, face_sizes, resolve_corners(corners, face_sizes, face_bases)
+
+def split_byte_ranges(filename, num_ranges):
+    # (start, end) byte ranges of about equal size, each starting at the beginning of a line
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, 'rb') as file:
+        for i in range(1, num_ranges):
+            file.seek(max(size * i // num_ranges - 1, bounds[-1]))
+            file.readline()
+            bounds.append(max(file.tell(), bounds[-1]))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def _parse_obj_range(filename, start, end):
+    # worker process: parse one byte range, hand the records back through shared memory blocks
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    blocks = []
+    for records in _parse_obj_records(data):
+        shm = shared_memory.SharedMemory(create=True, size=max(records.nbytes, 1))
+        np.ndarray(records.shape, dtype=records.dtype, buffer=shm.buf)[...] = records
+        blocks.append((shm.name, records.shape, records.dtype.str))
+        shm.close()
+    return blocks
+
+def _take_shared(block):
+    # copy a shared memory block written by a worker, then release it
+    name, shape, dtype = block
+    shm = shared_memory.SharedMemory(name=name)
+    records = np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+    shm.close()
+    shm.unlink()
+    return records
+
+def parse_obj_parallel(filename, num_workers):
+    # parse line-aligned byte ranges of the file in a process pool; same output as parse_obj on the whole file
+    ranges = split_byte_ranges(filename, num_workers)
+    if not ranges:
+        return parse_obj(b'')
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=get_context('spawn')) as executor:
+        results = [[_take_shared(block) for block in blocks] for blocks in executor.map(_parse_obj_range, [filename] * len(ranges), *zip(*ranges))]
+    positions, normals, face_sizes, corners, face_bases, record_counts = (list(records) for records in zip(*results))
+
+    # stitch: relative indices of a range are offset by the v / vt / vn records of all ranges before it
+    range_offsets = np.cumsum(record_counts, axis=0) - record_counts
+    for i in range(len(ranges)):
+        face_bases[i] = face_bases[i] + range_offsets[i]
+    face_sizes = np.concatenate(face_sizes)
+    corners = resolve_corners(np.concatenate(corners), face_sizes, np.concatenate(face_bases))
+    return np.concatenate(positions), np.concatenate(normals), face_sizes, corners
+
+def triangulate_faces(face_sizes):
+    # corner indices of the fan triangulation (0, i, i+1) of every face
+    num_tris = np.maximum(face_sizes - 2, 0)
+    first_corner = np.cumsum(face_sizes) - face_sizes
+    face = np.repeat(np.arange(len(face_sizes)), num_tris)
+    i = np.arange(len(face)) - np.repeat(np.cumsum(num_tris) - num_tris, num_tris) + 1
+
+    triangles = np.empty((len(face), 3), dtype=np.int64)
+    triangles[:, 0] = first_corner[face]
+    triangles[:, 1] = first_corner[face] + i
+    triangles[:, 2] = triangles[:, 1] + 1
+    return triangles.ravel()
+
+def interleave_vertices(positions, normals, pos_ids, normal_ids):
+    # (position, normal) of every vertex, as rows of the VBO layout
+    vertices = np.empty((len(pos_ids), 2, 3), dtype=np.float32)
+    vertices[:, 0] = positions[pos_ids]
+    vertices[:, 1] = normals[normal_ids]
+    return vertices.reshape(-1, 3)
+
+def _normalize(vectors):
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, lengths, out=np.zeros_like(vectors), where=lengths > 0)
+
+def generate_normals(positions, pos_ids, mode='smooth'):
+    # normals for the triangle corners pos_ids (3 per triangle), returns (normals, normal_ids).
+    # 'flat': one normal per triangle, 'smooth': angle-weighted average of the triangles around every position
+    triangles = positions[pos_ids.reshape(-1, 3)].astype(np.float64)
+    face_normals = _normalize(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]))
+    if mode == 'flat':
+        return face_normals.astype(np.float32), np.repeat(np.arange(len(triangles)), 3)
+
+    # interior angle of every corner, between the edges towards the next and the previous corner
+    to_next = triangles[:, [1, 2, 0]] - triangles
+    to_prev = triangles[:, [2, 0, 1]] - triangles
+    angles = np.arctan2(np.linalg.norm(np.cross(to_next, to_prev), axis=-1), np.sum(to_next * to_prev, axis=-1))
+    # scatter-add the weighted face normals of every corner to its position
+    weighted = (face_normals[:, None, :] * angles[..., None]).reshape(-1, 3)
+    normals = np.stack([np.bincount(pos_ids, weights=weighted[:, k], minlength=len(positions)) for k in range(3)], axis=1)
+    return _normalize(normals).astype(np.float32), pos_ids
+
+def fill_missing_normals(positions, normals, pos_ids, normal_ids, mode='smooth'):
+    # (normals, normal_ids) where corners without a vertex normal (normal_ids < 0) reference generated normals appended
+    # after the authored ones, which every other corner keeps
+    missing = normal_ids < 0
+    generated, generated_ids = generate_normals(positions, pos_ids, mode)
+    normal_ids = np.where(missing, generated_ids + len(normals), normal_ids)
+    return np.concatenate([normals, generated]), normal_ids
+
+def count_face_kinds(face_sizes):
+    # number of faces with 3, 4 and more than 4 vertices
+    num_face_tri = int(np.count_nonzero(face_sizes == 3))
+    num_face_quad = int(np.count_nonzero(face_sizes == 4))
+    return num_face_tri, num_face_quad, len(face_sizes) - num_face_tri - num_face_quad
+
+def iter_obj_chunks(filename, chunk_bytes=STREAM_CHUNK_BYTES):
+    # file contents in pieces of about chunk_bytes, each ending on a line boundary
+    with open(filename, 'rb') as file:
+        rest = b''
+        while True:
+            block = file.read(chunk_bytes)
+            if not block:
+                if rest:
+                    yield rest
+                return
+            block = rest + block
+            cut = block.rfind(b'\n') + 1
+            if cut:
+                yield block[:cut]
+            rest = block[cut:]
+
+def deduplicate_corners(pos_ids, normal_ids, num_normals):
+    # unique (vertex_pos_idx, vertex_normal_idx) pairs and the index buffer referencing them
+    keys = pos_ids * max(num_normals, 1) + normal_ids
+    _, first_use, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    # number unique vertices in order of first use, which keeps the post-transform cache warm
+    order = np.argsort(first_use)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    index_type = np.uint16 if len(order) <= 0xFFFF else np.uint32
+    return first_use[order], rank[inverse.ravel()].astype(index_type)
+
+def cluster_vertices(vertices, indices, lower, cell_size):
+    # vertex clustering decimation: vertices in one grid cell collapse to their mean position, triangles with
+    # two corners in one cell vanish. vertices of a cell are also split by the dominant axis of their normal,
+    # so hard edges stay hard. returns the interleaved vertices and indices of the simplified mesh
+    positions, normals = vertices[0::2].astype(np.float64), vertices[1::2].astype(np.float64)
+    cells = np.floor((positions - lower) / cell_size).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    cell_keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    _, cell_ids = np.unique(cell_keys, return_inverse=True)
+    cell_ids = cell_ids.ravel()
+    num_cells = cell_ids.max() + 1
+    cell_positions = np.stack([np.bincount(cell_ids, positions[:, k], num_cells) for k in range(3)], axis=1)
+    cell_positions /= np.bincount(cell_ids, minlength=num_cells)[:, None]
+
+    axis = np.argmax(np.abs(normals), axis=1)
+    negative = normals[np.arange(len(normals)), axis] < 0
+    cluster_keys = cell_ids * 6 + axis * 2 + negative
+    cluster_keys, cluster_ids = np.unique(cluster_keys, return_inverse=True)
+    cluster_ids = cluster_ids.ravel()
+    cluster_normals = np.stack([np.bincount(cluster_ids, normals[:, k], len(cluster_keys)) for k in range(3)], axis=1)
+
+    triangles = cluster_ids[indices].reshape(-1, 3)
+    triangle_cells = cell_ids[indices].reshape(-1, 3)
+    keep = (triangle_cells[:, 0] != triangle_cells[:, 1]) & (triangle_cells[:, 1] != triangle_cells[:, 2]) & (triangle_cells[:, 2] != triangle_cells[:, 0])
+    triangles = triangles[keep]
+    if len(triangles):
+        # triangles collapsing onto the same clusters are drawn once
+        _, first = np.unique(np.sort(triangles, axis=1), axis=0, return_index=True)
+        triangles = triangles[np.sort(first)]
+
+    # keep used clusters only, numbered in order of first use
+    used, first_use, inverse = np.unique(triangles.ravel(), return_index=True, return_inverse=True)
+    order = np.argsort(first_use)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    used = used[order]
+    simplified = np.empty((len(used), 2, 3), dtype=np.float32)
+    simplified[:, 0] = cell_positions[cluster_keys[used] // 6]
+    simplified[:, 1] = _normalize(cluster_normals[used])
+    index_type = np.uint16 if len(used) <= 0xFFFF else np.uint32
+    return simplified.reshape(-1, 3), rank[inverse.ravel()].astype(index_type)
+
+def measure_bounds(vertices):
+    # (lower, upper) corners of the axis-aligned bounding box of interleaved (position, normal) rows,
+    # and the radius of the bounding sphere around the box center, at most half the box diagonal
+    positions = vertices[0::2]
+    if len(positions) == 0:
+        return np.zeros((2, 3)), 0.
+    bounds = np.stack([positions.min(axis=0), positions.max(axis=0)]).astype(np.float64)
+    center = (bounds[0] + bounds[1]) / 2
+    return bounds, float(np.sqrt(np.max(np.sum((positions - center) ** 2, axis=1))))
+
+def get_single_level(count, vertex_count):
+    # level table of a material without simplified levels
+    return np.array([(0, count, 0, vertex_count, 0.)], dtype=LOD_LEVEL_TYPE)
+
+def build_lod_chain(vertices, indices):
+    # full resolution mesh followed by up to LOD_MAX_LEVELS clustered ones, concatenated into a single
+    # vertex and index buffer. levels index their own vertices, drawn with a base vertex
+    positions = vertices[0::2]
+    if len(indices) == 0:
+        return vertices, indices, get_single_level(0, len(positions))
+    lower, upper = positions.min(axis=0).astype(np.float64), positions.max(axis=0).astype(np.float64)
+    diagonal = np.linalg.norm(upper - lower)
+
+    levels = [(vertices, indices, 0.)]
+    cell_size = diagonal * LOD_FIRST_CELL
+    for _ in range(LOD_MAX_LEVELS):
+        if diagonal == 0:
+            break
+        level_vertices, level_indices = cluster_vertices(vertices, indices, lower, cell_size)
+        # error bound: a vertex moves at most a cell diagonal
+        error = cell_size * np.sqrt(3)
+        cell_size *= 2
+        if len(level_indices) == 0:
+            break
+        if len(level_indices) <= LOD_MIN_REDUCTION * len(levels[-1][1]):
+            levels.append((level_vertices, level_indices, error))
+
+    table = np.zeros(len(levels), dtype=LOD_LEVEL_TYPE)
+    first_index, base_vertex = 0, 0
+    for level, (level_vertices, level_indices, error) in zip(table, levels):
+        level['first_index'], level['index_count'] = first_index, len(level_indices)
+        level['base_vertex'], level['vertex_count'], level['error'] = base_vertex, len(level_vertices) // 2, error
+        first_index += len(level_indices)
+        base_vertex += len(level_vertices) // 2
+    chain_vertices = np.concatenate([level[0] for level in levels])
+    chain_indices = np.concatenate([level[1].astype(indices.dtype) for level in levels])
+    return chain_vertices, chain_indices, table
 
 class Material:
-    def __init__(self, filename):
+    def __init__(self, filename, indexed=True, cache=None, num_workers=1, normal_mode='smooth', vertex_layout='float32', lod_tolerance=LOD_TOLERANCE_PIXELS):
         # print out obj file name
         print(f'obj file name: {os.path.basename(filename)}')
-        # get vertex, face information from obj file
-        self.vertices = self.load_obj(filename)
-        self.vertex_count = len(self.vertices)
-        
-    def load_obj(self, filename):
-        vertices = []
+        self.indexed = indexed
+        self.num_workers = num_workers
+        self.normal_mode = normal_mode      # normals generated for meshes without vn: 'smooth' or 'flat'
+        self.lod_tolerance = lod_tolerance  # screen-space error in pixels accepted when picking a level of detail
+        self.requested_vertex_layout = vertex_layout    # the layout used (vertex_layout) falls back to float32 if it is too lossy
+        # get the packed vertex buffer, face information and bounds from the mesh cache, or from obj file on a miss
+        start_time = time.perf_counter()
+        cached = cache.load(filename, self.get_cache_version()) if cache else None
+        if cached:
+            # (position, normal) rows are only decoded on request, the vertex buffer is uploaded from the memory map
+            self.vertices = None
+            self.vertex_buffer, self.indices, self.face_counts, self.levels, self.vertex_layout, self.bounds, self.radius = cached
+            print(f'loaded from mesh cache in {time.perf_counter() - start_time:.3f} s ({self.vertex_layout} vertex layout)')
+        else:
+            self.vertices, self.indices, self.face_counts, self.levels = self.load_obj(filename)
+            self.bounds, self.radius = measure_bounds(self.vertices)
+            self.vertex_layout = self.choose_vertex_layout(vertex_layout)
+            self.vertex_buffer = pack_vertices(self.vertices, self.vertex_layout, self.bounds)
+            if cache and self.vertices is not None:
+                cache.store(filename, self.get_cache_version(), self.vertex_buffer, self.indices, self.face_counts, self.levels,
+                            self.vertex_layout, self.bounds, self.radius)
+        self.vertex_count = int(self.levels['vertex_count'].sum())
+        self.print_face_info()
 
-        positions = []
-        normals = []
+    def get_cache_version(self):
+        # everything the cached buffers depend on
+        return (f'{OBJ_LOADER_VERSION}-{"indexed" if self.indexed else "unrolled"}-{self.normal_mode}-{self.requested_vertex_layout}-'
+                f'lod{LOD_MAX_LEVELS}-{LOD_FIRST_CELL:g}-{LOD_MIN_REDUCTION:g}')
 
-        num_face_tri = 0
-        num_face_quad = 0
-        num_face_n = 0
+    def load_obj(self, filename):
         # open and parse obj file contents
         try:
-            with open(filename) as file:
-                for line in file:
-                    # process vertex positions
-                    if line.startswith("v "):
-                        v = line.split()[1:]
-                        positions.append(list(map(float, v)))
-                    # process vertex normals
-                    elif line.startswith("vn "):
-                        vn = line.split()[1:]
-                        normals.append(list(map(float, vn)))
-                    # process face informations (vertex_pos_idx, texture_coor_idx, vertex_normal_idx)
-                    elif line.startswith("f "):
-                        f = line.split()[1:]
-                        num_vertex = len(f)
-                        for idx in range(1, num_vertex - 1):
-                            for i in [0, idx, idx+1]:
-                                face = f[i].split('/')
-                                # face[0]: vertex_pos_idx
-                                vertices.append(positions[int(face[0]) - 1])
-                                # face[2]: vertex_normal_idx
-                                vertices.append(normals[int(face[2]) - 1])
-                        # count polygons        
-                        if num_vertex == 3:
-                            num_face_tri += 1
-                        elif num_vertex == 4:
-                            num_face_quad += 1
-                        else:
-                            num_face_n += 1
-                    
+            start_time = time.perf_counter()
+            num_bytes = os.path.getsize(filename)
+            if self.num_workers > 1:
+                positions, normals, face_sizes, corners = parse_obj_parallel(filename, self.num_workers)
+            else:
+                with open(filename, 'rb') as file:
+                    data = file.read()
+                positions, normals, face_sizes, corners = parse_obj(data)
+
+            # corners[:, 0]: vertex_pos_idx, corners[:, 2]: vertex_normal_idx
+            corner_ids = triangulate_faces(face_sizes)
+            pos_ids = corners[corner_ids, 0]
+            normal_ids = corners[corner_ids, 2]
+            if len(normal_ids) and normal_ids.min() < 0:
+                # some corners have no vertex normal
+                normal_start_time = time.perf_counter()
+                normals, normal_ids = fill_missing_normals(positions, normals, pos_ids, normal_ids, self.normal_mode)
+                print(f'generated {self.normal_mode} normals in {time.perf_counter() - normal_start_time:.3f} s')
+            if self.indexed:
+                # keep every (position, normal) pair once and draw it through an index buffer
+                unique_ids, indices = deduplicate_corners(pos_ids, normal_ids, len(normals))
+                pos_ids, normal_ids = pos_ids[unique_ids], normal_ids[unique_ids]
+            else:
+                indices = None
+            vertices = interleave_vertices(positions, normals, pos_ids, normal_ids)
+            elapsed = time.perf_counter() - start_time
+
         except IOError:
-            print(f"Error: Could not open file {file}")
-            return None, None, None
+            print(f"Error: Could not open file {filename}")
+            return None, None, None, None
+        print(f'parse time: {elapsed:.3f} s ({num_bytes / (1 << 20) / max(elapsed, 1e-9):.1f} MB/s, {self.num_workers} worker(s))')
+
+        if self.indexed:
+            # simplified levels for meshes drawn small on screen
+            lod_start_time = time.perf_counter()
+            vertices, indices, levels = build_lod_chain(vertices, indices)
+            print(f'built {len(levels) - 1} simplified level(s) in {time.perf_counter() - lod_start_time:.3f} s')
+        else:
+            levels = get_single_level(len(vertices) // 2, len(vertices) // 2)
+        return vertices, indices, count_face_kinds(face_sizes), levels
+
+    def print_face_info(self):
+        if self.face_counts is None:
+            return
+        num_face_tri, num_face_quad, num_face_n = self.face_counts
         # print out face informations
         print(f'total number of faces: {num_face_tri + num_face_quad + num_face_n}')
         print(f'number of faces with 3 vertices: {num_face_tri}')
         print(f'number of faces with 4 vertices: {num_face_quad}')
         print(f'number of faces with more than 4 vertices: {num_face_n}')
+        if self.indexed:
+            num_vertices, num_corners = int(self.levels[0]['vertex_count']), int(self.levels[0]['index_count'])
+            print(f'number of unique vertices: {num_vertices} / {num_corners} triangle corners (dedup ratio {num_corners / max(num_vertices, 1):.2f}x)')
+        if len(self.levels) > 1:
+            print(f'lod triangles: {" / ".join(str(self.get_triangle_count(level)) for level in range(len(self.levels)))}')
         print('----------------------------------------------------------')
-        return vertices
-    
+
+    def get_bounds(self):
+        # (lower, upper) corners of the axis-aligned bounding box
+        return self.bounds
+
+    def choose_vertex_layout(self, layout):
+        # keep a compact layout only if its precision loss is within tolerance
+        if layout == 'float32':
+            return layout
+        position_error, normal_error = measure_packing_error(self.vertices, layout, self.bounds)
+        ratio = get_vertex_stride('float32') / get_vertex_stride(layout)
+        print(f'{layout} vertex layout: {ratio:.1f}x smaller, max position error {position_error:.2e} of bbox diagonal, max normal error {normal_error:.3f} deg')
+        if position_error > POSITION_TOLERANCE or normal_error > NORMAL_TOLERANCE_DEGREES:
+            print(f'{layout} vertex layout exceeds tolerance, falling back to float32')
+            return 'float32'
+        return layout
+
+    def get_vertex_layout(self):
+        return self.vertex_layout
+
+    def get_vertex_stride(self):
+        return get_vertex_stride(self.vertex_layout)
+
+    def get_position_transform(self):
+        # multiplied into the model matrix, maps stored positions back to obj coordinates
+        return get_position_transform(self.vertex_layout, self.bounds)
+
+    def pack_vertices(self, batch):
+        # float32 (position, normal) rows -> contents of the vertex buffer
+        return pack_vertices(batch, self.vertex_layout, self.bounds)
+
+    def get_bounding_sphere(self):
+        # (center, radius) in obj coordinates
+        lower, upper = self.bounds
+        return (lower + upper) / 2, self.radius
+
+    def get_lod_count(self):
+        return len(self.levels)
+
+    def get_lod(self, level):
+        # (first index, index count, base vertex) to draw level with, index count is the vertex count of unindexed materials
+        first_index, index_count, base_vertex, _, _ = self.levels[level].tolist()
+        return first_index, index_count, base_vertex
+
+    def get_triangle_count(self, level=0):
+        return int(self.levels[level]['index_count']) // 3
+
+    def set_lod_tolerance(self, tolerance):
+        self.lod_tolerance = tolerance
+
+    def select_lod(self, pixel_radius):
+        # coarsest level whose geometric error stays within lod_tolerance pixels,
+        # for a bounding sphere projecting to pixel_radius pixels
+        if len(self.levels) == 1:
+            return 0
+        _, radius = self.get_bounding_sphere()
+        pixel_errors = self.levels['error'] * (pixel_radius / max(radius, 1e-12))
+        return int(np.count_nonzero(pixel_errors <= self.lod_tolerance)) - 1
+
+    def iter_vertex_batches(self):
+        yield self.get_vertex_pos_and_normal()
+
+    def iter_vertex_buffer_batches(self):
+        # contents of the vertex buffer, in batches packed in the material's vertex layout
+        yield self.vertex_buffer
+
+    def get_vertex_buffer(self):
+        # numpy array in the vertex layout (possibly memory-mapped from the mesh cache), uploaded without a copy
+        return self.vertex_buffer
+
     def get_vertex_pos_and_normal(self):
-        return glm.array(np.array(self.vertices, dtype=np.float32))
-    
+        # float32 (position, normal) rows; decoded from the vertex buffer after a mesh cache hit, as the vertex shader sees them
+        if self.vertices is None:
+            return unpack_vertices(self.vertex_buffer, self.vertex_layout, self.bounds)
+        return self.vertices
+
+    def get_indices(self):
+        return self.indices
+
     def get_vertex_count(self):
-        return self.vertex_count // 2
\ No newline at end of file
+        return self.vertex_count
+
+    def get_index_count(self):
+        return len(self.indices)
+
+class StreamingMaterial(Material):
+    def __init__(self, filename, chunk_bytes=STREAM_CHUNK_BYTES):
+        # unrolled (non-indexed) material whose vertex buffer is never held in memory as a whole:
+        # parsed records are spilled to disk chunk by chunk, and triangles are assembled in batches on upload
+        print(f'obj file name: {os.path.basename(filename)}')
+        self.indexed = False
+        self.vertices, self.indices = None, None
+        # batches are assembled on upload, so there is no whole-mesh error check to quantize against
+        self.vertex_layout = 'float32'
+        self.chunk_bytes = chunk_bytes
+        self.spill_dir = tempfile.mkdtemp(prefix='obj_stream_')
+        weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+
+        self.face_counts, num_corners, self.bounds = self.spill_obj(filename)
+        self.radius = np.linalg.norm(self.bounds[1] - self.bounds[0]) / 2     # vertices are not kept to tighten it
+        self.vertex_count = num_corners
+        self.levels = get_single_level(num_corners, num_corners)
+        self.print_face_info()
+
+    def spill_obj(self, filename):
+        # parse obj file contents chunk by chunk, appending v, vn and f records to spill files
+        try:
+            start_time = time.perf_counter()
+            num_bytes = 0
+            face_counts = np.zeros(3, dtype=np.int64)
+            num_corners = 0
+            num_records = np.zeros(3, dtype=np.int64)    # v / vt / vn records of all previous chunks
+            bounds = np.array([np.full(3, np.inf), np.full(3, -np.inf)])    # of every v record, referenced or not
+            with open(self._spill_path('positions'), 'wb') as positions_file, \
+                 open(self._spill_path('normals'), 'wb') as normals_file, \
+                 open(self._spill_path('face_sizes'), 'wb') as face_sizes_file, \
+                 open(self._spill_path('corners'), 'wb') as corners_file:
+                for chunk in iter_obj_chunks(filename, self.chunk_bytes):
+                    positions, normals, face_sizes, corners, face_bases, record_counts = _parse_obj_records(chunk)
+                    corners = resolve_corners(corners, face_sizes, face_bases + num_records)
+                    num_records += record_counts
+                    positions_file.write(positions.tobytes())
+                    if len(positions):
+                        bounds = np.array([np.minimum(bounds[0], positions.min(axis=0)), np.maximum(bounds[1], positions.max(axis=0))])
+                    normals_file.write(normals.tobytes())
+                    face_sizes_file.write(face_sizes.astype(np.int32).tobytes())
+                    corners_file.write(corners.astype(np.int32).tobytes())
+
+                    num_bytes += len(chunk)
+                    face_counts += count_face_kinds(face_sizes)
+                    num_corners += 3 * int(np.maximum(face_sizes - 2, 0).sum())
+            elapsed = time.perf_counter() - start_time
+
+        except IOError:
+            print(f"Error: Could not open file {filename}")
+            return None, 0, np.zeros((2, 3))
+        print(f'parse time: {elapsed:.3f} s ({num_bytes / (1 << 20) / max(elapsed, 1e-9):.1f} MB/s, streamed in {self.chunk_bytes / (1 << 20):g} MB chunks)')
+        if not np.all(np.isfinite(bounds)):
+            bounds = np.zeros((2, 3))
+        return tuple(int(count) for count in face_counts), num_corners, bounds
+
+    def iter_vertex_batches(self):
+        # interleaved (position, normal) triangles of a bounded number of faces at a time;
+        # faces reference the spilled vertex arrays through memory maps, so only touched pages are resident.
+        # corners lacking a normal get flat normals, smooth ones would need the whole mesh
+        positions = self._map_spill('positions', np.float32, (-1, 3))
+        normals = self._map_spill('normals', np.float32, (-1, 3))
+        face_sizes = self._map_spill('face_sizes', np.int32, (-1,))
+        corners = self._map_spill('corners', np.int32, (-1, 3))
+
+        # a quad unrolls to 6 vertices of 24 bytes each
+        faces_per_batch = max(self.chunk_bytes // 144, 1)
+        first_corner = 0
+        for first_face in range(0, len(face_sizes), faces_per_batch):
+            sizes = face_sizes[first_face:first_face + faces_per_batch].astype(np.int64)
+            batch_corners = corners[first_corner:first_corner + sizes.sum()]
+            first_corner += sizes.sum()
+
+            # corners[:, 0]: vertex_pos_idx, corners[:, 2]: vertex_normal_idx
+            corner_ids = triangulate_faces(sizes)
+            pos_ids = batch_corners[corner_ids, 0]
+            normal_ids = batch_corners[corner_ids, 2]
+            if len(normal_ids) and normal_ids.min() < 0:
+                flat_normals, flat_ids = generate_normals(positions, pos_ids, 'flat')
+                vertices = interleave_vertices(positions, flat_normals, pos_ids, flat_ids)
+                # corners with a vertex normal keep it
+                authored = normal_ids >= 0
+                vertices[1::2][authored] = normals[normal_ids[authored]]
+                yield vertices
+            else:
+                yield interleave_vertices(positions, normals, pos_ids, normal_ids)
+
+    def iter_vertex_buffer_batches(self):
+        return map(self.pack_vertices, self.iter_vertex_batches())
+
+    def get_vertex_buffer(self):
+        return self.pack_vertices(self.get_vertex_pos_and_normal())
+
+    def get_vertex_pos_and_normal(self):
+        return np.concatenate(list(self.iter_vertex_batches()))
+
+    def _spill_path(self, name):
+        return os.path.join(self.spill_dir, f'{name}.bin')
+
+    def _map_spill(self, name, dtype, shape):
+        path = self._spill_path(name)
+        if os.path.getsize(path) == 0:
+            return np.empty(shape if -1 not in shape else (0,) + shape[1:], dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r').reshape(shape)
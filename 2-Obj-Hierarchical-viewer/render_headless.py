@@ -0,0 +1,113 @@
+import argparse
+import ctypes
+import os
+import sys
+import time
+
+import glm
+import numpy as np
+
+# shader.py and the other modules shared by every viewer live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from obj_loader import Material
+from vertex_format import VERTEX_LAYOUTS
+from normal_matrix import get_normal_matrix
+
+def get_camera(material, aspect):
+    # (P, V, view_pos) looking at the material's bounding sphere, centered at the origin, from slightly above
+    _, radius = material.get_bounding_sphere()
+    radius = max(radius, 1e-3) * 1.05
+    fov = glm.radians(45)
+    distance = radius / np.sin(min(fov, fov * aspect) / 2)
+    elevation = np.radians(20)
+    view_pos = glm.vec3(0, np.sin(elevation), np.cos(elevation)) * distance
+    V = glm.lookAt(view_pos, glm.vec3(0), glm.vec3(0, 1, 0))
+    P = glm.perspective(fov, aspect, max(distance - 2 * radius, distance * 1e-3), distance + 2 * radius)
+    return P, V, view_pos
+
+def render(args):
+    from OpenGL.GL import (glClear, glEnable, glDrawArrays, glDrawElementsBaseVertex, GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT,
+                           GL_DEPTH_TEST, GL_TRIANGLES, GL_UNSIGNED_SHORT, GL_UNSIGNED_INT)
+    from offscreen import OffscreenContext, PixelReader, write_png
+    from vao import prepare_vao_material
+    from shader import load_shaders, g_program_cache, g_vertex_shader_src_normal, g_fragment_shader_src_normal
+    from render_queue import CameraBuffer, RenderQueue
+
+    material = Material(args.filename, vertex_layout=args.vertex_layout)
+    if material.get_vertex_count() == 0:
+        return
+
+    width, height = args.size
+    context = OffscreenContext(width, height)
+    shader_for_mat = load_shaders(g_vertex_shader_src_normal, g_fragment_shader_src_normal)
+    g_program_cache.report()
+    camera = CameraBuffer()
+    render_queue = RenderQueue()
+    vao_material = prepare_vao_material(material)
+    reader = PixelReader(width, height)
+
+    P, V, view_pos = get_camera(material, width / height)
+    camera.update(P, V, view_pos)
+
+    # full resolution level, through the EBO for indexed materials
+    first_index, count, base_vertex = material.get_lod(0)
+    if material.indexed:
+        index_type = GL_UNSIGNED_SHORT if material.indices.dtype == np.uint16 else GL_UNSIGNED_INT
+        offset = ctypes.c_void_p(first_index * material.indices.itemsize)
+        draw = lambda: glDrawElementsBaseVertex(GL_TRIANGLES, count, index_type, offset, base_vertex)
+    else:
+        draw = lambda: glDrawArrays(GL_TRIANGLES, 0, count)
+
+    os.makedirs(args.output, exist_ok=True)
+    glEnable(GL_DEPTH_TEST)
+    center, _ = material.get_bounding_sphere()
+    up = glm.rotate(np.radians(270), (1, 0, 0)) if args.z_up else glm.mat4()
+    color = glm.vec3(1, 1, 1)
+    start_time = time.perf_counter()
+    write_time = 0.
+    for i in range(args.frames):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        # fixed timestep: every frame turns the mesh by the same angle around the vertical axis through its center
+        angle = 2 * np.pi * args.revolutions * i / args.frames
+        M = glm.rotate(angle, (0, 1, 0)) * up * glm.translate(glm.vec3(*-center)) * material.get_position_transform()
+        render_queue.submit(shader_for_mat, vao_material, draw, {'M': M, 'N': get_normal_matrix(M, rigid=True), 'material_color': color}, tuple(color))
+        render_queue.flush()
+
+        # read this frame asynchronously, write the one whose readback has finished meanwhile
+        finished = reader.read(os.path.join(args.output, f'frame_{i:05d}.png'))
+        if finished:
+            write_start_time = time.perf_counter()
+            write_png(*finished)
+            write_time += time.perf_counter() - write_start_time
+    for finished in reader.finish():
+        write_start_time = time.perf_counter()
+        write_png(*finished)
+        write_time += time.perf_counter() - write_start_time
+    elapsed = time.perf_counter() - start_time
+
+    print(f'rendered {args.frames} frames of {width}x{height} to {args.output} in {elapsed:.3f} s ({args.frames / max(elapsed, 1e-9):.1f} fps), '
+          f'{write_time / max(elapsed, 1e-9) * 100:.0f}% of it writing images')
+    reader.delete()
+    context.destroy()
+
+def main():
+    parser = argparse.ArgumentParser(description='render a turntable of an obj file to a png image sequence without a window')
+    parser.add_argument('filename')
+    parser.add_argument('--output', default='frames', help='directory of the image sequence')
+    parser.add_argument('--size', type=int, nargs=2, default=[1280, 720], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--frames', type=int, default=120, help='number of output frames')
+    parser.add_argument('--revolutions', type=float, default=1., help='turns of the mesh over all frames')
+    parser.add_argument('--z-up', action='store_true', help='the mesh is modeled with z up (like the hierarchical model meshes)')
+    parser.add_argument('--vertex-layout', choices=VERTEX_LAYOUTS, default='quantized')
+    parser.add_argument('--platform', choices=['egl', 'osmesa'], default=os.environ.get('PYOPENGL_PLATFORM', 'egl'),
+                        help="offscreen context: 'egl' (GPU or software EGL) or 'osmesa' (software rasterizer)")
+    args = parser.parse_args()
+
+    # PyOpenGL picks its platform when it is first imported, so render() imports everything using OpenGL after choosing it
+    os.environ['PYOPENGL_PLATFORM'] = args.platform
+    render(args)
+
+if __name__ == "__main__":
+    main()
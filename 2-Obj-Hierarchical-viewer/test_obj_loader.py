@@ -0,0 +1,193 @@
+import os
+
+import numpy as np
+
+import obj_loader
+from obj_loader import Material, StreamingMaterial, parse_obj, parse_obj_parallel
+from mesh_cache import MeshCache
+
+OBJ_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'obj_files')
+
+# a unit cube: 8 positions, 6 face normals, quads written in every corner format, relative indices on the last faces
+CUBE = b'''# cube
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+v 0 0 1
+v 1 0 1
+v 1 1 1
+v 0 1 1
+vt 0 0
+vt 1 0
+vt 1 1
+vt 0 1
+vn 0 0 -1
+vn 0 0 1
+vn 0 -1 0
+vn 0 1 0
+vn -1 0 0
+vn 1 0 0
+f 1//1 4//1 3//1 2//1
+f 5/1/2 6/2/2 7/3/2 8/4/2
+f 1/1 2/2 6/3 5/4
+f 4 8 7 3
+f -8//-2 -4//-2 -1//-2 -5//-2
+f -7/-4/-1 -6/-3/-1 -2/-2/-1 -3/-1/-1
+'''
+
+def write_obj(tmp_path, data, name='mesh.obj'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def unroll(material, level=0):
+    # (position, normal) of every triangle corner of level, as (corners, 2, 3)
+    first_index, count, base_vertex = material.get_lod(level)
+    vertices = np.asarray(material.get_vertex_pos_and_normal()).reshape(-1, 2, 3)
+    if not material.indexed:
+        return vertices[:count]
+    return vertices[base_vertex + material.get_indices()[first_index:first_index + count].astype(np.int64)]
+
+def test_face_formats():
+    positions, normals, face_sizes, corners = parse_obj(CUBE)
+    assert positions.shape == (8, 3) and normals.shape == (6, 3)
+    assert face_sizes.tolist() == [4] * 6
+    # (v, vt, vn) 0-based, -1 where the corner has no such index
+    assert corners[0:4].tolist() == [[0, -1, 0], [3, -1, 0], [2, -1, 0], [1, -1, 0]]
+    assert corners[4:8].tolist() == [[4, 0, 1], [5, 1, 1], [6, 2, 1], [7, 3, 1]]
+    assert corners[8:12].tolist() == [[0, 0, -1], [1, 1, -1], [5, 2, -1], [4, 3, -1]]
+    assert corners[12:16].tolist() == [[3, -1, -1], [7, -1, -1], [6, -1, -1], [2, -1, -1]]
+
+def test_negative_indices():
+    _, _, _, corners = parse_obj(CUBE)
+    # relative indices count back from the last record before the face
+    assert corners[16:20].tolist() == [[0, -1, 4], [4, -1, 4], [7, -1, 4], [3, -1, 4]]
+    assert corners[20:24].tolist() == [[1, 0, 5], [2, 1, 5], [6, 2, 5], [5, 3, 5]]
+
+    # records after a face do not shift its relative indices
+    _, _, _, corners = parse_obj(b'v 0 0 0\nv 1 0 0\nv 0 1 0\nf -3 -2 -1\nv 0 0 1\nf -4 -3 -1\n')
+    assert corners[:, 0].tolist() == [0, 1, 2, 0, 1, 3]
+
+def test_parallel_matches_serial(tmp_path):
+    # relative indices in every byte range, which only resolve against the records of the ranges before it
+    data = CUBE + b''.join(b'v %d 0 0\nv %d 1 0\nv %d 0 1\nvn 0 0 1\nf -3//-1 -2//-1 -1//1\n' % (i, i, i) for i in range(200))
+    filename = write_obj(tmp_path, data)
+    reference = parse_obj(data)
+    for num_workers in (2, 3):
+        result = parse_obj_parallel(filename, num_workers)
+        for a, b in zip(result, reference):
+            assert a.dtype == b.dtype and a.shape == b.shape and a.tobytes() == b.tobytes()
+
+def test_parallel_matches_serial_on_sample():
+    filename = os.path.join(OBJ_FILES, 'Sword.obj')
+    with open(filename, 'rb') as file:
+        reference = parse_obj(file.read())
+    for a, b in zip(parse_obj_parallel(filename, 4), reference):
+        assert a.dtype == b.dtype and a.tobytes() == b.tobytes()
+
+def test_indexed_matches_unrolled(tmp_path):
+    filename = write_obj(tmp_path, CUBE)
+    indexed, unrolled = Material(filename, indexed=True), Material(filename, indexed=False)
+    # 6 quads, 2 triangles each; corners repeating a (position, normal) pair are stored once
+    assert unrolled.get_vertex_count() == 36 and unrolled.indices is None
+    assert indexed.get_vertex_count() < 36 and indexed.get_index_count() == 36
+    assert np.array_equal(unroll(indexed), unroll(unrolled))
+    assert indexed.face_counts == unrolled.face_counts == (0, 6, 0)
+
+def test_generated_normals(tmp_path):
+    # a quad in the z = 0 plane and a triangle folded up along its right edge, without any vn
+    filename = write_obj(tmp_path, b'v 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0\nv 1 0 1\nf 1 2 3 4\nf 2 3 5\n')
+    flat = unroll(Material(filename, indexed=False, normal_mode='flat'))
+    assert np.allclose(flat[:6, 1], [0, 0, 1])
+    assert np.allclose(flat[6:, 1], [1, 0, 0])
+
+    smooth = unroll(Material(filename, indexed=False, normal_mode='smooth'))
+    assert np.allclose(np.linalg.norm(smooth[:, 1], axis=1), 1, atol=1e-6)
+    # positions with x = 0 belong to the quad only, the two on the fold blend both planes
+    assert np.allclose(smooth[smooth[:, 0, 0] == 0, 1], [0, 0, 1])
+    shared = smooth[(smooth[:, 0, 0] == 1) & (smooth[:, 0, 2] == 0), 1]
+    assert len(shared) == 5 and np.all(shared[:, 0] > 0) and np.all(shared[:, 2] > 0)
+
+def test_partial_normals(tmp_path):
+    # faces 3 and 4 of the cube have no vn: only their corners get generated normals, the others keep the file's
+    filename = write_obj(tmp_path, CUBE)
+    authored = np.array([[0, 0, -1], [0, 0, 1], [0, 0, 0], [0, 0, 0], [-1, 0, 0], [1, 0, 0]], dtype=np.float32)
+    materials = [Material(filename, indexed=True), Material(filename, indexed=False), Material(filename, normal_mode='flat'),
+                 StreamingMaterial(filename, chunk_bytes=64)]
+    for material in materials:
+        # 6 triangle corners per quad, in file order
+        normals = unroll(material)[:, 1].reshape(6, 6, 3)
+        for face in (0, 1, 4, 5):
+            assert np.array_equal(normals[face], np.repeat(authored[face][None], 6, axis=0))
+        for face in (2, 3):
+            assert np.allclose(np.linalg.norm(normals[face], axis=1), 1, atol=1e-6)
+    # flat generated normals of the bottom (y = 0) and top (y = 1) faces
+    for material in materials[2:]:
+        normals = unroll(material)[:, 1].reshape(6, 6, 3)
+        assert np.allclose(normals[2], [0, -1, 0]) and np.allclose(normals[3], [0, 1, 0])
+
+def test_lod_chain():
+    material = Material(os.path.join(OBJ_FILES, 'Sword.obj'))
+    levels = material.levels
+    assert len(levels) > 1
+    triangles = [material.get_triangle_count(level) for level in range(len(levels))]
+    errors = levels['error'].tolist()
+    assert errors[0] == 0 and all(a < b for a, b in zip(errors, errors[1:]))
+    assert all(b <= 0.75 * a for a, b in zip(triangles, triangles[1:]))
+
+    # levels are packed one after the other in the shared buffers and only reference their own vertices
+    assert levels['first_index'].tolist() == np.concatenate(([0], np.cumsum(levels['index_count'])[:-1])).tolist()
+    assert levels['base_vertex'].tolist() == np.concatenate(([0], np.cumsum(levels['vertex_count'])[:-1])).tolist()
+    assert levels['first_index'][-1] + levels['index_count'][-1] == material.get_index_count()
+    for level in levels:
+        indices = material.get_indices()[level['first_index']:level['first_index'] + level['index_count']]
+        assert indices.max() < level['vertex_count']
+
+    # every vertex of a level stays within its error bound of the full resolution mesh's bounding box
+    lower, upper = material.get_bounds()
+    for level in range(len(levels)):
+        positions = unroll(material, level)[:, 0]
+        assert np.all(positions >= lower - errors[level]) and np.all(positions <= upper + errors[level])
+
+    # the finest level up close, the coarsest far away
+    assert material.select_lod(1e6) == 0
+    assert material.select_lod(1e-3) == len(levels) - 1
+
+def test_mesh_cache(tmp_path, monkeypatch):
+    filename = write_obj(tmp_path, CUBE)
+    cache = MeshCache(str(tmp_path / 'cache'))
+    stored = Material(filename, cache=cache, vertex_layout='quantized')
+    assert stored.get_vertex_layout() == 'quantized'
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+
+    # a warm load maps the packed vertex buffer as it is uploaded, without parsing, measuring or packing anything
+    def fail(*args):
+        raise AssertionError('warm load went through the parser or packer')
+    with monkeypatch.context() as patch:
+        for name in ('parse_obj', 'parse_obj_parallel', 'measure_packing_error', 'pack_vertices'):
+            patch.setattr(obj_loader, name, fail)
+        loaded = Material(filename, cache=cache, vertex_layout='quantized')
+    assert isinstance(loaded.get_vertex_buffer(), np.memmap)
+    assert loaded.get_vertex_buffer().dtype == stored.get_vertex_buffer().dtype
+    assert loaded.get_vertex_buffer().tobytes() == stored.get_vertex_buffer().tobytes()
+    assert loaded.get_vertex_layout() == 'quantized' and loaded.get_position_transform() == stored.get_position_transform()
+    assert np.array_equal(loaded.get_bounds(), stored.get_bounds()) and loaded.get_bounding_sphere()[1] == stored.get_bounding_sphere()[1]
+    # (position, normal) rows are decoded from the packed buffer on request
+    assert np.allclose(loaded.get_vertex_pos_and_normal(), stored.get_vertex_pos_and_normal(), atol=1e-3)
+    assert np.array_equal(loaded.get_indices(), stored.get_indices()) and loaded.get_indices().dtype == stored.get_indices().dtype
+    assert np.array_equal(loaded.levels, stored.levels)
+    assert loaded.face_counts == stored.face_counts
+    assert loaded.get_vertex_count() == stored.get_vertex_count()
+
+    # settings that change the buffers, the vertex layout among them, use their own entries
+    assert cache.load(filename, Material(filename, indexed=False, vertex_layout='quantized').get_cache_version()) is None
+    assert cache.load(filename, Material(filename).get_cache_version()) is None
+
+    # a modified file misses, and storing it drops the stale entry
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load(filename, stored.get_cache_version()) is None
+    Material(filename, cache=cache, vertex_layout='quantized')
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+    assert cache.load(filename, stored.get_cache_version()) is not None
@@ -1,5 +1,6 @@
 from OpenGL.GL import *
 import glm
+import numpy as np
 import ctypes
 
 def prepare_vao_frame(coordinate_axis=False):
@@ -42,9 +43,16 @@ def prepare_vao_frame(coordinate_axis=False):
 
     return VAO
 
-def prepare_vao_material(material):
-    # prepare vertex data (in main memory)
-    vertices = material.get_vertex_pos_and_normal()
+def prepare_vao_grid(num_lines, spacing, half_length):
+    # prepare vertex data (in main memory): grey lines parallel to the z and x axes at spacing * i for i in [-num_lines, num_lines) except 0,
+    # each reaching half_length to both sides, so the whole grid is drawn with a single draw call
+    offsets = spacing * np.array([i for i in range(-num_lines, num_lines) if i != 0], dtype=np.float32)
+    vertices = np.zeros((2, len(offsets), 2, 6), dtype=np.float32)
+    vertices[0, :, :, 0] = offsets[:, None]                 # lines along the z-axis
+    vertices[0, :, :, 2] = [-half_length, half_length]
+    vertices[1, :, :, 0] = [-half_length, half_length]      # lines along the x-axis
+    vertices[1, :, :, 2] = offsets[:, None]
+    vertices[..., 3:] = 0.4
 
     # create and activate VAO (vertex array object)
     VAO = glGenVertexArrays(1)  # create a vertex array object ID and store it to VAO variable
@@ -55,14 +63,167 @@ def prepare_vao_material(material):
     glBindBuffer(GL_ARRAY_BUFFER, VBO)  # activate VBO as a vertex buffer object
 
     # copy vertex data to VBO
-    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices.ptr, GL_STATIC_DRAW) # allocate GPU memory for and copy vertex data to the currently bound vertex buffer
+    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, ctypes.c_void_p(vertices.ctypes.data), GL_STATIC_DRAW) # allocate GPU memory for and copy vertex data to the currently bound vertex buffer
 
     # configure vertex positions
     glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), None)
     glEnableVertexAttribArray(0)
 
-    # configure vertex normals
+    # configure vertex colors
     glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), ctypes.c_void_p(3*glm.sizeof(glm.float32)))
     glEnableVertexAttribArray(1)
 
-    return VAO
\ No newline at end of file
+    # vertex count drawn with GL_LINES
+    return VAO, vertices.size // 6
+
+def prepare_vao_material(material):
+    # prepare vertex data (in main memory)
+    vertices = material.get_vertex_buffer()
+
+    # create and activate VAO (vertex array object)
+    VAO = glGenVertexArrays(1)  # create a vertex array object ID and store it to VAO variable
+    glBindVertexArray(VAO)      # activate VAO
+
+    # create and activate VBO (vertex buffer object)
+    VBO = glGenBuffers(1)   # create a buffer object ID and store it to VBO variable
+    glBindBuffer(GL_ARRAY_BUFFER, VBO)  # activate VBO as a vertex buffer object
+
+    # copy vertex data to VBO, straight from the (possibly memory-mapped) numpy buffer
+    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, ctypes.c_void_p(vertices.ctypes.data), GL_STATIC_DRAW) # allocate GPU memory for and copy vertex data to the currently bound vertex buffer
+
+    if material.indexed:
+        # prepare index data
+        indices = material.get_indices()
+
+        # create and activate EBO (element buffer object)
+        EBO = glGenBuffers(1)   # create a buffer object ID and store it to EBO variable
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, EBO)  # activate EBO as an element buffer object
+
+        # copy index data to EBO
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, ctypes.c_void_p(indices.ctypes.data), GL_STATIC_DRAW) # allocate GPU memory for and copy index data to the currently bound element buffer
+
+    configure_material_attributes(material.get_vertex_layout())
+
+    return VAO
+
+def configure_material_attributes(layout):
+    # vertex attribute formats of the material vertex layouts (see vertex_format.py)
+    if layout == 'float32':
+        # configure vertex positions
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), None)
+        glEnableVertexAttribArray(0)
+
+        # configure vertex normals
+        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), ctypes.c_void_p(3*glm.sizeof(glm.float32)))
+        glEnableVertexAttribArray(1)
+        return
+
+    # configure vertex positions: half floats, or int16 converted to float as is (dequantized by the model matrix)
+    position_type = GL_HALF_FLOAT if layout == 'half' else GL_SHORT
+    glVertexAttribPointer(0, 3, position_type, GL_FALSE, 12, None)
+    glEnableVertexAttribArray(0)
+
+    # configure vertex normals: signed 10 bit components, the shader normalizes them
+    glVertexAttribPointer(1, 4, GL_INT_2_10_10_10_REV, GL_FALSE, 12, ctypes.c_void_p(8))
+    glEnableVertexAttribArray(1)
+
+class MaterialUpload:
+    def __init__(self, material):
+        # create the VAO and allocate GPU memory now, copy buffer contents later in budgeted steps
+        self.material = material
+        vertex_bytes = material.get_vertex_count() * material.get_vertex_stride()
+
+        # create and activate VAO (vertex array object)
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+
+        # create and activate VBO (vertex buffer object), allocate GPU memory without copying vertex data
+        VBO = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, VBO)
+        glBufferData(GL_ARRAY_BUFFER, vertex_bytes, None, GL_STATIC_DRAW)
+        # vertex data arrives in batches already packed in the material's vertex layout
+        # (a single one, memory-mapped from the mesh cache on a warm load, unless the material is streamed)
+        self.pending = [(GL_ARRAY_BUFFER, VBO, material.iter_vertex_buffer_batches())]
+        self.buffers = [VBO]
+        self.total_bytes = vertex_bytes
+
+        if material.indexed:
+            # create and activate EBO (element buffer object), allocate GPU memory without copying index data
+            indices = material.get_indices()
+            EBO = glGenBuffers(1)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, EBO)
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, None, GL_STATIC_DRAW)
+            self.pending.append((GL_ELEMENT_ARRAY_BUFFER, EBO, iter([indices])))
+            self.buffers.append(EBO)
+            self.total_bytes += indices.nbytes
+
+        configure_material_attributes(material.get_vertex_layout())
+
+        self.batch = None           # batch being copied, and the read / write offsets in bytes
+        self.batch_offset = 0
+        self.buffer_offset = 0
+        self.uploaded_bytes = 0
+
+    def step(self, budget):
+        # copy at most budget bytes of the remaining buffer data to GPU memory, returns the number of bytes copied
+        uploaded = 0
+        glBindVertexArray(self.vao)     # the EBO binding belongs to this VAO
+        while self.pending and uploaded < budget:
+            target, buffer, batches = self.pending[0]
+            if self.batch is None or self.batch_offset == self.batch.nbytes:
+                self.batch, self.batch_offset = next(batches, None), 0
+                if self.batch is None:
+                    self.pending.pop(0)
+                    self.buffer_offset = 0
+                continue
+
+            size = min(budget - uploaded, self.batch.nbytes - self.batch_offset)
+            glBindBuffer(target, buffer)
+            glBufferSubData(target, self.buffer_offset, size, ctypes.c_void_p(self.batch.ctypes.data + self.batch_offset))
+            self.batch_offset += size
+            self.buffer_offset += size
+            uploaded += size
+        self.uploaded_bytes += uploaded
+        return uploaded
+
+    def is_done(self):
+        return not self.pending
+
+    def get_progress(self):
+        return self.uploaded_bytes / max(self.total_bytes, 1)
+
+class InstanceBuffer:
+    # per-instance model matrix (4 float4 columns), color (float3) and normal matrix (3 float3 columns) of instanced draws, streamed every frame
+    STRIDE = 28 * 4
+
+    def __init__(self):
+        self.vbo = glGenBuffers(1)
+
+    def upload(self, instances):
+        # instances: float32 (num_instances, 28) array; reallocating the storage lets the driver skip waiting on last frame's draws
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, instances.nbytes, ctypes.c_void_p(instances.ctypes.data), GL_STREAM_DRAW)
+
+    def bind(self, first_instance):
+        # point the instance attributes of the bound VAO at the instances from first_instance on
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        offset = first_instance * self.STRIDE
+        # configure instance model matrix columns
+        for column in range(4):
+            glVertexAttribPointer(2 + column, 4, GL_FLOAT, GL_FALSE, self.STRIDE, ctypes.c_void_p(offset + column * 4 * glm.sizeof(glm.float32)))
+            glEnableVertexAttribArray(2 + column)
+            glVertexAttribDivisor(2 + column, 1)
+        # configure instance colors
+        glVertexAttribPointer(6, 3, GL_FLOAT, GL_FALSE, self.STRIDE, ctypes.c_void_p(offset + 16 * glm.sizeof(glm.float32)))
+        glEnableVertexAttribArray(6)
+        glVertexAttribDivisor(6, 1)
+        # configure instance normal matrix columns
+        for column in range(3):
+            glVertexAttribPointer(7 + column, 3, GL_FLOAT, GL_FALSE, self.STRIDE, ctypes.c_void_p(offset + (19 + 3 * column) * glm.sizeof(glm.float32)))
+            glEnableVertexAttribArray(7 + column)
+            glVertexAttribDivisor(7 + column, 1)
+
+def delete_vao(vao, buffers):
+    # free the GPU memory of a VAO and of the buffers it references
+    glDeleteVertexArrays(1, [vao])
+    glDeleteBuffers(len(buffers), buffers)
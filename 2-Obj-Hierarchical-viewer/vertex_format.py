@@ -0,0 +1,94 @@
+import numpy as np
+import glm
+
+# 'float32':   float32 position xyz, float32 normal xyz                     (24 bytes per vertex)
+# 'half':      float16 position xyz + pad, GL_INT_2_10_10_10_REV normal     (12 bytes per vertex)
+# 'quantized': int16 position xyz + pad, GL_INT_2_10_10_10_REV normal       (12 bytes per vertex)
+#              positions are relative to the mesh bounds, the model matrix dequantizes them
+VERTEX_LAYOUTS = ('float32', 'half', 'quantized')
+
+# largest accepted error of a compact layout, before falling back to float32
+POSITION_TOLERANCE = 1e-3       # relative to the bounding box diagonal
+NORMAL_TOLERANCE_DEGREES = 0.5
+
+_NORMAL_MAX = 511               # largest magnitude of a signed 10 bit component
+_POSITION_MAX = 32767
+
+def get_vertex_stride(layout):
+    return 24 if layout == 'float32' else 12
+
+def get_vertex_dtype(layout):
+    # numpy dtype of one record of a vertex buffer in layout: a float32 position or normal row, or a whole packed vertex
+    if layout == 'float32':
+        return np.dtype((np.float32, 3))
+    return np.dtype([('position', '<f2' if layout == 'half' else '<i2', 4), ('normal', '<u4')])
+
+def get_quantization(bounds):
+    # (center, scale) with position = center + scale * quantized; the same scale on every axis keeps normals undistorted
+    lower, upper = np.asarray(bounds, dtype=np.float64)
+    center = (lower + upper) / 2
+    extent = np.max(upper - lower) / 2
+    scale = extent / _POSITION_MAX if extent > 0 else 1.
+    return center, scale
+
+def get_position_transform(layout, bounds):
+    # model-space transform applied to the positions stored in the VBO
+    if layout != 'quantized':
+        return glm.mat4()
+    center, scale = get_quantization(bounds)
+    return glm.translate(glm.vec3(*center)) * glm.scale(glm.vec3(scale))
+
+def pack_normals(normals):
+    # signed 10 bit x, y, z in a GL_INT_2_10_10_10_REV word (w = 0)
+    q = np.clip(np.round(normals * _NORMAL_MAX), -_NORMAL_MAX, _NORMAL_MAX).astype(np.int32) & 0x3FF
+    return (q[:, 0] | (q[:, 1] << 10) | (q[:, 2] << 20)).astype(np.uint32)
+
+def unpack_normals(packed):
+    q = np.stack([(packed >> shift) & 0x3FF for shift in (0, 10, 20)], axis=1).astype(np.int32)
+    q = np.where(q >= 512, q - 1024, q)
+    return q / _NORMAL_MAX
+
+def pack_vertices(vertices, layout, bounds):
+    # interleaved float32 (position, normal) rows -> VBO contents of layout
+    if layout == 'float32':
+        return vertices
+    positions, normals = vertices[0::2], vertices[1::2]
+    packed = np.zeros(len(positions), dtype=get_vertex_dtype(layout))
+    if layout == 'half':
+        packed['position'][:, :3] = positions
+    else:
+        center, scale = get_quantization(bounds)
+        packed['position'][:, :3] = np.clip(np.round((positions - center) / scale), -_POSITION_MAX, _POSITION_MAX)
+    packed['normal'] = pack_normals(normals)
+    return packed
+
+def unpack_vertices(packed, layout, bounds):
+    # inverse of pack_vertices, as the vertex shader sees the attributes
+    if layout == 'float32':
+        return packed
+    positions = packed['position'][:, :3].astype(np.float64)
+    if layout == 'quantized':
+        center, scale = get_quantization(bounds)
+        positions = center + scale * positions
+    vertices = np.empty((len(packed), 2, 3), dtype=np.float32)
+    vertices[:, 0] = positions
+    vertices[:, 1] = unpack_normals(packed['normal'])
+    return vertices.reshape(-1, 3)
+
+def measure_packing_error(vertices, layout, bounds):
+    # (largest position error relative to the bounding box diagonal, largest normal angle error in degrees)
+    decoded = unpack_vertices(pack_vertices(vertices, layout, bounds), layout, bounds).astype(np.float64)
+    reference = np.asarray(vertices, dtype=np.float64)
+    if len(reference) == 0:
+        return 0., 0.
+    lower, upper = np.asarray(bounds, dtype=np.float64)
+    diagonal = max(np.linalg.norm(upper - lower), 1e-12)
+    position_error = np.max(np.linalg.norm(decoded[0::2] - reference[0::2], axis=1)) / diagonal
+
+    # the shader renormalizes normals, so only the direction matters
+    a, b = reference[1::2], decoded[1::2]
+    lengths = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    valid = lengths > 0
+    cos = np.clip(np.sum(a[valid] * b[valid], axis=1) / lengths[valid], -1, 1)
+    normal_error = np.degrees(np.max(np.arccos(cos), initial=0.))
+    return position_error, normal_error
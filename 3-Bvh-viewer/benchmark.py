@@ -0,0 +1,141 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from bvh_loader import Character
+from hierarchy import get_bone_matrices
+
+def benchmark_forward_kinematics(filename, num_frames):
+    # bone matrices of a Node tree built per frame (get_nodes) vs. the batched forward kinematics computed at load time
+    character = Character(filename)
+    if not character.num_frames:
+        return
+    frames = np.linspace(0, character.num_frames - 1, min(num_frames, character.num_frames)).astype(int)
+    print(f'{len(frames)} of {character.num_frames} frames, {len(character.joints)} joints')
+
+    start_time = time.perf_counter()
+    reference = [get_bone_matrices(character.get_nodes(frame)) for frame in frames]
+    node_time = (time.perf_counter() - start_time) / len(frames)
+
+    start_time = time.perf_counter()
+    G = character.compute_global_transforms(0, character.num_frames)
+    batch_time = (time.perf_counter() - start_time) / character.num_frames
+
+    start_time = time.perf_counter()
+    result = [character.get_bone_matrices(frame) for frame in frames]
+    lookup_time = (time.perf_counter() - start_time) / len(frames)
+
+    # positions are compared relative to the skeleton's extent
+    scale = max(float(np.abs(G[..., 3, :3]).max()), 1e-9)
+    error = max(float(np.abs(a - b).max(initial=0.)) for a, b in zip(result, reference))
+    print(f'{"per frame":>10}: {node_time * 1e3:8.3f} ms per frame (get_nodes + get_bone_matrices)')
+    print(f'{"batched":>10}: {batch_time * 1e3:8.3f} ms per frame (forward kinematics of all frames, {G.nbytes / (1 << 20):.1f} MB)')
+    print(f'{"lookup":>10}: {lookup_time * 1e3:8.3f} ms per frame (Character.get_bone_matrices)')
+    print(f'max abs difference {error:.2e} ({error / scale:.2e} of the skeleton extent)')
+
+def measure_allocations(function, repeat):
+    # (seconds, blocks, peak bytes) per call: time, memory blocks allocated by the call that are still alive when it returns
+    # (garbage of the next frame) and the peak of memory allocated during the call, averaged over repeat calls
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    total_time, total_blocks, total_peak = 0., 0, 0
+    tracemalloc.start()
+    for _ in range(repeat):
+        before = tracemalloc.take_snapshot().filter_traces(ignore)
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        start_time = time.perf_counter()
+        result = function()
+        total_time += time.perf_counter() - start_time
+        total_peak += tracemalloc.get_traced_memory()[1] - current
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+        total_blocks += sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+        del result, before, after
+    tracemalloc.stop()
+    return total_time / repeat, total_blocks / repeat, total_peak / repeat
+
+def benchmark_nodes(filename, repeat):
+    # per-frame cost of a node tree built for every frame (as get_nodes and get_rest_nodes used to) vs. the persistent one
+    character = Character(filename)
+    if not character.num_frames:
+        return
+    print(f'{len(character.nodes)} nodes, {len(character.joints)} joints')
+
+    def pose_new_tree(frame):
+        # new nodes, box shape transforms and links, then the same posing code on them
+        persistent_nodes = character.nodes
+        character.nodes = character.build_nodes()[0]
+        try:
+            return character.get_nodes(frame)
+        finally:
+            character.nodes = persistent_nodes
+
+    def rest_new_tree():
+        nodes = character.build_nodes()[0]
+        nodes[0].update_tree_global_transform()
+        return nodes
+
+    frames = iter(range(10 ** 9))
+    cases = [
+        ('animated, new tree', lambda: get_bone_matrices(pose_new_tree(next(frames) % character.num_frames))),
+        ('animated, in place', lambda: get_bone_matrices(character.get_nodes(next(frames) % character.num_frames))),
+        ('rest, new tree', lambda: get_bone_matrices(rest_new_tree())),
+        ('rest, in place', lambda: get_bone_matrices(character.get_rest_nodes())),
+        ('rest, cached', lambda: character.rest_bone_matrices),
+    ]
+    for name, function in cases:
+        seconds, blocks, peak = measure_allocations(function, repeat)
+        print(f'{name:>20}: {seconds * 1e3:8.3f} ms per frame  {blocks:8.1f} blocks kept alive  {peak / 1024:8.1f} KB peak allocated')
+
+def benchmark_sampling(filename, num_samples):
+    # time-continuous poses: one call per sample vs. all samples in one call, for slerp and nlerp,
+    # and the difference from the precomputed frames at the frame times themselves
+    character = Character(filename)
+    if not character.num_frames:
+        return
+    duration = character.num_frames * character.frame_time
+    times = np.linspace(0, duration, num_samples, endpoint=False)
+    print(f'{num_samples} samples over {duration:.2f} s, {len(character.joints)} joints')
+
+    for interpolation in ('slerp', 'nlerp'):
+        start_time = time.perf_counter()
+        for t in times[:100]:
+            character.sample_global_transforms(t, interpolation)
+        single_time = (time.perf_counter() - start_time) / min(num_samples, 100)
+
+        start_time = time.perf_counter()
+        character.sample_global_transforms(times, interpolation)
+        batch_time = (time.perf_counter() - start_time) / num_samples
+        print(f'{interpolation:>10}: {single_time * 1e3:8.3f} ms per sample one by one, {batch_time * 1e3:8.3f} ms per sample batched')
+
+    frames = np.arange(character.num_frames)[:num_samples]
+    error = np.abs(character.sample_global_transforms(frames * character.frame_time) - character.compute_global_transforms(0, len(frames))).max()
+    print(f'max abs difference from the precomputed frames at frame times: {error:.2e}')
+
+def main():
+    parser = argparse.ArgumentParser(description='bvh viewer benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    forward_kinematics = subparsers.add_parser('fk', help='per-frame Node trees vs. batched forward kinematics')
+    forward_kinematics.add_argument('filename')
+    forward_kinematics.add_argument('--frames', type=int, default=1000, help='frames compared with the per-frame path')
+
+    nodes = subparsers.add_parser('nodes', help='node tree built per frame vs. built once and posed in place')
+    nodes.add_argument('filename')
+    nodes.add_argument('--repeat', type=int, default=100)
+
+    sample = subparsers.add_parser('sample', help='interpolated poses at arbitrary times, one by one vs. batched')
+    sample.add_argument('filename')
+    sample.add_argument('--samples', type=int, default=1000)
+
+    args = parser.parse_args()
+    if args.command == 'fk':
+        benchmark_forward_kinematics(args.filename, args.frames)
+    elif args.command == 'nodes':
+        benchmark_nodes(args.filename, args.repeat)
+    elif args.command == 'sample':
+        benchmark_sampling(args.filename, args.samples)
+
+if __name__ == "__main__":
+    main()
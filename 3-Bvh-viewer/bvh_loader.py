@@ -1,6 +1,35 @@
 import os
+import time
+import warnings
 import glm
-from hierarchy import Node
+import numpy as np
+from hierarchy import Node, get_bone_matrices
+from kinematics import get_hierarchy_levels, get_euler_rotations, get_translations, forward_kinematics, get_quaternions, get_rotation_matrices, slerp, nlerp
+
+FK_CACHE_MAX_BYTES = 256 << 20  # global joint transforms of every frame are precomputed up to this size, longer motions per chunk on demand
+FK_CHUNK_FRAMES = 1024          # frames per batched forward kinematics call, bounds the temporary arrays
+
+def get_channel_table(joints):
+    # per-joint layout of the motion columns, so that any mix of channel counts and orders can be decoded in bulk:
+    #   "positions": (num_joints, 3) column of the x, y, z position channel, -1 where the joint has none (its offset is used)
+    #   "rotations": (num_joints, n) columns of the rotation channels in file order, -1 padding for joints with fewer
+    #   "axes": (num_joints, n) rotation axis of each of them (0: x, 1: y, 2: z), "orders": rotation order names such as 'ZXY'
+    num_rotations = max([sum(not isinstance(channel, int) for channel in joint["channels"] or ()) for joint in joints] + [0])
+    positions = np.full((len(joints), 3), -1)
+    rotations = np.full((len(joints), num_rotations), -1)
+    axes = np.zeros((len(joints), num_rotations), dtype=np.int64)
+    orders = []
+    for idx, joint in enumerate(joints):
+        order = ''
+        for column, channel in enumerate(joint["channels"] or (), joint["channel_offset"]):
+            if isinstance(channel, int):
+                positions[idx, channel] = column
+            else:
+                rotations[idx, len(order)] = column
+                axes[idx, len(order)] = int(np.argmax(channel))
+                order += 'XYZ'[axes[idx, len(order)]]
+        orders.append(order)
+    return {"positions": positions, "rotations": rotations, "axes": axes, "orders": orders}
 
 def load_bvh(filename):
     # open and parse bvh file contents
@@ -18,19 +47,20 @@ def load_bvh(filename):
             #     "parent": parent node idx (if root, None),
             #     "offset": [],
             #     "channels": [],
+            #     "channel_offset": column of the first channel in the motion rows,
             #     "endoffset": [],
             # }
         ],
-        "Motions": []
+        "Motions": None,    # (num_frames, num_channels) float32 array
+        "Channels": None    # get_channel_table of the joints
     }
     num_frames = 0
     frame_time = 0
 
     try:
         with open(filename, 'r') as file:
-            lines = file.readlines()
-
-            for line in lines:
+            # HIERARCHY, line by line up to the MOTION keyword
+            for line in iter(file.readline, ''):
                 line = line.strip()
                 if not line or line.startswith(('//', '#')):
                     continue
@@ -38,19 +68,9 @@ def load_bvh(filename):
                     continue
                 if "MOTION" in line:
                     motion_data = True
-                    continue
+                    break
 
                 values = line.split()
-                # MOTION
-                if motion_data:
-                    if line.startswith("Frames:"):
-                        num_frames = int(values[-1])
-                    elif line.startswith("Frame Time:"):
-                        frame_time = float(values[-1])
-                    else:
-                        data["Motions"].append(list(map(float, values)))
-                    continue
-                # HIERARCHY
                 if "JOINT" in line or "ROOT" in line:
                     data["Joints"].append({
                         "name": values[-1],
@@ -78,11 +98,48 @@ def load_bvh(filename):
                         end_site = False
                     else:
                         parents.pop()
-                
+            if not motion_data:
+                return data, num_frames, frame_time
+
+            # MOTION header, frames follow the Frame Time line
+            for line in iter(file.readline, ''):
+                line = line.strip()
+                if line.startswith("Frames:"):
+                    num_frames = int(line.split()[-1])
+                elif line.startswith("Frame Time:"):
+                    frame_time = float(line.split()[-1])
+                    break
+
+            # MOTION frames, parsed in bulk into one (frames, channels) float32 array instead of a list of floats per frame
+            start_time = time.perf_counter()
+            start_offset = file.tell()
+            with warnings.catch_warnings():
+                # an empty MOTION block is reported below like any other frame count mismatch
+                warnings.simplefilter('ignore', UserWarning)
+                motions = np.loadtxt(file, dtype=np.float32, ndmin=2, comments=('//', '#'))
+            elapsed = time.perf_counter() - start_time
+            num_bytes = os.path.getsize(filename) - start_offset
+
+        # channels of all joints are concatenated in hierarchy order, whatever their count (end sites have none)
+        num_channels = 0
+        for joint in data["Joints"]:
+            joint["channel_offset"] = num_channels
+            num_channels += len(joint["channels"] or ())
+        data["Channels"] = get_channel_table(data["Joints"])
+        if motions.size and motions.shape[1] != num_channels:
+            print(f"Error: frames have {motions.shape[1]} values, the hierarchy declares {num_channels} channels")
+            return None, None, None
+        if len(motions) != num_frames:
+            print(f"Error: the file has {len(motions)} frames but declares {num_frames}; using {min(len(motions), num_frames)}")
+            num_frames = min(len(motions), num_frames)
+        data["Motions"] = np.ascontiguousarray(motions[:num_frames]).reshape(num_frames, num_channels)
+        print(f'motion parse time: {elapsed:.3f} s ({num_bytes / (1 << 20) / max(elapsed, 1e-9):.1f} MB/s, {len(motions) / max(elapsed, 1e-9):.0f} frames/s)')
         return data, num_frames, frame_time
 
     except IOError:
-        print(f"Error: Could not open file {file}")
+        print(f"Error: Could not open file {filename}")
+    except ValueError as e:
+        print(f"Error: Could not parse the motion of {filename} ({e})")
 
     return None, None, None
         
@@ -103,79 +160,169 @@ class Character:
         print(f'fps: {1 / self.frame_time : .4f}')
         print(f'number of joints: {len(self.joints)}')
         print(f'list of all joint names: {self.joints}')
+        orders = self.data["Channels"]["orders"]
+        print(f'rotation orders: {", ".join(f"{order or None} ({orders.count(order)})" for order in dict.fromkeys(orders))}')
+
+        # node tree built once and posed in place, bone matrices of the rest pose computed once
+        self.nodes, self.rest_link_transforms = self.build_nodes()
+        self.rest_bone_matrices = get_bone_matrices(self.get_rest_nodes())
+
+        # skeleton layout for batched forward kinematics
+        self.parents = np.array([-1 if joint["parent"] is None else joint["parent"] for joint in self.data["Joints"]])
+        self.levels = get_hierarchy_levels(self.parents)
+        self.offsets = np.array([joint["offset"] for joint in self.data["Joints"]], dtype=np.float64)
+        self.shapes, self.node_joints = self.get_bone_shapes()
+        self.global_transforms = None       # (num_frames, num_joints, 4, 4) float32, transposed like get_bone_matrices
+        self.chunk = (None, None)           # (first frame, global transforms) of the chunk last computed on demand
+        num_bytes = self.num_frames * len(self.joints) * 64
+        if num_bytes <= FK_CACHE_MAX_BYTES:
+            start_time = time.perf_counter()
+            self.global_transforms = self.compute_global_transforms(0, self.num_frames)
+            print(f'forward kinematics of all frames: {time.perf_counter() - start_time:.3f} s ({num_bytes / (1 << 20):.1f} MB)')
         print('----------------------------------------')
 
-    def get_nodes(self, frame):
-        # create a hirarchical model - Node(parent, link_transform_from_parent, shape_transform)
+    def build_nodes(self):
+        # create the hirarchical model once - Node(parent, link_transform_from_parent, shape_transform), joints in file order then end sites.
+        # shape transforms and end site links never change; joint links start as the rest pose and are overwritten by get_nodes
         nodes = []
         end_nodes = []
+        rest_link_transforms = []
         for idx, joint in enumerate(self.data["Joints"]):
             xoff, yoff, zoff = joint["offset"]
-            channels = joint["channels"]
-
-            if joint["parent"] == None:         # ROOT
-                xpos = self.data["Motions"][frame][0]
-                ypos = self.data["Motions"][frame][1]
-                zpos = self.data["Motions"][frame][2]
-                ang1 = glm.radians(self.data["Motions"][frame][3])
-                ang2 = glm.radians(self.data["Motions"][frame][4])
-                ang3 = glm.radians(self.data["Motions"][frame][5])
-                node = Node(None, 
-                            glm.translate((xpos, ypos, zpos)) * glm.rotate(ang1, channels[3]) * glm.rotate(ang2, channels[4]) * glm.rotate(ang3, channels[5]), 
-                            glm.scale((.01, .01, .01)))
+
+            if joint["parent"] == None:         # ROOT, at the origin in rest pose
+                link_transform = glm.mat4()
+                node = Node(None, link_transform, glm.scale((.01, .01, .01)))
             else:
-                ang1 = glm.radians(self.data["Motions"][frame][6 + (idx-1)*3+0])
-                ang2 = glm.radians(self.data["Motions"][frame][6 + (idx-1)*3+1])
-                ang3 = glm.radians(self.data["Motions"][frame][6 + (idx-1)*3+2])
                 # for box rendering, box should be (parent's offset ~ current offset), along x-axis
                 # rotate local frame's x-axis to be equal orientation, with vector (current offset - parent's offset)
                 dist, R = self.get_box_transformation(xoff, yoff, zoff)
-                node = Node(nodes[joint["parent"]],
-                            glm.translate((xoff, yoff, zoff)) * glm.rotate(ang1, channels[0]) * glm.rotate(ang2, channels[1]) * glm.rotate(ang3, channels[2]),
-                            R * glm.translate((dist/2, 0, 0)) * glm.scale((dist/2, .03, .03)))
+                link_transform = glm.translate((xoff, yoff, zoff))
+                node = Node(nodes[joint["parent"]], link_transform, R * glm.translate((dist/2, 0, 0)) * glm.scale((dist/2, .03, .03)))
             nodes.append(node)
+            rest_link_transforms.append(link_transform)
             if joint["endoffset"]:
                 xoff, yoff, zoff = joint["endoffset"]
                 dist, R = self.get_box_transformation(xoff, yoff, zoff)
                 node = Node(nodes[-1], glm.translate((xoff, yoff, zoff)), R * glm.translate((dist/2, 0, 0)) * glm.scale((dist/2, .03, .03)))
                 end_nodes.append(node)
-        # recursively update global transformations of all nodes
         nodes += end_nodes
-        nodes[0].update_tree_global_transform()
+        return nodes, rest_link_transforms
+
+    def get_bone_shapes(self):
+        # (num_nodes, 4, 4) transposed shape transforms of self.nodes, and the joint whose global transform each one is drawn with
+        # (its parent joint's, the root's own); both are the same in every frame
+        joints = self.data["Joints"]
+        node_joints = [idx if joint["parent"] is None else joint["parent"] for idx, joint in enumerate(joints)]
+        node_joints += [idx for idx, joint in enumerate(joints) if joint["endoffset"]]
+        # glm matrices are column-major, so their bytes read row-major are the transposed matrix
+        shapes = np.stack([np.frombuffer(node.get_shape_transform().to_bytes(), dtype=np.float32).reshape(4, 4) for node in self.nodes])
+        return shapes, np.array(node_joints)
+
+    def get_local_transforms(self, motions):
+        # (frames, num_joints, 4, 4) local transforms of (frames, num_channels) motion rows, as in get_nodes:
+        # each joint is translated by its offset (position channels replace it per axis), then rotated by its rotation channels in file order
+        return get_translations(self.get_local_translations(motions)) @ self.get_local_rotations(motions)
+
+    def get_local_translations(self, motions):
+        # (frames, num_joints, 3) joint translations of motion rows: offsets, replaced per axis by position channels
+        table = self.data["Channels"]
+        translations = np.broadcast_to(self.offsets, (len(motions),) + self.offsets.shape).copy()
+        has_position = table["positions"] >= 0
+        translations[:, has_position] = motions[:, table["positions"][has_position]]
+        return translations
+
+    def get_local_rotations(self, motions):
+        # (frames, num_joints, 4, 4) joint rotations of motion rows; missing rotation channels (-1 padding) are rotations by 0
+        table = self.data["Channels"]
+        angles = np.radians(motions[:, np.maximum(table["rotations"], 0)].astype(np.float64))
+        angles[:, table["rotations"] < 0] = 0
+        return get_euler_rotations(angles, table["axes"])
+
+    def sample_local_transforms(self, times, interpolation='slerp'):
+        # (len(times), num_joints, 4, 4) local transforms at any times in seconds, looping like playback: between the two
+        # neighbouring frames, translations (the root's position) are interpolated linearly and rotations by quaternion
+        # slerp (or 'nlerp'), for every sample and joint at once. the last frame is held until the loop restarts
+        position = np.atleast_1d(np.asarray(times, dtype=np.float64)) / self.frame_time % self.num_frames
+        previous = np.floor(position).astype(np.int64)
+        weights = position - previous
+        following = np.minimum(previous + 1, self.num_frames - 1)
+
+        motions = self.data["Motions"][np.concatenate([previous, following])]
+        translations = self.get_local_translations(motions)
+        rotations = get_quaternions(self.get_local_rotations(motions))
+        n = len(previous)
+        interpolate = slerp if interpolation == 'slerp' else nlerp
+        local_transforms = get_rotation_matrices(interpolate(rotations[:n], rotations[n:], weights[:, None]))
+        local_transforms[..., :3, 3] = translations[:n] + weights[:, None, None] * (translations[n:] - translations[:n])
+        return local_transforms
+
+    def sample_global_transforms(self, times, interpolation='slerp'):
+        # (len(times), num_joints, 4, 4) float32 global joint transforms at any times, transposed like get_bone_matrices
+        G = forward_kinematics(self.sample_local_transforms(times, interpolation), self.parents, self.levels)
+        return G.transpose(0, 1, 3, 2).astype(np.float32)
 
-        return nodes
+    def sample_bone_matrices(self, time, interpolation='slerp'):
+        # get_bone_matrices at any time in seconds instead of a frame index
+        return self.shapes @ self.sample_global_transforms(time, interpolation)[0][self.node_joints]
+
+    def compute_global_transforms(self, first_frame, last_frame):
+        # (last_frame - first_frame, num_joints, 4, 4) float32 global joint transforms, transposed like get_bone_matrices
+        global_transforms = np.empty((last_frame - first_frame, len(self.joints), 4, 4), dtype=np.float32)
+        for start in range(first_frame, last_frame, FK_CHUNK_FRAMES):
+            stop = min(start + FK_CHUNK_FRAMES, last_frame)
+            G = forward_kinematics(self.get_local_transforms(self.data["Motions"][start:stop]), self.parents, self.levels)
+            global_transforms[start - first_frame:stop - first_frame] = G.transpose(0, 1, 3, 2)
+        return global_transforms
+
+    def get_global_transforms(self, frame):
+        # (num_joints, 4, 4) transposed global joint transforms of a frame: a lookup when every frame is precomputed
+        if self.global_transforms is not None:
+            return self.global_transforms[frame]
+        first_frame = frame - frame % FK_CHUNK_FRAMES
+        if self.chunk[0] != first_frame:
+            self.chunk = (first_frame, self.compute_global_transforms(first_frame, min(first_frame + FK_CHUNK_FRAMES, self.num_frames)))
+        return self.chunk[1][frame - first_frame]
+
+    def get_bone_matrices(self, frame):
+        # same as hierarchy.get_bone_matrices(self.get_nodes(frame)), without building nodes
+        return self.shapes @ self.get_global_transforms(frame)[self.node_joints]
+
+    def get_nodes(self, frame):
+        # pose the node tree of build_nodes at frame; the same nodes are returned, and changed, by every call
+        motion = self.data["Motions"][frame].tolist()
+        for node, joint in zip(self.nodes, self.data["Joints"]):
+            # link transform: offset, replaced per axis by the joint's position channels, then its rotation channels in file order
+            translation = list(joint["offset"])
+            rotation = glm.mat4()
+            for column, channel in enumerate(joint["channels"] or (), joint["channel_offset"]):
+                if isinstance(channel, int):
+                    translation[channel] = motion[column]
+                else:
+                    rotation = rotation * glm.rotate(glm.radians(motion[column]), channel)
+            node.link_transform_from_parent = glm.translate(translation) * rotation
+        # update global transformations of all nodes
+        self.nodes[0].update_tree_global_transform()
+
+        return self.nodes
 
     def get_box_transformation(self, xoff, yoff, zoff):
         x_axis = glm.vec3(1,0,0)
         vec = glm.vec3(xoff, yoff, zoff)
         dist = glm.distance(vec, glm.vec3())
-        angle = glm.acos(glm.dot(x_axis, glm.normalize(vec)))
-        axis = glm.normalize(glm.cross(x_axis, vec))
+        if dist == 0:
+            return dist, glm.mat4()
+        angle = glm.acos(glm.clamp(glm.dot(x_axis, glm.normalize(vec)), -1., 1.))
+        # offsets along the x-axis (common for arms) have no rotation axis, any axis perpendicular to x does
+        cross = glm.cross(x_axis, vec)
+        axis = glm.normalize(cross) if glm.length(cross) > 1e-6 * dist else glm.vec3(0, 0, 1)
         R = glm.rotate(angle, axis)
         return dist, R
     
     def get_rest_nodes(self):
-        # create a hirarchical model - Node(parent, link_transform_from_parent, shape_transform)
-        nodes = []
-        end_nodes = []
-        for idx, joint in enumerate(self.data["Joints"]):
-            xoff, yoff, zoff = joint["offset"]
-
-            if joint["parent"] == None:         # ROOT
-                node = Node(None, glm.translate((0,0,0)), glm.scale((.01, .01, .01)))
-            else:
-                # for box rendering, box should be (parent's offset ~ current offset), along x-axis
-                # rotate local frame's x-axis to be equal orientation, with vector (current offset - parent's offset)
-                dist, R = self.get_box_transformation(xoff, yoff, zoff)
-                node = Node(nodes[joint["parent"]], glm.translate((xoff, yoff, zoff)), R * glm.translate((dist/2, 0, 0)) * glm.scale((dist/2, .03, .03)))
-            nodes.append(node)
-            if joint["endoffset"]:
-                xoff, yoff, zoff = joint["endoffset"]
-                dist, R = self.get_box_transformation(xoff, yoff, zoff)
-                node = Node(nodes[-1], glm.translate((xoff, yoff, zoff)), R * glm.translate((dist/2, 0, 0)) * glm.scale((dist/2, .03, .03)))
-                end_nodes.append(node)
-        # recursively update global transformations of all nodes
-        nodes += end_nodes
-        nodes[0].update_tree_global_transform()
+        # pose the node tree of build_nodes at rest (joints at their offsets, root at the origin), see get_nodes
+        for node, link_transform in zip(self.nodes, self.rest_link_transforms):
+            node.link_transform_from_parent = link_transform
+        self.nodes[0].update_tree_global_transform()
 
-        return nodes
\ No newline at end of file
+        return self.nodes
\ No newline at end of file
@@ -1,6 +1,10 @@
 import glm
+import numpy as np
 
 class Node:
+    # fixed attributes, no per-instance __dict__
+    __slots__ = ('parent', 'children', 'link_transform_from_parent', 'joint_transform', 'global_transform', 'shape_transform')
+
     def __init__(self, parent, link_transform_from_parent, shape_transform):
         # hierarchy
         self.parent = parent
@@ -20,15 +24,30 @@ class Node:
         self.joint_transform = joint_transform
 
     def update_tree_global_transform(self):
-        if self.parent is not None:
-            self.global_transform = self.parent.get_global_transform() * self.link_transform_from_parent * self.joint_transform
-        else:
-            self.global_transform = self.link_transform_from_parent * self.joint_transform
-
-        for child in self.children:
-            child.update_tree_global_transform()
+        # depth first with an explicit stack instead of recursion, so deep skeletons cannot hit the recursion limit;
+        # every node is updated after its parent
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.parent is not None:
+                node.global_transform = node.parent.global_transform * node.link_transform_from_parent * node.joint_transform
+            else:
+                node.global_transform = node.link_transform_from_parent * node.joint_transform
+            stack.extend(node.children)
 
     def get_global_transform(self):
         return self.global_transform
     def get_shape_transform(self):
-        return self.shape_transform
\ No newline at end of file
+        return self.shape_transform
+
+def get_bone_matrices(nodes):
+    # (num_nodes, 4, 4) array of the bone matrices the viewer draws each node's shape with (parent's global transform * shape transform), transposed so that points are row vectors
+    parent_globals = np.empty((len(nodes), 4, 4), dtype=np.float32)
+    shapes = np.empty((len(nodes), 4, 4), dtype=np.float32)
+    for i, node in enumerate(nodes):
+        # glm matrices are column-major, so their bytes read row-major are the transposed matrix
+        G = node.parent.get_global_transform() if node.parent else node.get_global_transform()
+        parent_globals[i] = np.frombuffer(G.to_bytes(), dtype=np.float32).reshape(4, 4)
+        shapes[i] = np.frombuffer(node.get_shape_transform().to_bytes(), dtype=np.float32).reshape(4, 4)
+    # (G * S)^T = S^T * G^T
+    return shapes @ parent_globals
@@ -0,0 +1,123 @@
+import numpy as np
+
+# Batched forward kinematics: local joint transforms of many frames at once, as (frames, joints, 4, 4) arrays of
+# column-vector matrices (glm's convention), turned into global transforms one hierarchy level at a time.
+
+def get_hierarchy_levels(parents):
+    # joint indices grouped by depth, roots first; parents[i] is the parent joint index of joint i (-1 for roots)
+    depths = np.zeros(len(parents), dtype=np.int64)
+    for i, parent in enumerate(parents):
+        # bvh joints are listed depth first, so every parent comes before its children
+        if parent >= 0:
+            depths[i] = depths[parent] + 1
+    return [np.flatnonzero(depths == depth) for depth in range(depths.max() + 1 if len(depths) else 0)]
+
+def get_axis_rotations(angles, axis):
+    # (..., 4, 4) rotations by angles (radians) about the x (0), y (1) or z (2) axis, same as glm.rotate(angle, axis)
+    c, s = np.cos(angles), np.sin(angles)
+    R = np.zeros(np.shape(angles) + (4, 4))
+    i, j = (axis + 1) % 3, (axis + 2) % 3
+    R[..., axis, axis] = 1
+    R[..., 3, 3] = 1
+    R[..., i, i] = c
+    R[..., j, j] = c
+    R[..., i, j] = -s
+    R[..., j, i] = s
+    return R
+
+def get_euler_rotations(angles, axes):
+    # (..., joints, 4, 4) rotations by (..., joints, n) Euler angles (radians) about the per-joint axes (joints, n) in channel order,
+    # R = R(axes[0]) @ R(axes[1]) @ ..., so any of the six rotation orders (XYZ, ZXY, ...) per joint; joints sharing an order are decoded together
+    axes = np.asarray(axes)
+    R = np.zeros(np.shape(angles)[:-1] + (4, 4))
+    R[..., [0, 1, 2, 3], [0, 1, 2, 3]] = 1
+    if axes.shape[-1] == 0:
+        return R
+    orders, groups = np.unique(axes, axis=0, return_inverse=True)
+    for group, order in enumerate(orders):
+        joints = np.flatnonzero(groups.ravel() == group)
+        R_order = get_axis_rotations(angles[..., joints, 0], order[0])
+        for k in range(1, len(order)):
+            R_order = R_order @ get_axis_rotations(angles[..., joints, k], order[k])
+        R[..., joints, :, :] = R_order
+    return R
+
+def get_translations(offsets):
+    # (..., 4, 4) translations by (..., 3) offsets
+    T = np.zeros(np.shape(offsets)[:-1] + (4, 4))
+    T[..., [0, 1, 2, 3], [0, 1, 2, 3]] = 1
+    T[..., :3, 3] = offsets
+    return T
+
+def forward_kinematics(local_transforms, parents, levels=None):
+    # (frames, joints, 4, 4) global transforms: global[child] = global[parent] @ local[child], one batched matmul per hierarchy level
+    parents = np.asarray(parents)
+    if levels is None:
+        levels = get_hierarchy_levels(parents)
+    global_transforms = np.empty_like(local_transforms)
+    for depth, joints in enumerate(levels):
+        if depth == 0:
+            global_transforms[:, joints] = local_transforms[:, joints]
+        else:
+            global_transforms[:, joints] = global_transforms[:, parents[joints]] @ local_transforms[:, joints]
+    return global_transforms
+
+def get_quaternions(R):
+    # (..., 4) unit quaternions (w, x, y, z) of the rotation part of (..., 4, 4) or (..., 3, 3) matrices
+    m = np.asarray(R)[..., :3, :3]
+    # P[i, j] = 4 q[i] q[j]: the diagonal from the trace and diagonal elements, the rest from sums and differences of the off-diagonal ones
+    P = np.empty(m.shape[:-2] + (4, 4))
+    P[..., 0, 0] = 1 + m[..., 0, 0] + m[..., 1, 1] + m[..., 2, 2]
+    P[..., 1, 1] = 1 + m[..., 0, 0] - m[..., 1, 1] - m[..., 2, 2]
+    P[..., 2, 2] = 1 - m[..., 0, 0] + m[..., 1, 1] - m[..., 2, 2]
+    P[..., 3, 3] = 1 - m[..., 0, 0] - m[..., 1, 1] + m[..., 2, 2]
+    P[..., 0, 1] = P[..., 1, 0] = m[..., 2, 1] - m[..., 1, 2]
+    P[..., 0, 2] = P[..., 2, 0] = m[..., 0, 2] - m[..., 2, 0]
+    P[..., 0, 3] = P[..., 3, 0] = m[..., 1, 0] - m[..., 0, 1]
+    P[..., 1, 2] = P[..., 2, 1] = m[..., 0, 1] + m[..., 1, 0]
+    P[..., 1, 3] = P[..., 3, 1] = m[..., 0, 2] + m[..., 2, 0]
+    P[..., 2, 3] = P[..., 3, 2] = m[..., 1, 2] + m[..., 2, 1]
+    # the row of the largest component divided by 4 |q[k]|, which is never close to 0 (Shepperd's method)
+    k = np.argmax(np.diagonal(P, axis1=-2, axis2=-1), axis=-1)[..., None, None]
+    row = np.take_along_axis(P, np.broadcast_to(k, P.shape[:-2] + (1, 4)), axis=-2)[..., 0, :]
+    q = row / (2 * np.sqrt(np.take_along_axis(row, k[..., 0], axis=-1)))
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+def get_rotation_matrices(q):
+    # (..., 4, 4) rotations of (..., 4) unit quaternions (w, x, y, z)
+    w, x, y, z = np.moveaxis(np.asarray(q), -1, 0)
+    R = np.zeros(np.shape(q)[:-1] + (4, 4))
+    R[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    R[..., 0, 1] = 2 * (x * y - w * z)
+    R[..., 0, 2] = 2 * (x * z + w * y)
+    R[..., 1, 0] = 2 * (x * y + w * z)
+    R[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    R[..., 1, 2] = 2 * (y * z - w * x)
+    R[..., 2, 0] = 2 * (x * z - w * y)
+    R[..., 2, 1] = 2 * (y * z + w * x)
+    R[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    R[..., 3, 3] = 1
+    return R
+
+def slerp(q0, q1, weights):
+    # (..., 4) spherical linear interpolation of unit quaternions, weights (...) from 0 (q0) to 1 (q1), along the shorter arc
+    weights = np.asarray(weights)[..., None]
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    # q and -q are the same rotation
+    q1 = np.where(dot < 0, -q1, q1)
+    angle = np.arccos(np.clip(np.abs(dot), 0, 1))
+    sin = np.sin(angle)
+    # nearly equal rotations: the linear weights, without dividing by ~0
+    close = sin < 1e-6
+    safe_sin = np.where(close, 1, sin)
+    w0 = np.where(close, 1 - weights, np.sin((1 - weights) * angle) / safe_sin)
+    w1 = np.where(close, weights, np.sin(weights * angle) / safe_sin)
+    q = w0 * q0 + w1 * q1
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+def nlerp(q0, q1, weights):
+    # (..., 4) normalized linear interpolation of unit quaternions, cheaper than slerp and close to it between neighbouring frames
+    weights = np.asarray(weights)[..., None]
+    q1 = np.where(np.sum(q0 * q1, axis=-1, keepdims=True) < 0, -q1, q1)
+    q = (1 - weights) * q0 + weights * q1
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
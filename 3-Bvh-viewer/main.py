@@ -2,15 +2,43 @@ from OpenGL.GL import *
 from glfw.GLFW import *
 import glm
 import numpy as np
+import os
+import sys
 
-from vao import prepare_vao_frame, prepare_vao_cube, prepare_vao_line
-from shader import load_shaders, g_vertex_shader_src, g_vertex_shader_src_normal, g_fragment_shader_src, g_fragment_shader_src_normal
+# shader.py and the other modules shared by every viewer live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vao import prepare_vao_frame, prepare_vao_grid, prepare_vao_cube, prepare_vao_line, prepare_vao_stream, stream_vertices, get_skeleton_line_vertices, get_skeleton_box_vertices, CUBE_INDICES
+from shader import load_shaders, g_program_cache, g_vertex_shader_src, g_vertex_shader_src_normal, g_vertex_shader_src_overlay, g_fragment_shader_src, g_fragment_shader_src_normal
 from bvh_loader import Character
+from asset_loader import AssetLoader
+from render_queue import CameraBuffer, RenderQueue
+from normal_matrix import get_normal_matrix
+from culling import cull_boxes
+from frame_pacer import FramePacer
+from profiler import Profiler
+
+WINDOW_TITLE = '2020057692'
+LINE_BOUNDS = np.array([(0., 0., 0.), (1., 0., 0.)])        # object space bounds of the bone shape of prepare_vao_line
+CUBE_BOUNDS = np.array([(-1., -1., -1.), (1., 1., 1.)])     # and of prepare_vao_cube
+MAX_ANIMATION_FPS = 60      # frame rate cap of animation playback, None for uncapped (bvh motions are also capped at their own frame rate)
+PROFILE_EXPORT_PATH = 'profile.csv'     # rolling export of the profiled frames, '.csv' or '.json' (None: no export)
 
 g_character = None
+g_loaded_characters = []    # every dropped character, in load order
+g_asset_loader = AssetLoader(Character, on_finished=glfwPostEmptyEvent)    # finished loads wake up the render loop waiting for events
+g_window_title = WINDOW_TITLE
+g_render_queue = RenderQueue()
 g_vao_node = None
 g_box_rendering_mode = True
 g_animate_mode = False
+g_batched_mode = True       # draw the whole skeleton from one streamed vertex buffer in a single call
+g_interpolation_mode = True # pose at the exact playback time, interpolated between bvh frames, instead of the last frame reached
+g_culling_enabled = True
+g_cull_counts = [0, 0]      # bones culled / drawn in the last frame
+g_render_on_demand = True   # redraw only on input, window events, loads and animation, instead of every loop iteration
+g_profiling_enabled = False
+g_profiler = Profiler(export_path=PROFILE_EXPORT_PATH)
 
 # Manage inputs
 g_mouse_left_down = False
@@ -48,7 +76,7 @@ def get_projection_matrix():
 
 # callbacks
 def key_callback(window, key, scancode, action, mods):
-    global g_is_orthogonal, g_box_rendering_mode, g_animate_mode
+    global g_is_orthogonal, g_box_rendering_mode, g_animate_mode, g_character, g_batched_mode, g_culling_enabled, g_render_on_demand, g_profiling_enabled, g_interpolation_mode
     if key==GLFW_KEY_ESCAPE and action==GLFW_PRESS:
         glfwSetWindowShouldClose(window, GLFW_TRUE);
     else:
@@ -61,6 +89,20 @@ def key_callback(window, key, scancode, action, mods):
                 g_box_rendering_mode = True
             if key==GLFW_KEY_SPACE:
                 g_animate_mode = True
+            if key==GLFW_KEY_B:
+                g_batched_mode = not g_batched_mode
+            if key==GLFW_KEY_I:
+                g_interpolation_mode = not g_interpolation_mode
+            if key==GLFW_KEY_F:
+                g_culling_enabled = not g_culling_enabled
+            if key==GLFW_KEY_O:
+                g_render_on_demand = not g_render_on_demand
+            if key==GLFW_KEY_P:
+                g_profiling_enabled = not g_profiling_enabled
+            if key==GLFW_KEY_TAB and g_loaded_characters:
+                # cycle through dropped characters
+                idx = next((i for i, character in enumerate(g_loaded_characters) if character is g_character), -1)
+                g_character = g_loaded_characters[(idx + 1) % len(g_loaded_characters)]
 
 def cursor_callback(window, xpos, ypos):
     global g_azimuth, g_elevation, g_pan_horizontal, g_pan_vertical, g_cam_up, g_cam_front, g_cam_target, g_x_orbit_in, g_y_orbit_in, g_x_pan_in, g_y_pan_in
@@ -105,69 +147,103 @@ def scroll_callback(window, xoffset, yoffset):
     g_zoom = max(g_zoom - yoffset * .1, 1.)
 
 def drag_and_drop_callback(window, paths):
+    # parse every dropped file in the background, the render loop picks them up when ready
+    for path in paths:
+        if not path.endswith('.bvh'):
+            print(f"Error: file extension must be (.bvh): {path}")
+            print("------------------------------------")
+            continue
+        g_asset_loader.submit(path)
+
+def activate_dropped_characters():
+    # returns whether any load finished, i.e. the frame needs a redraw
     global g_character, g_vao_node, g_animate_mode
-    if not paths[0].endswith('.bvh'):
-        print("Error: file extension must be (.bvh)")
-        print("------------------------------------")
-        return
-    g_animate_mode = False
-    g_character = Character(paths[0])
-    if g_box_rendering_mode:
-        g_vao_node = prepare_vao_cube()
+    finished = g_asset_loader.get_finished()
+    for path, character in finished:
+        if character is None or not character.num_frames:
+            continue
+        # show the most recently loaded character
+        g_animate_mode = False
+        g_character = character
+        g_loaded_characters.append(character)
+        if g_box_rendering_mode:
+            g_vao_node = prepare_vao_cube()
+        else:
+            g_vao_node = prepare_vao_line()
+    return bool(finished)
+
+def update_window_title(window):
+    global g_window_title
+    if g_asset_loader.num_pending:
+        title = f'{WINDOW_TITLE} - loading {g_asset_loader.num_pending} asset(s)'
     else:
-        g_vao_node = prepare_vao_line()
+        title = WINDOW_TITLE
+    # bones skipped by frustum culling in the last frame
+    num_culled, num_drawn = g_cull_counts
+    title += f' - culling {"on" if g_culling_enabled else "off"}: {num_culled} culled, {num_drawn} drawn'
+    g_cull_counts[:] = [0, 0]
+    # GL state changes the render queue issued and skipped in the last frame
+    title += f' - state changes: {g_render_queue.num_issued} issued, {g_render_queue.num_eliminated} eliminated'
+    # frame time breakdown averaged over the profiled frames
+    if g_profiler.enabled and g_profiler.frames:
+        title += f' - {g_profiler.get_title()}'
+    if title != g_window_title:
+        glfwSetWindowTitle(window, title)
+        g_window_title = title
 
 # draw functions
-def draw_center_frame(vao, MVP, MVP_loc):
-    glUniformMatrix4fv(MVP_loc, 1, GL_FALSE, glm.value_ptr(MVP))
-    glBindVertexArray(vao)
-    glDrawArrays(GL_LINES, 0, 4)
-
-def draw_frame_grid(vao, MVP, MVP_loc):
-    for i in range(-1000, 1000):
-        if i == 0:
-            continue
+def draw_center_frame(program, vao, M):
+    g_render_queue.submit(program, vao, lambda: glDrawArrays(GL_LINES, 0, 4), {'M': M})
 
-        T = glm.translate(glm.vec3(0.1*i, 0., 0.))
-        MVP_z = MVP*T
-        glUniformMatrix4fv(MVP_loc, 1, GL_FALSE, glm.value_ptr(MVP_z))
-        glBindVertexArray(vao)
-        glDrawArrays(GL_LINES, 2, 4)
-
-        T = glm.translate(glm.vec3(0., 0., 0.1*i))
-        MVP_x = MVP*T
-        glUniformMatrix4fv(MVP_loc, 1, GL_FALSE, glm.value_ptr(MVP_x))
-        glBindVertexArray(vao)
-        glDrawArrays(GL_LINES, 0, 2)
-
-def draw_line_node(vao, node, VP, MVP_loc):
-    # apply global transform to node's transform
-    if node.parent:
-        M = node.parent.get_global_transform() * node.get_shape_transform()
-    else:
-        M = node.get_global_transform() * node.get_shape_transform()
-    MVP = VP * M
+def draw_frame_grid(program, vao, vertex_count, M):
+    # the whole grid is a single vertex buffer, drawn in one call
+    g_render_queue.submit(program, vao, lambda: glDrawArrays(GL_LINES, 0, vertex_count), {'M': M})
+
+def draw_line_bone(program, vao, bone_matrix):
+    # bone_matrix: a row of get_bone_matrices (parent's global transform * shape transform, transposed), back to a glm matrix
+    M = glm.mat4(*bone_matrix.ravel())
 
-    # set uniform values
-    glUniformMatrix4fv(MVP_loc, 1, GL_FALSE, glm.value_ptr(MVP))
-    glBindVertexArray(vao)
-    glDrawArrays(GL_LINES, 0, 2)
+    g_render_queue.submit(program, vao, lambda: glDrawArrays(GL_LINES, 0, 2), {'M': M})
     
-def draw_cube_node(vao, node, VP, unif_locs):
-    # apply global transform to node's transform
-    if node.parent:
-        M = node.parent.get_global_transform() * node.get_shape_transform()
+def draw_cube_bone(program, vao, bone_matrix):
+    M = glm.mat4(*bone_matrix.ravel())
+    color = glm.vec3(1., 0., 0.)
+
+    g_render_queue.submit(program, vao, lambda: glDrawElements(GL_TRIANGLES, 36, GL_UNSIGNED_INT, None), {'M': M, 'N': get_normal_matrix(M), 'material_color': color}, tuple(color))
+
+def cull_bones(M, VP, bounds):
+    # bool mask of the bones (matrices of get_bone_matrices) whose shape bounds intersect the view frustum, tested all at once
+    if g_culling_enabled:
+        visible = cull_boxes(VP, M, bounds[0], bounds[1])
     else:
-        M = node.get_global_transform() * node.get_shape_transform()
-    MVP = VP * M
+        visible = np.ones(len(M), dtype=bool)
+    num_drawn = int(np.count_nonzero(visible))
+    g_cull_counts[0] += len(M) - num_drawn
+    g_cull_counts[1] += num_drawn
+    return visible
+
+def draw_skeleton_lines(program, vao, vbo, M):
+    # every bone's line of prepare_vao_line, transformed on the CPU by the bone matrices M, drawn in one call
+    if len(M) == 0:
+        return
+    vertices = get_skeleton_line_vertices(M)
+    stream_vertices(vbo, vertices)
+    g_profiler.count('bytes_uploaded', vertices.nbytes)
 
-    # set uniform values
-    glUniformMatrix4fv(unif_locs['M'], 1, GL_FALSE, glm.value_ptr(M))
-    glUniformMatrix4fv(unif_locs['MVP'], 1, GL_FALSE, glm.value_ptr(MVP))
-    glUniform3f(unif_locs['material_color'], 1., 0., 0.)
+    # vertices are already in world space
+    g_render_queue.submit(program, vao, lambda: glDrawArrays(GL_LINES, 0, 2 * len(M)), {'M': glm.mat4()})
 
-    glBindVertexArray(vao)
-    glDrawElements(GL_TRIANGLES, 36, GL_UNSIGNED_INT, None)
+def draw_skeleton_boxes(program, vao, vbo, M):
+    # every bone's cube of prepare_vao_cube, transformed on the CPU by the bone matrices M and unrolled into triangles, drawn in one call
+    if len(M) == 0:
+        return
+    vertices = get_skeleton_box_vertices(M)
+    stream_vertices(vbo, vertices)
+    g_profiler.count('bytes_uploaded', vertices.nbytes)
+
+    # vertices are already in world space
+    color = glm.vec3(1., 0., 0.)
+    g_render_queue.submit(program, vao, lambda: glDrawArrays(GL_TRIANGLES, 0, len(CUBE_INDICES) * len(M)), {'M': glm.mat4(), 'N': glm.mat3(), 'material_color': color}, tuple(color))
 
 # main function
 def main():
@@ -180,78 +256,127 @@ def main():
     glfwWindowHint(GLFW_OPENGL_FORWARD_COMPAT, GL_TRUE) # for macOS
 
     # create a window and OpenGL context
-    window = glfwCreateWindow(1600, 1600, '2020057692', None, None)
+    window = glfwCreateWindow(1600, 1600, WINDOW_TITLE, None, None)
     if not window:
         glfwTerminate()
         return
     glfwMakeContextCurrent(window)
 
+    # redraw only when input, window events, loads or the animation change the picture
+    pacer = FramePacer(window, MAX_ANIMATION_FPS)
+
     # register event callbacks
-    glfwSetKeyCallback(window, key_callback)
-    glfwSetCursorPosCallback(window, cursor_callback)
-    glfwSetMouseButtonCallback(window, button_callback)
-    glfwSetScrollCallback(window, scroll_callback)
-    glfwSetDropCallback(window, drag_and_drop_callback)
+    glfwSetKeyCallback(window, pacer.wrap(key_callback))
+    glfwSetCursorPosCallback(window, pacer.wrap(cursor_callback))
+    glfwSetMouseButtonCallback(window, pacer.wrap(button_callback))
+    glfwSetScrollCallback(window, pacer.wrap(scroll_callback))
+    glfwSetDropCallback(window, pacer.wrap(drag_and_drop_callback))
 
     # load shaders
     shader_for_frame = load_shaders(g_vertex_shader_src, g_fragment_shader_src)
     shader_for_cube = load_shaders(g_vertex_shader_src_normal, g_fragment_shader_src_normal)
+    shader_for_overlay = load_shaders(g_vertex_shader_src_overlay, g_fragment_shader_src)
+    g_program_cache.report()
 
-    # get uniform locations
-    MVP_loc_frame = glGetUniformLocation(shader_for_frame, 'MVP')
-    unif_names = ['MVP', 'M', 'view_pos', 'material_color']
-    unif_locs_cube = {}
-    for name in unif_names:
-        unif_locs_cube[name] = glGetUniformLocation(shader_for_cube, name)
+    # camera uniforms shared by every program
+    camera = CameraBuffer()
 
     # prepare vaos
     vao_center_frame = prepare_vao_frame(coordinate_axis=True)
-    vao_frame_grid = prepare_vao_frame(coordinate_axis=False)
+    vao_frame_grid, grid_vertex_count = prepare_vao_grid(1000, .1, 100.0)
+    vao_skeleton, vbo_skeleton = prepare_vao_stream()
 
     # loop until the user closes the window
     while not glfwWindowShouldClose(window):
-        # enable depth test (we'll see details later)
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glEnable(GL_DEPTH_TEST)
-
-        glUseProgram(shader_for_frame)
-
-        # projection & view matrix
-        P = get_projection_matrix()
-        view_pos, V = get_view_matrix()
-
-        M = glm.mat4()
-        draw_center_frame(vao_center_frame, P*V*M, MVP_loc_frame)
-        draw_frame_grid(vao_frame_grid, P*V*M, MVP_loc_frame)
-
-        if g_character:
-
-            if g_animate_mode:
-                t = glfwGetTime()
-                frame = int(t / g_character.frame_time) % g_character.num_frames
-                nodes = g_character.get_nodes(frame)
-            else:
-                nodes = g_character.get_rest_nodes()
+        pacer.on_demand = g_render_on_demand
+        g_profiler.set_enabled(g_profiling_enabled)
+        animating = g_animate_mode and g_character is not None
+        # without interpolation the pose changes only once per bvh frame, redrawing faster than the motion's frame rate shows nothing new
+        if animating and not g_interpolation_mode and g_character.frame_time > 0:
+            pacer.max_fps = min(MAX_ANIMATION_FPS or np.inf, 1 / g_character.frame_time)
+        else:
+            pacer.max_fps = MAX_ANIMATION_FPS
+
+        # a frame is profiled from here, so that picking up loads is part of the frame it is drawn in; canceled if nothing is drawn
+        g_profiler.begin_frame()
+
+        # pick up characters parsed in the background
+        with g_profiler.phase('load'):
+            activated = activate_dropped_characters()
+        if activated:
+            pacer.mark_dirty()
+
+        if pacer.should_draw(animating):
+            update_window_title(window)
+
+            # enable depth test (we'll see details later)
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            glEnable(GL_DEPTH_TEST)
+
+            # projection & view matrix
+            P = get_projection_matrix()
+            view_pos, V = get_view_matrix()
+            camera.update(P, V, view_pos)
+            g_profiler.count('bytes_uploaded', camera.SIZE)
+
+            M = glm.mat4()
+            draw_center_frame(shader_for_frame, vao_center_frame, M)
+            draw_frame_grid(shader_for_frame, vao_frame_grid, grid_vertex_count, M)
+
+            if g_character:
+
+                with g_profiler.phase('transforms'):
+                    if g_animate_mode:
+                        t = glfwGetTime()
+                        if g_interpolation_mode:
+                            # root position and joint rotations blended between the two bvh frames around t
+                            M = g_character.sample_bone_matrices(t)
+                        else:
+                            frame = int(t / g_character.frame_time) % g_character.num_frames
+                            # global transforms are computed for all frames at load time, playback only looks them up
+                            M = g_character.get_bone_matrices(frame)
+                    else:
+                        # the rest pose never changes, its bone matrices are computed once per character
+                        M = g_character.rest_bone_matrices
+
+                # skip bones outside the view frustum
+                with g_profiler.phase('cull'):
+                    visible = cull_bones(M, P*V, CUBE_BOUNDS if g_box_rendering_mode else LINE_BOUNDS)
             
-            if g_box_rendering_mode:
-                glUseProgram(shader_for_cube)
-                glUniform3f(unif_locs_cube['view_pos'], view_pos.x, view_pos.y, view_pos.z)
-
-                for node in nodes:
-                    draw_cube_node(g_vao_node, node, P*V, unif_locs_cube)
-            else:
-                glUseProgram(shader_for_frame)
-                
-                for node in nodes:
-                    draw_line_node(g_vao_node, node, P*V, MVP_loc_frame)
-
-        # swap front and back buffers
-        glfwSwapBuffers(window)
-
-        # poll events
-        glfwPollEvents()
+                with g_profiler.phase('submit'):
+                    if g_box_rendering_mode:
+                        if g_batched_mode:
+                            draw_skeleton_boxes(shader_for_cube, vao_skeleton, vbo_skeleton, M[visible])
+                        else:
+                            for bone_matrix in M[visible]:
+                                draw_cube_bone(shader_for_cube, g_vao_node, bone_matrix)
+                    else:
+                        if g_batched_mode:
+                            draw_skeleton_lines(shader_for_frame, vao_skeleton, vbo_skeleton, M[visible])
+                        else:
+                            for bone_matrix in M[visible]:
+                                draw_line_bone(shader_for_frame, g_vao_node, bone_matrix)
+
+            # issue the frame's draws sorted by program, VAO and material
+            with g_profiler.phase('flush'):
+                g_render_queue.flush()
+            g_profiler.count('draw_calls', g_render_queue.num_draws)
+            g_profiler.count('uniform_uploads', g_render_queue.num_uniform_uploads)
+            g_profiler.count('bytes_uploaded', g_render_queue.uniform_bytes)
+            g_profiler.draw_overlay(shader_for_overlay)
+
+            # swap front and back buffers
+            with g_profiler.phase('swap'):
+                glfwSwapBuffers(window)
+            g_profiler.end_frame()
+        else:
+            g_profiler.cancel_frame()
+
+        # wait for events, or poll them while animating
+        pacer.wait_events(animating)
 
     # terminate glfw
+    g_asset_loader.shutdown()
     glfwTerminate()
 
 if __name__ == "__main__":
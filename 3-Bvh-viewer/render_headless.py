@@ -0,0 +1,122 @@
+import argparse
+import os
+import sys
+import time
+
+import glm
+import numpy as np
+
+# shader.py and the other modules shared by every viewer live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bvh_loader import Character
+
+def get_camera(bone_matrices_list, aspect):
+    # (P, V, view_pos) looking at every bone position of the sampled poses from the viewer's default direction
+    positions = np.concatenate([M[:, 3, :3] for M in bone_matrices_list])
+    center = (positions.min(axis=0) + positions.max(axis=0)) / 2
+    radius = max(float(np.linalg.norm(positions - center, axis=1).max()), 1e-3) * 1.1
+    fov = glm.radians(45)
+    distance = radius / np.sin(min(fov, fov * aspect) / 2)
+
+    azimuth, elevation = np.radians(60), np.radians(30)
+    direction = glm.vec3(np.cos(elevation) * np.sin(azimuth), np.sin(elevation), np.cos(elevation) * np.cos(azimuth))
+    view_pos = glm.vec3(*center) + direction * distance
+    V = glm.lookAt(view_pos, glm.vec3(*center), glm.vec3(0, 1, 0))
+    P = glm.perspective(fov, aspect, max(distance - 2 * radius, distance * 1e-3), distance + 2 * radius)
+    return P, V, view_pos
+
+def render(args):
+    from OpenGL.GL import glClear, glEnable, glDrawArrays, GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_LINES, GL_TRIANGLES
+    from offscreen import OffscreenContext, PixelReader, write_png
+    from vao import prepare_vao_frame, prepare_vao_grid, prepare_vao_stream, stream_vertices, get_skeleton_line_vertices, get_skeleton_box_vertices, CUBE_INDICES
+    from shader import load_shaders, g_program_cache, g_vertex_shader_src, g_vertex_shader_src_normal, g_fragment_shader_src, g_fragment_shader_src_normal
+    from render_queue import CameraBuffer, RenderQueue
+
+    character = Character(args.filename)
+    if not character.num_frames:
+        return
+    fps = args.fps or 1 / character.frame_time
+    num_frames = args.frames or max(int(character.num_frames * character.frame_time * fps), 1)
+    def get_frame(i):
+        # animation frame shown at output frame i, played at a fixed timestep
+        return int(i / fps / character.frame_time) % character.num_frames
+
+    width, height = args.size
+    context = OffscreenContext(width, height)
+    shader_for_frame = load_shaders(g_vertex_shader_src, g_fragment_shader_src)
+    shader_for_cube = load_shaders(g_vertex_shader_src_normal, g_fragment_shader_src_normal)
+    g_program_cache.report()
+    camera = CameraBuffer()
+    render_queue = RenderQueue()
+    vao_center_frame = prepare_vao_frame(coordinate_axis=True)
+    vao_frame_grid, grid_vertex_count = prepare_vao_grid(1000, .1, 100.0)
+    vao_skeleton, vbo_skeleton = prepare_vao_stream()
+    reader = PixelReader(width, height)
+
+    # a fixed camera framing the poses of up to 32 evenly spaced output frames
+    sampled_frames = sorted({get_frame(i * num_frames // min(num_frames, 32)) for i in range(min(num_frames, 32))})
+    P, V, view_pos = get_camera([character.get_bone_matrices(frame) for frame in sampled_frames], width / height)
+    camera.update(P, V, view_pos)
+
+    os.makedirs(args.output, exist_ok=True)
+    glEnable(GL_DEPTH_TEST)
+    I = glm.mat4()
+    color = glm.vec3(1., 0., 0.)
+    start_time = time.perf_counter()
+    write_time = 0.
+    for i in range(num_frames):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        render_queue.submit(shader_for_frame, vao_center_frame, lambda: glDrawArrays(GL_LINES, 0, 4), {'M': I})
+        render_queue.submit(shader_for_frame, vao_frame_grid, lambda: glDrawArrays(GL_LINES, 0, grid_vertex_count), {'M': I})
+
+        # the whole skeleton from one streamed vertex buffer, as in the viewer's batched mode
+        if args.interpolate:
+            M = character.sample_bone_matrices(i / fps)
+        else:
+            M = character.get_bone_matrices(get_frame(i))
+        if args.lines:
+            stream_vertices(vbo_skeleton, get_skeleton_line_vertices(M))
+            render_queue.submit(shader_for_frame, vao_skeleton, lambda: glDrawArrays(GL_LINES, 0, 2 * len(M)), {'M': I})
+        else:
+            stream_vertices(vbo_skeleton, get_skeleton_box_vertices(M))
+            render_queue.submit(shader_for_cube, vao_skeleton, lambda: glDrawArrays(GL_TRIANGLES, 0, len(CUBE_INDICES) * len(M)),
+                                {'M': I, 'N': glm.mat3(), 'material_color': color}, tuple(color))
+        render_queue.flush()
+
+        # read this frame asynchronously, write the one whose readback has finished meanwhile
+        finished = reader.read(os.path.join(args.output, f'frame_{i:05d}.png'))
+        if finished:
+            write_start_time = time.perf_counter()
+            write_png(*finished)
+            write_time += time.perf_counter() - write_start_time
+    for finished in reader.finish():
+        write_start_time = time.perf_counter()
+        write_png(*finished)
+        write_time += time.perf_counter() - write_start_time
+    elapsed = time.perf_counter() - start_time
+
+    print(f'rendered {num_frames} frames of {width}x{height} to {args.output} in {elapsed:.3f} s ({num_frames / max(elapsed, 1e-9):.1f} fps), '
+          f'{write_time / max(elapsed, 1e-9) * 100:.0f}% of it writing images')
+    reader.delete()
+    context.destroy()
+
+def main():
+    parser = argparse.ArgumentParser(description='render a bvh animation to a png image sequence without a window')
+    parser.add_argument('filename')
+    parser.add_argument('--output', default='frames', help='directory of the image sequence')
+    parser.add_argument('--size', type=int, nargs=2, default=[1280, 720], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--fps', type=float, help='output frame rate, the bvh frame rate by default')
+    parser.add_argument('--frames', type=int, help='number of output frames, one pass through the animation by default')
+    parser.add_argument('--interpolate', action='store_true', help='pose at each output frame\'s exact time, interpolated between bvh frames')
+    parser.add_argument('--lines', action='store_true', help='line rendering instead of box rendering')
+    parser.add_argument('--platform', choices=['egl', 'osmesa'], default=os.environ.get('PYOPENGL_PLATFORM', 'egl'),
+                        help="offscreen context: 'egl' (GPU or software EGL) or 'osmesa' (software rasterizer)")
+    args = parser.parse_args()
+
+    # PyOpenGL picks its platform when it is first imported, so render() imports everything using OpenGL after choosing it
+    os.environ['PYOPENGL_PLATFORM'] = args.platform
+    render(args)
+
+if __name__ == "__main__":
+    main()
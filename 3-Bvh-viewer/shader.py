@@ -1,160 +0,0 @@
-from OpenGL.GL import *
-
-g_vertex_shader_src = '''
-#version 330 core
-
-layout (location = 0) in vec3 vin_pos; 
-layout (location = 1) in vec3 vin_color; 
-
-out vec4 vout_color;
-
-uniform mat4 MVP;
-
-void main()
-{
-    // 3D points in homogeneous coordinates
-    vec4 p3D_in_hcoord = vec4(vin_pos.xyz, 1.0);
-    
-    gl_Position = MVP * p3D_in_hcoord;
-    
-    vout_color = vec4(vin_color, 1.);
-}
-'''
-
-g_vertex_shader_src_normal = '''
-#version 330 core
-
-layout (location = 0) in vec3 vin_pos; 
-layout (location = 1) in vec3 vin_normal; 
-
-out vec3 vout_surface_pos;
-out vec3 vout_normal;
-
-uniform mat4 MVP;
-uniform mat4 M;
-
-void main()
-{
-    // 3D points in homogeneous coordinates
-    vec4 p3D_in_hcoord = vec4(vin_pos.xyz, 1.0);
-    gl_Position = MVP * p3D_in_hcoord;
-
-    vout_surface_pos = vec3(M * vec4(vin_pos, 1));
-    vout_normal = normalize( mat3(inverse(transpose(M)) ) * vin_normal);
-}
-'''
-
-g_fragment_shader_src = '''
-#version 330 core
-
-in vec4 vout_color;
-out vec4 FragColor;
-
-void main()
-{
-    FragColor = vout_color;
-}
-'''
-
-g_fragment_shader_src_normal = '''
-#version 330 core
-
-in vec3 vout_surface_pos;
-in vec3 vout_normal;
-
-out vec4 FragColor;
-
-uniform vec3 material_color;
-uniform vec3 view_pos;
-
-vec3 calculateLight(vec3 light_pos)
-{
-    // light and material properties
-    vec3 light_color = vec3(1,1,1);
-    float material_shininess = 32.0;
-
-    // light components
-    vec3 light_ambient = 0.4*light_color;
-    vec3 light_diffuse = light_color;
-    vec3 light_specular = light_color;
-
-    // material components
-    vec3 material_ambient = material_color;
-    vec3 material_diffuse = material_color;
-    vec3 material_specular = light_color;  // for non-metal material
-
-    // ambient
-    vec3 ambient = light_ambient * material_ambient;
-
-    // for diffiuse and specular
-    vec3 normal = normalize(vout_normal);
-    vec3 light_dir = normalize(light_pos - vout_surface_pos);
-
-    // diffuse
-    float diff = max(dot(normal, light_dir), 0);
-    vec3 diffuse = diff * light_diffuse * material_diffuse;
-
-    // specular
-    vec3 view_dir = normalize(view_pos - vout_surface_pos);
-    vec3 reflect_dir = reflect(-light_dir, normal);
-    float spec = pow( max(dot(view_dir, reflect_dir), 0.0), material_shininess);
-    vec3 specular = spec * light_specular * material_specular;
-
-    return (ambient + diffuse + specular);
-}
-
-void main()
-{
-    // make and apply multiple light sources
-    vec3 light_pos1 = vec3(20, 2, 4);
-    vec3 light_pos2 = vec3(-30, 4, -50);
-    
-    vec3 color = vec3(0., 0., 0.);
-    color += calculateLight(light_pos1);
-    color += calculateLight(light_pos2);
-    FragColor = vec4(color, 1.);
-}
-'''
-
-def load_shaders(vertex_shader_source, fragment_shader_source):
-    # build and compile our shader program
-    # ------------------------------------
-    
-    # vertex shader 
-    vertex_shader = glCreateShader(GL_VERTEX_SHADER)    # create an empty shader object
-    glShaderSource(vertex_shader, vertex_shader_source) # provide shader source code
-    glCompileShader(vertex_shader)                      # compile the shader object
-    
-    # check for shader compile errors
-    success = glGetShaderiv(vertex_shader, GL_COMPILE_STATUS)
-    if (not success):
-        infoLog = glGetShaderInfoLog(vertex_shader)
-        print("ERROR::SHADER::VERTEX::COMPILATION_FAILED\n" + infoLog.decode())
-        
-    # fragment shader
-    fragment_shader = glCreateShader(GL_FRAGMENT_SHADER)    # create an empty shader object
-    glShaderSource(fragment_shader, fragment_shader_source) # provide shader source code
-    glCompileShader(fragment_shader)                        # compile the shader object
-    
-    # check for shader compile errors
-    success = glGetShaderiv(fragment_shader, GL_COMPILE_STATUS)
-    if (not success):
-        infoLog = glGetShaderInfoLog(fragment_shader)
-        print("ERROR::SHADER::FRAGMENT::COMPILATION_FAILED\n" + infoLog.decode())
-
-    # link shaders
-    shader_program = glCreateProgram()               # create an empty program object
-    glAttachShader(shader_program, vertex_shader)    # attach the shader objects to the program object
-    glAttachShader(shader_program, fragment_shader)
-    glLinkProgram(shader_program)                    # link the program object
-
-    # check for linking errors
-    success = glGetProgramiv(shader_program, GL_LINK_STATUS)
-    if (not success):
-        infoLog = glGetProgramInfoLog(shader_program)
-        print("ERROR::SHADER::PROGRAM::LINKING_FAILED\n" + infoLog.decode())
-        
-    glDeleteShader(vertex_shader)
-    glDeleteShader(fragment_shader)
-
-    return shader_program    # return the shader program
\ No newline at end of file
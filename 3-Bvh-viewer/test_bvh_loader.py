@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pytest
+
+from bvh_loader import Character
+
+BVH_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bvh_files')
+
+# Expected poses of the fixtures, written out from their CHANNELS lines by hand: the motion column of every channel,
+# rotations composed in file order, position channels replacing the offset. Nothing here reads the channel table.
+
+def R(axis, degrees):
+    c, s = np.cos(np.radians(degrees)), np.sin(np.radians(degrees))
+    M = np.eye(4)
+    if axis == 'X':
+        M[1:3, 1:3] = [[c, -s], [s, c]]
+    elif axis == 'Y':
+        M[0, 0], M[0, 2], M[2, 0], M[2, 2] = c, s, -s, c
+    else:
+        M[0:2, 0:2] = [[c, -s], [s, c]]
+    return M
+
+def T(x, y, z):
+    M = np.eye(4)
+    M[:3, 3] = x, y, z
+    return M
+
+def mixed_channels_pose(m):
+    # (joint name, parent name, local transform) of bvh_files/mixed_channels.bvh for motion row m
+    return [
+        # root: rotations before positions, the positions replace the offset (0, 90, 0)
+        ('Hips', None, T(m[3], m[4], m[5]) @ R('Z', m[0]) @ R('X', m[1]) @ R('Y', m[2])),
+        # 6 channels on a non-root joint
+        ('Spine', 'Hips', T(m[6], m[7], m[8]) @ R('X', m[9]) @ R('Y', m[10]) @ R('Z', m[11])),
+        ('Neck', 'Spine', T(0, 12, 1) @ R('X', m[12]) @ R('Z', m[13]) @ R('Y', m[14])),
+        ('Head', 'Neck', T(0, 6, 0) @ R('Y', m[15]) @ R('X', m[16]) @ R('Z', m[17])),
+        # CHANNELS 0
+        ('LeftShoulder', 'Spine', T(4, 10, 0)),
+        ('LeftArm', 'LeftShoulder', T(8, 0, 0) @ R('Y', m[18]) @ R('Z', m[19]) @ R('X', m[20])),
+        # CHANNELS 1
+        ('LeftForeArm', 'LeftArm', T(14, 0, 0) @ R('Y', m[21])),
+        ('LeftUpLeg', 'Hips', T(5, -3, 0) @ R('Z', m[22]) @ R('Y', m[23]) @ R('X', m[24])),
+        # CHANNELS 2
+        ('LeftLeg', 'LeftUpLeg', T(0, -20, 0) @ R('X', m[25]) @ R('Z', m[26])),
+        ('RightUpLeg', 'Hips', T(-5, -3, 0) @ R('Z', m[27]) @ R('X', m[28]) @ R('Y', m[29])),
+        # one position channel, the other axes keep the offset
+        ('RightLeg', 'RightUpLeg', T(0, m[30], 0) @ R('Z', m[31]) @ R('X', m[32]) @ R('Y', m[33])),
+    ]
+
+def root_without_position_pose(m):
+    return [
+        # no position channels: the root stays at its offset
+        ('Pelvis', None, T(1, 50, -2) @ R('Y', m[0]) @ R('X', m[1]) @ R('Z', m[2])),
+        ('Chest', 'Pelvis', T(0, 15, 0) @ R('X', m[3]) @ R('Y', m[4]) @ R('Z', m[5])),
+        ('Tail', 'Pelvis', T(0, -2, -8) @ R('Z', m[6]) @ R('Y', m[7]) @ R('X', m[8])),
+    ]
+
+POSES = {'mixed_channels.bvh': (mixed_channels_pose, 34), 'root_without_position.bvh': (root_without_position_pose, 9)}
+
+def get_expected_globals(pose):
+    globals_ = {}
+    for name, parent, local in pose:
+        globals_[name] = local if parent is None else globals_[parent] @ local
+    return [globals_[name] for name, _, _ in pose]
+
+@pytest.mark.parametrize('filename', sorted(POSES))
+def test_channel_layout(filename):
+    get_pose, num_channels = POSES[filename]
+    character = Character(os.path.join(BVH_FILES, filename))
+    motions = character.data["Motions"].astype(np.float64)
+    assert motions.shape == (character.num_frames, num_channels)
+    assert character.joints == [name for name, _, _ in get_pose(motions[0])]
+
+    for frame, m in enumerate(motions):
+        pose = get_pose(m)
+        expected_locals = np.stack([local for _, _, local in pose])
+        expected_globals = np.stack(get_expected_globals(pose))
+
+        # batched decoding: local transforms, and the precomputed global transforms (stored transposed)
+        assert np.allclose(character.get_local_transforms(motions[frame:frame + 1])[0], expected_locals, atol=1e-4)
+        assert np.allclose(character.get_global_transforms(frame).transpose(0, 2, 1), expected_globals, atol=1e-3)
+
+        # per-frame node tree: glm matrices are column-major, their list of columns is the transposed matrix
+        nodes = character.get_nodes(frame)
+        links = np.stack([np.array(node.link_transform_from_parent.to_list()).T for node in nodes[:len(pose)]])
+        assert np.allclose(links, expected_locals, atol=1e-4)
+        node_globals = np.stack([np.array(node.get_global_transform().to_list()).T for node in nodes[:len(pose)]])
+        assert np.allclose(node_globals, expected_globals, atol=1e-3)
+
+def test_rotation_orders():
+    character = Character(os.path.join(BVH_FILES, 'mixed_channels.bvh'))
+    assert character.data["Channels"]["orders"] == ['ZXY', 'XYZ', 'XZY', 'YXZ', '', 'YZX', 'Y', 'ZYX', 'XZ', 'ZXY', 'ZXY']
@@ -0,0 +1,108 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+import bvh_loader
+from bvh_loader import Character
+from hierarchy import get_bone_matrices
+from kinematics import get_rotation_matrices, nlerp, slerp
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bvh_files', '*.bvh')))
+
+def assert_matches_nodes(character):
+    # batched forward kinematics against the Node tree posed per frame, for every frame
+    for frame in range(character.num_frames):
+        expected = get_bone_matrices(character.get_nodes(frame))
+        assert np.allclose(character.get_bone_matrices(frame), expected, rtol=1e-5, atol=1e-4), f'frame {frame}'
+
+@pytest.mark.parametrize('filename', FIXTURES, ids=os.path.basename)
+def test_precomputed_matches_nodes(filename):
+    character = Character(filename)
+    assert character.global_transforms is not None
+    assert_matches_nodes(character)
+
+@pytest.mark.parametrize('filename', FIXTURES, ids=os.path.basename)
+def test_chunked_matches_nodes(filename, monkeypatch):
+    # motions over the cache budget are computed per chunk on demand; chunks smaller than the motion cross chunk boundaries
+    monkeypatch.setattr(bvh_loader, 'FK_CACHE_MAX_BYTES', 0)
+    monkeypatch.setattr(bvh_loader, 'FK_CHUNK_FRAMES', 3)
+    character = Character(filename)
+    assert character.global_transforms is None
+    assert_matches_nodes(character)
+
+# a root turning by 90 degrees around z and moving by (2, 4, 6) from the first frame to the second, with a child at (0, 10, 0)
+TURN = '''HIERARCHY
+ROOT Root
+{
+  OFFSET 0.00 0.00 0.00
+  CHANNELS 6 Xposition Yposition Zposition Zrotation Xrotation Yrotation
+  JOINT Child
+  {
+    OFFSET 0.00 10.00 0.00
+    CHANNELS 3 Zrotation Xrotation Yrotation
+    End Site
+    {
+      OFFSET 0.00 5.00 0.00
+    }
+  }
+}
+MOTION
+Frames: 2
+Frame Time: 0.5
+0 0 0 0 0 0 0 0 0
+2 4 6 90 0 0 0 0 0
+'''
+
+@pytest.mark.parametrize('filename', FIXTURES, ids=os.path.basename)
+def test_sampling_at_frame_times(filename):
+    character = Character(filename)
+    frames = np.arange(character.num_frames)
+    G = character.sample_global_transforms(frames * character.frame_time)
+    for frame in frames:
+        assert np.allclose(G[frame], character.get_global_transforms(frame), rtol=1e-5, atol=1e-3), f'frame {frame}'
+        assert np.allclose(character.sample_bone_matrices(frame * character.frame_time), character.get_bone_matrices(frame), rtol=1e-5, atol=1e-3)
+
+def rotation_z(degrees):
+    R = np.eye(4)
+    c, s = np.cos(np.radians(degrees)), np.sin(np.radians(degrees))
+    R[:2, :2] = [[c, -s], [s, c]]
+    return R
+
+@pytest.mark.parametrize('interpolation', ['slerp', 'nlerp'])
+def test_sampling_interpolates(tmp_path, interpolation):
+    path = tmp_path / 'turn.bvh'
+    path.write_text(TURN)
+    character = Character(str(path))
+    interpolate = slerp if interpolation == 'slerp' else nlerp
+    # identity and the rotation by 90 degrees around z, as (w, x, y, z)
+    q0, q1 = np.array([1., 0, 0, 0]), np.array([np.cos(np.pi / 4), 0, 0, np.sin(np.pi / 4)])
+
+    for weight in (.5, .25):
+        # root: its position interpolated linearly, its rotation by the quaternion interpolation; the child turns with it
+        root = get_rotation_matrices(interpolate(q0, q1, weight))
+        root[:3, 3] = weight * np.array([2, 4, 6])
+        child = root.copy()
+        child[:3, 3] += root[:3, :3] @ [0, 10, 0]
+        G = character.sample_global_transforms(weight * character.frame_time, interpolation)[0]
+        assert np.allclose(G[0].T, root, atol=1e-5) and np.allclose(G[1].T, child, atol=1e-4)
+
+    # halfway both interpolations give the rotation by 45 degrees; elsewhere only slerp keeps the angular velocity constant
+    assert np.allclose(get_rotation_matrices(interpolate(q0, q1, .5)), rotation_z(45))
+    assert np.allclose(get_rotation_matrices(interpolate(q0, q1, .25)), rotation_z(22.5)) == (interpolation == 'slerp')
+
+def test_sampling_wraps_around():
+    character = Character(FIXTURES[0])
+    duration = character.num_frames * character.frame_time
+    times = np.linspace(0, duration, 7, endpoint=False) + .1 * character.frame_time
+    reference = character.sample_global_transforms(times)
+    for loops in (-2, -1, 1, 3):
+        assert np.allclose(character.sample_global_transforms(times + loops * duration), reference, atol=1e-3), f'{loops} loops'
+
+    # one frame before the start is the last frame, one frame after the end the second one
+    assert np.allclose(character.sample_global_transforms(-character.frame_time)[0], character.get_global_transforms(character.num_frames - 1), atol=1e-3)
+    assert np.allclose(character.sample_global_transforms(duration + character.frame_time)[0], character.get_global_transforms(1), atol=1e-3)
+    # between the last frame and the restart, the last frame is held
+    last = character.sample_global_transforms(duration - .5 * character.frame_time)[0]
+    assert np.allclose(last, character.get_global_transforms(character.num_frames - 1), atol=1e-3)
@@ -1,7 +1,10 @@
 from OpenGL.GL import *
 import glm
+import numpy as np
 import ctypes
 
+from normal_matrix import get_normal_matrices
+
 def prepare_vao_frame(coordinate_axis=False):
     # prepare vertex data (in main memory)
     if coordinate_axis:
@@ -42,37 +45,88 @@ def prepare_vao_frame(coordinate_axis=False):
 
     return VAO
 
+def prepare_vao_grid(num_lines, spacing, half_length):
+    # prepare vertex data (in main memory): grey lines parallel to the z and x axes at spacing * i for i in [-num_lines, num_lines) except 0,
+    # each reaching half_length to both sides, so the whole grid is drawn with a single draw call
+    offsets = spacing * np.array([i for i in range(-num_lines, num_lines) if i != 0], dtype=np.float32)
+    vertices = np.zeros((2, len(offsets), 2, 6), dtype=np.float32)
+    vertices[0, :, :, 0] = offsets[:, None]                 # lines along the z-axis
+    vertices[0, :, :, 2] = [-half_length, half_length]
+    vertices[1, :, :, 0] = [-half_length, half_length]      # lines along the x-axis
+    vertices[1, :, :, 2] = offsets[:, None]
+    vertices[..., 3:] = 0.4
+
+    # create and activate VAO (vertex array object)
+    VAO = glGenVertexArrays(1)  # create a vertex array object ID and store it to VAO variable
+    glBindVertexArray(VAO)      # activate VAO
+
+    # create and activate VBO (vertex buffer object)
+    VBO = glGenBuffers(1)   # create a buffer object ID and store it to VBO variable
+    glBindBuffer(GL_ARRAY_BUFFER, VBO)  # activate VBO as a vertex buffer object
+
+    # copy vertex data to VBO
+    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, ctypes.c_void_p(vertices.ctypes.data), GL_STATIC_DRAW) # allocate GPU memory for and copy vertex data to the currently bound vertex buffer
+
+    # configure vertex positions
+    glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), None)
+    glEnableVertexAttribArray(0)
+
+    # configure vertex colors
+    glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), ctypes.c_void_p(3*glm.sizeof(glm.float32)))
+    glEnableVertexAttribArray(1)
+
+    # vertex count drawn with GL_LINES
+    return VAO, vertices.size // 6
+
+# unit cube drawn for every bone in box mode: 8 vertices (position, normal), 12 triangles
+CUBE_VERTICES = np.array([
+    # position      normal
+    -1 ,  1 ,  1 , -0.577 ,  0.577,  0.577, # v0
+     1 ,  1 ,  1 ,  0.816 ,  0.408,  0.408, # v1
+     1 , -1 ,  1 ,  0.408 , -0.408,  0.816, # v2
+    -1 , -1 ,  1 , -0.408 , -0.816,  0.408, # v3
+    -1 ,  1 , -1 , -0.408 ,  0.408, -0.816, # v4
+     1 ,  1 , -1 ,  0.408 ,  0.816, -0.408, # v5
+     1 , -1 , -1 ,  0.577 , -0.577, -0.577, # v6
+    -1 , -1 , -1 , -0.816 , -0.408, -0.408, # v7
+], dtype=np.float32).reshape(-1, 6)
+CUBE_INDICES = np.array([
+    0,2,1,
+    0,3,2,
+    4,5,6,
+    4,6,7,
+    0,1,5,
+    0,5,4,
+    3,6,2,
+    3,7,6,
+    1,2,6,
+    1,6,5,
+    0,7,3,
+    0,4,7,
+], dtype=np.uint32)
+
+def get_skeleton_line_vertices(M):
+    # (position, color) vertices of every bone's line of prepare_vao_line, transformed by the bone matrices M (see get_bone_matrices)
+    vertices = np.empty((len(M), 2, 6), dtype=np.float32)
+    vertices[:, 0, :3] = M[:, 3, :3]                # (0, 0, 0) -> translation
+    vertices[:, 1, :3] = M[:, 0, :3] + M[:, 3, :3]  # (1, 0, 0)
+    vertices[:, :, 3:] = (1., 0., 0.)
+    return vertices
+
+def get_skeleton_box_vertices(M):
+    # (position, normal) vertices of every bone's cube of prepare_vao_cube, transformed by the bone matrices M and unrolled into triangles
+    positions = CUBE_VERTICES[:, :3] @ M[:, :3, :3] + M[:, 3:, :3]
+    # normals transform with the normal matrix, as in draw_cube_node
+    normals = CUBE_VERTICES[:, 3:] @ get_normal_matrices(M)
+    normals /= np.linalg.norm(normals, axis=2, keepdims=True)
+    return np.concatenate([positions, normals], axis=2)[:, CUBE_INDICES].astype(np.float32)
+
 def prepare_vao_cube():
     # prepare vertex data (in main memory)
-    # 8 vertices
-    vertices = glm.array(glm.float32,
-        # position      normal
-        -1 ,  1 ,  1 , -0.577 ,  0.577,  0.577, # v0
-         1 ,  1 ,  1 ,  0.816 ,  0.408,  0.408, # v1
-         1 , -1 ,  1 ,  0.408 , -0.408,  0.816, # v2
-        -1 , -1 ,  1 , -0.408 , -0.816,  0.408, # v3
-        -1 ,  1 , -1 , -0.408 ,  0.408, -0.816, # v4
-         1 ,  1 , -1 ,  0.408 ,  0.816, -0.408, # v5
-         1 , -1 , -1 ,  0.577 , -0.577, -0.577, # v6
-        -1 , -1 , -1 , -0.816 , -0.408, -0.408, # v7
-    )
+    vertices = CUBE_VERTICES
 
     # prepare index data
-    # 12 triangles
-    indices = glm.array(glm.uint32,
-        0,2,1,
-        0,3,2,
-        4,5,6,
-        4,6,7,
-        0,1,5,
-        0,5,4,
-        3,6,2,
-        3,7,6,
-        1,2,6,
-        1,6,5,
-        0,7,3,
-        0,4,7,
-    )
+    indices = CUBE_INDICES
 
     # create and activate VAO (vertex array object)
     VAO = glGenVertexArrays(1)  # create a vertex array object ID and store it to VAO variable
@@ -87,10 +141,10 @@ def prepare_vao_cube():
     glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, EBO)  # activate EBO as an element buffer object
 
     # copy vertex data to VBO
-    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices.ptr, GL_STATIC_DRAW) # allocate GPU memory for and copy vertex data to the currently bound vertex buffer
+    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, ctypes.c_void_p(vertices.ctypes.data), GL_STATIC_DRAW) # allocate GPU memory for and copy vertex data to the currently bound vertex buffer
 
     # copy index data to EBO
-    glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices.ptr, GL_STATIC_DRAW) # allocate GPU memory for and copy index data to the currently bound element buffer
+    glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, ctypes.c_void_p(indices.ctypes.data), GL_STATIC_DRAW) # allocate GPU memory for and copy index data to the currently bound element buffer
 
     # configure vertex positions
     glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), None)
@@ -128,4 +182,31 @@ def prepare_vao_line():
     glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), ctypes.c_void_p(3*glm.sizeof(glm.float32)))
     glEnableVertexAttribArray(1)
 
-    return VAO
\ No newline at end of file
+    return VAO
+
+def prepare_vao_stream():
+    # VAO over a vertex buffer refilled every frame: (position, color or normal) float32 vertices
+    # create and activate VAO (vertex array object)
+    VAO = glGenVertexArrays(1)  # create a vertex array object ID and store it to VAO variable
+    glBindVertexArray(VAO)      # activate VAO
+
+    # create and activate VBO (vertex buffer object), its storage is allocated by stream_vertices
+    VBO = glGenBuffers(1)   # create a buffer object ID and store it to VBO variable
+    glBindBuffer(GL_ARRAY_BUFFER, VBO)  # activate VBO as a vertex buffer object
+
+    # configure vertex positions
+    glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), None)
+    glEnableVertexAttribArray(0)
+
+    # configure vertex colors / normals
+    glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 6 * glm.sizeof(glm.float32), ctypes.c_void_p(3*glm.sizeof(glm.float32)))
+    glEnableVertexAttribArray(1)
+
+    return VAO, VBO
+
+def stream_vertices(VBO, vertices):
+    # replace the contents of a streamed VBO; re-specifying the storage (orphaning) lets the driver
+    # hand out fresh memory instead of waiting for draws of the previous frame still reading the old one
+    glBindBuffer(GL_ARRAY_BUFFER, VBO)
+    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, None, GL_STREAM_DRAW)
+    glBufferSubData(GL_ARRAY_BUFFER, 0, vertices.nbytes, ctypes.c_void_p(vertices.ctypes.data))
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
+
+class AssetLoader:
+    def __init__(self, load_asset, max_workers=None, on_finished=None):
+        # parse assets in a worker pool, and hand them back to the render thread through a queue
+        # on_finished is called on the worker thread after each asset, e.g. glfwPostEmptyEvent to wake up a waiting render loop
+        self.load_asset = load_asset
+        self.on_finished = on_finished
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(8, os.cpu_count() or 1), thread_name_prefix='asset_loader')
+        self.finished = queue.Queue()
+        self.num_pending = 0
+
+    def submit(self, path):
+        self.num_pending += 1
+        self.executor.submit(self._load, path)
+
+    def _load(self, path):
+        # runs on a worker thread: CPU-side parsing only, no GL calls
+        try:
+            asset = self.load_asset(path)
+        except Exception as e:
+            print(f"Error: Could not load file {path} ({e})")
+            asset = None
+        self.finished.put((path, asset))
+        if self.on_finished:
+            self.on_finished()
+
+    def get_finished(self):
+        # (path, asset) of every asset parsed since the last call, without blocking (asset is None on failure)
+        finished = []
+        while True:
+            try:
+                finished.append(self.finished.get_nowait())
+            except queue.Empty:
+                break
+        self.num_pending -= len(finished)
+        return finished
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
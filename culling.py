@@ -0,0 +1,39 @@
+import numpy as np
+
+def get_frustum_planes(VP):
+    # (6, 4) planes (a, b, c, d) of the view frustum, a*x + b*y + c*z + d >= 0 inside, with unit length normals (a, b, c):
+    # left, right, bottom, top, near, far, from the rows of VP (-w <= x, y, z <= w in clip space)
+    # glm matrices are column-major, so their bytes read row-major are the transposed matrix
+    m = np.frombuffer(VP.to_bytes(), dtype=np.float32).reshape(4, 4).T.astype(np.float64)
+    planes = np.array([m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]])
+    return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+def get_world_bounds(matrices, lower, upper, radii=None):
+    # world space bounds of object space boxes (lower, upper) drawn with model matrices, all at once:
+    # (centers, half extents) of the axis-aligned boxes enclosing the transformed boxes, and radii of spheres around the same centers
+    # matrices: (n, 4, 4) in the memory order of glm (M[i] is column i), lower / upper: (n, 3) or (3,),
+    # radii: (n,) object space radii of bounding spheres around the box centers, half the box diagonals if None
+    A, t = matrices[:, :3, :3], matrices[:, 3, :3]
+    center = np.broadcast_to((np.asarray(lower) + upper) / 2, t.shape)
+    half_extent = np.broadcast_to((np.asarray(upper) - lower) / 2, t.shape)
+    world_centers = np.einsum('ni,nij->nj', center, A) + t
+    world_half_extents = np.einsum('ni,nij->nj', half_extent, np.abs(A))
+    # the spectral norm of A (its largest singular value) is how much it stretches any direction, shears included;
+    # row or column lengths can fall short of it, and an underestimated sphere would cull visible meshes
+    if radii is None:
+        radii = np.linalg.norm(half_extent, axis=1)
+    radii = radii * np.linalg.norm(A, 2, axis=(1, 2))
+    return world_centers, world_half_extents, radii
+
+def get_visible(planes, centers, half_extents, radii):
+    # bool mask of the bounds not entirely outside one of the planes; both tests are conservative, so either may reject
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    inside_spheres = np.all(distances >= -radii[:, None], axis=1)
+    inside_boxes = np.all(distances >= -(half_extents @ np.abs(planes[:, :3]).T), axis=1)
+    return inside_spheres & inside_boxes
+
+def cull_boxes(VP, matrices, lower, upper, radii=None):
+    # visibility of object space bounds drawn with model matrices ((n, 4, 4), glm memory order) through the camera VP
+    if len(matrices) == 0:
+        return np.zeros(0, dtype=bool)
+    return get_visible(get_frustum_planes(VP), *get_world_bounds(np.asarray(matrices, dtype=np.float64), lower, upper, radii))
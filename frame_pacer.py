@@ -0,0 +1,57 @@
+from glfw.GLFW import *
+import time
+
+IDLE_TIMEOUT = 1.       # longest sleep in glfwWaitEventsTimeout while nothing changes, in seconds
+
+class FramePacer:
+    # render on demand: frames are drawn only when marked dirty (input, window events, finished loads) or while an animation plays,
+    # otherwise the main loop sleeps in glfwWaitEventsTimeout instead of redrawing an unchanged scene in a tight loop.
+    # animation playback is capped at max_fps frames per second (None: as fast as the loop runs)
+    def __init__(self, window, max_fps=None, on_demand=True):
+        self.max_fps = max_fps
+        self.on_demand = on_demand
+        self.dirty = True
+        self.next_frame_time = 0.
+
+        # window events changing what is on screen
+        glfwSetWindowRefreshCallback(window, lambda window: self.mark_dirty())
+        glfwSetFramebufferSizeCallback(window, lambda window, width, height: self.mark_dirty())
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def wrap(self, callback):
+        # input callback that also marks the frame dirty
+        def wrapped(*args):
+            self.dirty = True
+            callback(*args)
+        return wrapped
+
+    def get_frame_interval(self):
+        return 1. / self.max_fps if self.max_fps else 0.
+
+    def should_draw(self, animating):
+        # whether to draw a frame in this loop iteration; without render on demand every frame is drawn, up to max_fps
+        now = time.perf_counter()
+        if self.dirty or ((animating or not self.on_demand) and now >= self.next_frame_time):
+            self.dirty = False
+            # schedule the next animation frame one interval later, without catching up on frames missed while busy
+            self.next_frame_time += self.get_frame_interval()
+            if self.next_frame_time < now:
+                self.next_frame_time = now + self.get_frame_interval()
+            return True
+        return False
+
+    def wait_events(self, animating):
+        # process pending events, sleeping until the next frame is due or an event arrives
+        if self.dirty:
+            glfwPollEvents()
+            return
+        if animating or not self.on_demand:
+            timeout = self.next_frame_time - time.perf_counter()
+        else:
+            timeout = IDLE_TIMEOUT
+        if timeout > 0:
+            glfwWaitEventsTimeout(timeout)
+        else:
+            glfwPollEvents()
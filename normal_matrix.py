@@ -0,0 +1,38 @@
+import glm
+import numpy as np
+
+RIGID_TOLERANCE = 1e-4  # relative deviation of M^T M from s^2 I up to which M counts as rigid (rotation, translation, uniform scale)
+
+# Normal matrices are only used for directions the shaders normalize, so any positive multiple of
+# inverse(transpose(M)) works: the upper 3x3 of M itself for rigid transforms, the cofactor matrix otherwise
+# (= inverse(transpose(M)) * det(M), flipped when det(M) < 0 so normals keep pointing outwards).
+
+def get_normal_matrix(M, rigid=False):
+    # glm.mat3 transforming the object space normals of a mesh drawn with model matrix M; callers that know M is rigid skip the inverse
+    # (testing for rigidity per matrix in python costs more than glm's inverse, get_normal_matrices tests whole batches)
+    if rigid:
+        return glm.mat3(M)
+    return glm.inverseTranspose(glm.mat3(M))
+
+def get_normal_matrices(matrices):
+    # batched get_normal_matrix: (n, 4, 4) or (n, 3, 3) float array -> (n, 3, 3) float32 array,
+    # in the memory order of glm (M[i] is column i), so the result can be uploaded as is
+    # columns and their components along the leading axes, so every operation below runs over all n matrices at once
+    a = np.ascontiguousarray(np.asarray(matrices, dtype=np.float32)[:, :3, :3].transpose(1, 2, 0))
+    result = np.empty((3, 3, a.shape[2]), dtype=np.float32)
+    for i in range(3):
+        j, k = (i + 1) % 3, (i + 2) % 3
+        result[i] = a[j, [1, 2, 0]] * a[k, [2, 0, 1]] - a[j, [2, 0, 1]] * a[k, [1, 2, 0]]     # cross(column j, column k)
+    det = np.sum(a[0] * result[0], axis=0)
+    result[:, :, det < 0] *= -1
+
+    # rigid: the columns are orthogonal and of equal length s, so M^T M = s^2 I
+    squared_lengths = np.sum(a * a, axis=1)
+    s2 = np.mean(squared_lengths, axis=0)
+    tolerance = RIGID_TOLERANCE * s2
+    rigid = np.all(np.abs(squared_lengths - s2) <= tolerance, axis=0)
+    for i in range(3):
+        j = (i + 1) % 3
+        rigid &= np.abs(np.sum(a[i] * a[j], axis=0)) <= tolerance
+    result[:, :, rigid] = a[:, :, rigid]
+    return result.transpose(2, 0, 1)
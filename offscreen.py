@@ -0,0 +1,143 @@
+from OpenGL.GL import *
+import numpy as np
+import ctypes
+import os
+import struct
+import zlib
+
+# Offscreen rendering without a window system. PyOpenGL picks its platform when it is first imported,
+# so entry points set PYOPENGL_PLATFORM ('egl': GPU or Mesa's software EGL, 'osmesa': Mesa's software rasterizer)
+# before importing this module or any other one using OpenGL.
+
+class OffscreenContext:
+    def __init__(self, width, height):
+        # OpenGL 3.3 core profile context of the current PYOPENGL_PLATFORM, rendering into a width x height framebuffer object
+        self.width, self.height = width, height
+        self.platform = os.environ.get('PYOPENGL_PLATFORM')
+        if self.platform == 'egl':
+            self._create_egl_context()
+        elif self.platform == 'osmesa':
+            self._create_osmesa_context()
+        else:
+            raise RuntimeError(f"PYOPENGL_PLATFORM must be 'egl' or 'osmesa', not {self.platform}")
+        print(f'offscreen context: {self.platform}, {glGetString(GL_RENDERER).decode()}, OpenGL {glGetString(GL_VERSION).decode()}')
+
+        # render target: color and depth renderbuffers
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        self.renderbuffers = glGenRenderbuffers(2)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.renderbuffers[0])
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.renderbuffers[0])
+        glBindRenderbuffer(GL_RENDERBUFFER, self.renderbuffers[1])
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.renderbuffers[1])
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError('offscreen framebuffer is incomplete')
+        glViewport(0, 0, width, height)
+
+    def _create_egl_context(self):
+        # Mesa's EGL needs a display server for its default display unless told otherwise (other drivers ignore this)
+        os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+        from OpenGL import EGL
+        self.egl = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError('could not initialize EGL')
+
+        config_attribs = [EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                          EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8, EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_NONE]
+        config, num_configs = EGL.EGLConfig(), EGL.EGLint()
+        if not EGL.eglChooseConfig(self.display, (EGL.EGLint * len(config_attribs))(*config_attribs), ctypes.pointer(config), 1, ctypes.pointer(num_configs)) or not num_configs.value:
+            raise RuntimeError('no EGL config supports OpenGL pbuffers')
+
+        # the pbuffer only makes the context current, frames are rendered into the framebuffer object
+        surface_attribs = [EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE]
+        self.surface = EGL.eglCreatePbufferSurface(self.display, config, (EGL.EGLint * len(surface_attribs))(*surface_attribs))
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context_attribs = [EGL.EGL_CONTEXT_MAJOR_VERSION, 3, EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+                           EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT, EGL.EGL_NONE]
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, (EGL.EGLint * len(context_attribs))(*context_attribs))
+        if not self.context or not EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context):
+            raise RuntimeError('could not create an OpenGL 3.3 core EGL context')
+
+    def _create_osmesa_context(self):
+        from OpenGL import osmesa, arrays
+        self.osmesa = osmesa
+        attribs = arrays.GLintArray.asArray([osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA, osmesa.OSMESA_DEPTH_BITS, 24,
+                                             osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+                                             osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 3, osmesa.OSMESA_CONTEXT_MINOR_VERSION, 3, 0])
+        self.context = osmesa.OSMesaCreateContextAttribs(attribs, None)
+        # OSMesa renders the default framebuffer into client memory; a minimal one, frames go to the framebuffer object
+        self.buffer = arrays.GLubyteArray.zeros((1, 1, 4))
+        if not self.context or not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, 1, 1):
+            raise RuntimeError('could not create an OpenGL 3.3 core OSMesa context')
+
+    def destroy(self):
+        glDeleteRenderbuffers(2, self.renderbuffers)
+        glDeleteFramebuffers(1, [self.fbo])
+        if self.platform == 'egl':
+            self.egl.eglMakeCurrent(self.display, self.egl.EGL_NO_SURFACE, self.egl.EGL_NO_SURFACE, self.egl.EGL_NO_CONTEXT)
+            self.egl.eglDestroySurface(self.display, self.surface)
+            self.egl.eglDestroyContext(self.display, self.context)
+            self.egl.eglTerminate(self.display)
+        else:
+            self.osmesa.OSMesaDestroyContext(self.context)
+
+class PixelReader:
+    # asynchronous readback through a ring of pixel pack buffers: glReadPixels into a PBO returns without waiting for the frame,
+    # the pixels are mapped only after the following frames are submitted, so the copy overlaps their rendering
+    def __init__(self, width, height, num_buffers=2):
+        self.width, self.height = width, height
+        self.frame_bytes = width * height * 4
+        self.pbos = list(glGenBuffers(num_buffers))
+        for pbo in self.pbos:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.frame_bytes, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.pending = []       # (tag, pbo) of frames read but not mapped yet, oldest first
+
+    def read(self, tag):
+        # start reading the current framebuffer, returns (tag, pixels) of the oldest pending frame once every PBO is in use
+        finished = self.map_oldest() if len(self.pending) == len(self.pbos) else None
+        pbo = next(pbo for pbo in self.pbos if all(pbo != pending for _, pending in self.pending))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.pending.append((tag, pbo))
+        return finished
+
+    def finish(self):
+        # (tag, pixels) of every frame still pending
+        while self.pending:
+            yield self.map_oldest()
+
+    def map_oldest(self):
+        tag, pbo = self.pending.pop(0)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        address = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, self.frame_bytes, GL_MAP_READ_BIT)
+        # rows are bottom-up in OpenGL
+        pixels = np.ctypeslib.as_array(ctypes.cast(address, ctypes.POINTER(ctypes.c_ubyte)), (self.height, self.width, 4))[::-1].copy()
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        return tag, pixels
+
+    def delete(self):
+        glDeleteBuffers(len(self.pbos), self.pbos)
+
+def write_png(filename, pixels, compression=1):
+    # (height, width, 4) uint8 RGBA pixels as an opaque RGB PNG file, with no imaging library
+    height, width, _ = pixels.shape
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    # every scanline starts with filter type 0 (none)
+    scanlines = np.concatenate([np.zeros((height, 1), dtype=np.uint8), pixels[:, :, :3].reshape(height, -1)], axis=1)
+    try:
+        with open(filename, 'wb') as file:
+            file.write(b'\x89PNG\r\n\x1a\n')
+            file.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+            file.write(chunk(b'IDAT', zlib.compress(scanlines.tobytes(), compression)))
+            file.write(chunk(b'IEND', b''))
+    except IOError:
+        print(f"Error: Could not write file {filename}")
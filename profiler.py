@@ -0,0 +1,199 @@
+from OpenGL.GL import *
+import numpy as np
+import collections
+import contextlib
+import csv
+import ctypes
+import json
+import time
+
+GPU_QUERY_RING_SIZE = 4     # GL_TIME_ELAPSED queries in flight; results are read this many frames late at most, never waited for
+OVERLAY_MS_HEIGHT = .01     # overlay bar height of one millisecond, in normalized device coordinates
+PHASE_COLORS = [(0.2, 0.6, 1.), (1., 0.6, 0.2), (0.3, 0.9, 0.3), (0.9, 0.3, 0.9), (1., 1., 0.3), (0.3, 0.9, 0.9)]
+
+class Profiler:
+    # opt-in per-frame instrumentation: CPU time of each phase (perf counters), GPU time of the frame (GL_TIME_ELAPSED queries
+    # polled without blocking) and counters such as draw calls and bytes uploaded. The last `history` frames are kept
+    # for the overlay and rewritten to export_path (.csv or .json) every export_interval frames.
+    def __init__(self, history=300, export_path=None, export_interval=60):
+        self.enabled = False
+        self.frames = collections.deque(maxlen=history)     # records of finished frames, oldest first
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.num_frames = 0
+        self.frame = None           # record of the next frame; phases and counts outside begin_frame / end_frame go to the later one
+        self.frame_start_time = 0.
+        self.free_queries = []
+        self.pending_queries = []   # (query, record) of frames whose GPU time is not available yet, oldest first (None: canceled)
+        self.discard_gpu_time = False
+        self.vao, self.vbo = None, None
+
+    def set_enabled(self, enabled):
+        # call between frames
+        if enabled and not self.free_queries and not self.pending_queries:
+            self.free_queries = list(glGenQueries(GPU_QUERY_RING_SIZE))
+            # some drivers (Mesa's llvmpipe) report a bogus time for the first query of a context, it is dropped
+            self.discard_gpu_time = True
+        if enabled and not self.enabled:
+            self.frame = self._new_record()
+        self.enabled = enabled
+
+    def _new_record(self):
+        # gpu_ms is filled in when the frame's query result arrives
+        return {'frame': None, 'cpu_ms': 0., 'gpu_ms': None}
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.frame_start_time = time.perf_counter()
+        # the frame's GPU time, unless every query of the ring is still in flight
+        if self.free_queries:
+            query = self.free_queries.pop()
+            glBeginQuery(GL_TIME_ELAPSED, query)
+            self.pending_queries.append((query, self.frame))
+
+    def cancel_frame(self):
+        # the frame begun was not drawn after all (nothing changed with rendering on demand): its phases, counts and GPU time are dropped
+        if not self.enabled:
+            return
+        if self.pending_queries and self.pending_queries[-1][1] is self.frame:
+            glEndQuery(GL_TIME_ELAPSED)
+            self.pending_queries[-1] = (self.pending_queries[-1][0], None)
+        self.frame = self._new_record()
+        self.poll_queries()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # with profiler.phase('cull'): ... adds the CPU time of the block to <name>_ms of the current frame
+        if not self.enabled:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            key = f'{name}_ms'
+            self.frame[key] = self.frame.get(key, 0.) + (time.perf_counter() - start_time) * 1000
+
+    def count(self, name, value=1):
+        # adds value to the counter name of the current frame
+        if self.enabled:
+            self.frame[name] = self.frame.get(name, 0) + value
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        if self.pending_queries and self.pending_queries[-1][1] is self.frame:
+            glEndQuery(GL_TIME_ELAPSED)
+        self.num_frames += 1
+        self.frame['frame'] = self.num_frames
+        self.frame['cpu_ms'] = (time.perf_counter() - self.frame_start_time) * 1000
+        self.frames.append(self.frame)
+        self.frame = self._new_record()
+        self.poll_queries()
+        if self.export_path and self.num_frames % self.export_interval == 0:
+            self.export(self.export_path)
+
+    def poll_queries(self):
+        # fill in the GPU time of finished frames; queries complete in order, so stop at the first unavailable one
+        while self.pending_queries:
+            query, record = self.pending_queries[0]
+            if not glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE):
+                break
+            # PyOpenGL cannot allocate the 64 bit result itself
+            nanoseconds = ctypes.c_uint64()
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(nanoseconds))
+            if record is not None and not self.discard_gpu_time:
+                record['gpu_ms'] = nanoseconds.value / 1e6
+            self.discard_gpu_time = False
+            self.free_queries.append(query)
+            self.pending_queries.pop(0)
+
+    def get_summary(self):
+        # {column: mean over the kept frames} of every timing and counter
+        summary = {}
+        for name in self.get_columns()[1:]:
+            values = [record[name] for record in self.frames if record.get(name) is not None]
+            if values:
+                summary[name] = sum(values) / len(values)
+        return summary
+
+    def get_columns(self):
+        # 'frame', then every timing and counter in order of first appearance
+        columns = {}
+        for record in self.frames:
+            columns.update(dict.fromkeys(record))
+        return list(columns)
+
+    def export(self, filename):
+        columns = self.get_columns()
+        try:
+            with open(filename, 'w', newline='') as file:
+                if filename.endswith('.json'):
+                    json.dump({'summary': self.get_summary(), 'frames': list(self.frames)}, file, indent=1)
+                else:
+                    writer = csv.DictWriter(file, columns)
+                    writer.writeheader()
+                    writer.writerows(self.frames)
+        except IOError:
+            print(f"Error: Could not write file {filename}")
+
+    def get_overlay_vertices(self):
+        # (position, color) line vertices in normalized device coordinates: one stacked column of phase times per kept frame
+        # along the bottom left of the screen, a white trace of GPU times and gray lines at 60 and 30 fps frame times
+        phases = [name for name in self.get_columns() if name.endswith('_ms') and name not in ('cpu_ms', 'gpu_ms')]
+        left, bottom, width = -.95, -.95, 1.2
+        step = width / self.frames.maxlen
+        vertices = []
+        for ms in (1000 / 60, 1000 / 30):
+            y = bottom + ms * OVERLAY_MS_HEIGHT
+            vertices += [(left, y, .5, .5, .5), (left + width, y, .5, .5, .5)]
+        previous_gpu = None
+        for i, record in enumerate(self.frames):
+            x = left + i * step
+            y = bottom
+            for j, name in enumerate(phases):
+                height = record.get(name, 0.) * OVERLAY_MS_HEIGHT
+                vertices += [(x, y) + PHASE_COLORS[j % len(PHASE_COLORS)], (x, y + height) + PHASE_COLORS[j % len(PHASE_COLORS)]]
+                y += height
+            gpu = record['gpu_ms']
+            if gpu is not None and previous_gpu is not None:
+                vertices += [(x - step, bottom + previous_gpu * OVERLAY_MS_HEIGHT, 1., 1., 1.), (x, bottom + gpu * OVERLAY_MS_HEIGHT, 1., 1., 1.)]
+            previous_gpu = gpu
+        return np.array(vertices, dtype=np.float32).reshape(-1, 5)
+
+    def draw_overlay(self, program):
+        # draws the overlay on top of the frame with a shader taking 2D positions (see g_vertex_shader_src_overlay)
+        if not self.enabled or not self.frames:
+            return
+        if self.vao is None:
+            self.vao = glGenVertexArrays(1)
+            glBindVertexArray(self.vao)
+            self.vbo = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+            glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 5 * 4, None)
+            glEnableVertexAttribArray(0)
+            glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 5 * 4, ctypes.c_void_p(2 * 4))
+            glEnableVertexAttribArray(1)
+        vertices = self.get_overlay_vertices()
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, ctypes.c_void_p(vertices.ctypes.data), GL_STREAM_DRAW)
+
+        glDisable(GL_DEPTH_TEST)
+        glUseProgram(program)
+        glBindVertexArray(self.vao)
+        glDrawArrays(GL_LINES, 0, len(vertices))
+        glEnable(GL_DEPTH_TEST)
+
+    def get_title(self):
+        # averages of the kept frames, for the window title
+        summary = self.get_summary()
+        text = f'cpu {summary.get("cpu_ms", 0.):.2f} ms'
+        if 'gpu_ms' in summary:
+            text += f', gpu {summary["gpu_ms"]:.2f} ms'
+        for name, value in summary.items():
+            if name.endswith('_ms') and name not in ('cpu_ms', 'gpu_ms'):
+                text += f', {name[:-3]} {value:.2f}'
+            elif not name.endswith('_ms'):
+                text += f', {name} {value:.0f}'
+        return text
@@ -0,0 +1,86 @@
+from OpenGL.GL import *
+import glm
+
+from shader import CAMERA_BINDING
+
+class CameraBuffer:
+    # per-frame uniform buffer shared by every program: mat4 P, mat4 V, mat4 VP, vec3 view_pos (std140 layout)
+    SIZE = 3 * 64 + 16
+
+    def __init__(self):
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.SIZE, None, GL_DYNAMIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, CAMERA_BINDING, self.ubo)
+
+    def update(self, P, V, view_pos):
+        data = P.to_bytes() + V.to_bytes() + (P * V).to_bytes() + glm.vec4(view_pos, 0.).to_bytes()
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, len(data), data)
+
+class RenderQueue:
+    # draws submitted during a frame are sorted by program, then VAO, then material, and issued with
+    # only the program / VAO binds and uniform uploads that actually change GL state
+    def __init__(self):
+        self.items = []
+        self.uniform_locations = {}     # (program, name) -> location
+        self.uniform_values = {}        # (program, location) -> bytes of the value last uploaded
+        self.num_issued = 0             # state changes issued / eliminated by the last flush
+        self.num_eliminated = 0
+        self.num_draws = 0              # draw callbacks, uniform uploads and uniform bytes of the last flush
+        self.num_uniform_uploads = 0
+        self.uniform_bytes = 0
+
+    def submit(self, program, vao, draw, uniforms=None, material=()):
+        # draw: callable issuing the draw call(s) once program and vao are bound and uniforms are set
+        # uniforms: {name: glm.mat4 / glm.mat3 / glm.vec3 / float}, material: sortable key grouping draws with equal uniforms
+        self.items.append((program, vao, material, uniforms or {}, draw))
+
+    def flush(self):
+        # VAO and program bindings may have been changed outside the queue since the last frame
+        current_program, current_vao = None, None
+        self.num_issued = self.num_eliminated = 0
+        self.num_draws = self.num_uniform_uploads = self.uniform_bytes = 0
+        for program, vao, _, uniforms, draw in sorted(self.items, key=lambda item: item[:3]):
+            if program != current_program:
+                glUseProgram(program)
+                current_program = program
+                self.num_issued += 1
+            else:
+                self.num_eliminated += 1
+            if vao != current_vao:
+                glBindVertexArray(vao)
+                current_vao = vao
+                self.num_issued += 1
+            else:
+                self.num_eliminated += 1
+            for name, value in uniforms.items():
+                location = self.get_uniform_location(program, name)
+                data = value.to_bytes() if hasattr(value, 'to_bytes') else value
+                if self.uniform_values.get((program, location)) == data:
+                    self.num_eliminated += 1
+                    continue
+                self.uniform_values[(program, location)] = data
+                self.upload_uniform(location, value)
+                self.num_issued += 1
+                self.num_uniform_uploads += 1
+                self.uniform_bytes += len(data) if isinstance(data, bytes) else 4
+            draw()
+            self.num_draws += 1
+        self.items.clear()
+
+    def get_uniform_location(self, program, name):
+        key = (program, name)
+        if key not in self.uniform_locations:
+            self.uniform_locations[key] = glGetUniformLocation(program, name)
+        return self.uniform_locations[key]
+
+    def upload_uniform(self, location, value):
+        if isinstance(value, glm.mat4):
+            glUniformMatrix4fv(location, 1, GL_FALSE, glm.value_ptr(value))
+        elif isinstance(value, glm.mat3):
+            glUniformMatrix3fv(location, 1, GL_FALSE, glm.value_ptr(value))
+        elif isinstance(value, glm.vec3):
+            glUniform3f(location, value.x, value.y, value.z)
+        else:
+            glUniform1f(location, value)
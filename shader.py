@@ -0,0 +1,376 @@
+from OpenGL.GL import *
+import ctypes
+import numpy as np
+import hashlib
+import os
+import struct
+import time
+
+# Shader sources and program loading shared by every viewer. Entry points add the repository root to sys.path to import it,
+# along with the other modules every viewer uses (render_queue.py, frame_pacer.py, ...).
+
+CAMERA_BINDING = 0      # uniform buffer binding point of the Camera block, see render_queue.CameraBuffer
+
+SHADER_CACHE_DIR = os.environ.get('SHADER_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'opengl_viewer', 'shaders'))
+
+# file layout: magic, program binary format, driver specific program binary
+_MAGIC = b'GLPROGBN'
+_HEADER = struct.Struct('<8sI')
+
+g_vertex_shader_src = '''
+#version 330 core
+
+layout (location = 0) in vec3 vin_pos; 
+layout (location = 1) in vec3 vin_color; 
+
+out vec4 vout_color;
+
+layout (std140) uniform Camera
+{
+    mat4 P;
+    mat4 V;
+    mat4 VP;
+    vec3 view_pos;
+};
+
+uniform mat4 M;
+
+void main()
+{
+    // 3D points in homogeneous coordinates
+    vec4 p3D_in_hcoord = vec4(vin_pos.xyz, 1.0);
+    
+    gl_Position = VP * M * p3D_in_hcoord;
+    
+    vout_color = vec4(vin_color, 1.);
+}
+'''
+
+g_vertex_shader_src_normal = '''
+#version 330 core
+
+layout (location = 0) in vec3 vin_pos; 
+layout (location = 1) in vec3 vin_normal; 
+
+out vec3 vout_surface_pos;
+out vec3 vout_normal;
+
+layout (std140) uniform Camera
+{
+    mat4 P;
+    mat4 V;
+    mat4 VP;
+    vec3 view_pos;
+};
+
+uniform mat4 M;
+uniform mat3 N;     // normal matrix, computed once per draw on the CPU (see normal_matrix.py)
+
+void main()
+{
+    // 3D points in homogeneous coordinates
+    vec4 p3D_in_hcoord = vec4(vin_pos.xyz, 1.0);
+    gl_Position = VP * M * p3D_in_hcoord;
+
+    vout_surface_pos = vec3(M * vec4(vin_pos, 1));
+    vout_normal = normalize(N * vin_normal);
+}
+'''
+
+g_vertex_shader_src_instanced = '''
+#version 330 core
+
+layout (location = 0) in vec3 vin_pos; 
+layout (location = 1) in vec3 vin_normal; 
+layout (location = 2) in mat4 vin_M;        // per instance, occupies locations 2-5
+layout (location = 6) in vec3 vin_color;    // per instance
+layout (location = 7) in mat3 vin_N;        // per instance normal matrix, occupies locations 7-9
+
+out vec3 vout_surface_pos;
+out vec3 vout_normal;
+flat out vec3 material_color;
+
+layout (std140) uniform Camera
+{
+    mat4 P;
+    mat4 V;
+    mat4 VP;
+    vec3 view_pos;
+};
+
+void main()
+{
+    // 3D points in homogeneous coordinates
+    vec4 p3D_in_hcoord = vec4(vin_pos.xyz, 1.0);
+    vec4 p3D_in_world = vin_M * p3D_in_hcoord;
+    gl_Position = VP * p3D_in_world;
+
+    vout_surface_pos = vec3(p3D_in_world);
+    vout_normal = normalize(vin_N * vin_normal);
+    material_color = vin_color;
+}
+'''
+
+g_vertex_shader_src_overlay = '''
+#version 330 core
+
+layout (location = 0) in vec2 vin_pos; 
+layout (location = 1) in vec3 vin_color; 
+
+out vec4 vout_color;
+
+void main()
+{
+    // profiler overlay, already in normalized device coordinates
+    gl_Position = vec4(vin_pos, 0., 1.);
+    
+    vout_color = vec4(vin_color, 1.);
+}
+'''
+
+g_fragment_shader_src = '''
+#version 330 core
+
+in vec4 vout_color;
+out vec4 FragColor;
+
+void main()
+{
+    FragColor = vout_color;
+}
+'''
+
+g_fragment_shader_src_normal = '''
+#version 330 core
+
+in vec3 vout_surface_pos;
+in vec3 vout_normal;
+
+out vec4 FragColor;
+
+#ifdef INSTANCED
+flat in vec3 material_color;    // from the instance (g_vertex_shader_src_instanced)
+#else
+uniform vec3 material_color;
+#endif
+
+layout (std140) uniform Camera
+{
+    mat4 P;
+    mat4 V;
+    mat4 VP;
+    vec3 view_pos;
+};
+
+vec3 calculateLight(vec3 light_pos)
+{
+    // light and material properties
+    vec3 light_color = vec3(1,1,1);
+    float material_shininess = 32.0;
+
+    // light components
+    vec3 light_ambient = 0.4*light_color;
+    vec3 light_diffuse = light_color;
+    vec3 light_specular = light_color;
+
+    // material components
+    vec3 material_ambient = material_color;
+    vec3 material_diffuse = material_color;
+    vec3 material_specular = light_color;  // for non-metal material
+
+    // ambient
+    vec3 ambient = light_ambient * material_ambient;
+
+    // for diffiuse and specular
+    vec3 normal = normalize(vout_normal);
+    vec3 light_dir = normalize(light_pos - vout_surface_pos);
+
+    // diffuse
+    float diff = max(dot(normal, light_dir), 0);
+    vec3 diffuse = diff * light_diffuse * material_diffuse;
+
+    // specular
+    vec3 view_dir = normalize(view_pos - vout_surface_pos);
+    vec3 reflect_dir = reflect(-light_dir, normal);
+    float spec = pow( max(dot(view_dir, reflect_dir), 0.0), material_shininess);
+    vec3 specular = spec * light_specular * material_specular;
+
+    return (ambient + diffuse + specular);
+}
+
+void main()
+{
+    // make and apply multiple light sources
+    vec3 light_pos1 = vec3(20, 2, 4);
+    vec3 light_pos2 = vec3(-30, 4, -50);
+    
+    vec3 color = vec3(0., 0., 0.);
+    color += calculateLight(light_pos1);
+    color += calculateLight(light_pos2);
+    FragColor = vec4(color, 1.);
+}
+'''
+
+def compile_program(vertex_shader_source, fragment_shader_source, retrievable=False):
+    # build and compile our shader program
+    # ------------------------------------
+    
+    # vertex shader 
+    vertex_shader = glCreateShader(GL_VERTEX_SHADER)    # create an empty shader object
+    glShaderSource(vertex_shader, vertex_shader_source) # provide shader source code
+    glCompileShader(vertex_shader)                      # compile the shader object
+    
+    # check for shader compile errors
+    success = glGetShaderiv(vertex_shader, GL_COMPILE_STATUS)
+    if (not success):
+        infoLog = glGetShaderInfoLog(vertex_shader)
+        print("ERROR::SHADER::VERTEX::COMPILATION_FAILED\n" + infoLog.decode())
+        
+    # fragment shader
+    fragment_shader = glCreateShader(GL_FRAGMENT_SHADER)    # create an empty shader object
+    glShaderSource(fragment_shader, fragment_shader_source) # provide shader source code
+    glCompileShader(fragment_shader)                        # compile the shader object
+    
+    # check for shader compile errors
+    success = glGetShaderiv(fragment_shader, GL_COMPILE_STATUS)
+    if (not success):
+        infoLog = glGetShaderInfoLog(fragment_shader)
+        print("ERROR::SHADER::FRAGMENT::COMPILATION_FAILED\n" + infoLog.decode())
+
+    # link shaders
+    shader_program = glCreateProgram()               # create an empty program object
+    glAttachShader(shader_program, vertex_shader)    # attach the shader objects to the program object
+    glAttachShader(shader_program, fragment_shader)
+    if retrievable:
+        glProgramParameteri(shader_program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)  # keep the binary for the program cache
+    glLinkProgram(shader_program)                    # link the program object
+
+    # check for linking errors
+    success = glGetProgramiv(shader_program, GL_LINK_STATUS)
+    if (not success):
+        infoLog = glGetProgramInfoLog(shader_program)
+        print("ERROR::SHADER::PROGRAM::LINKING_FAILED\n" + infoLog.decode())
+        
+    glDeleteShader(vertex_shader)
+    glDeleteShader(fragment_shader)
+
+    return shader_program    # return the shader program
+
+def add_defines(source, defines):
+    # #define lines right after the #version line
+    if not defines:
+        return source
+    version, _, rest = source.lstrip().partition('\n')
+    return '\n'.join([version] + [f'#define {name} {value}' for name, value in defines.items()] + [rest])
+
+class ProgramCache:
+    # linked program binaries on disk (glGetProgramBinary / glProgramBinary), keyed by a hash of the sources, defines and driver.
+    # Programs are compiled from source on a miss, when the driver offers no binary format, or when it rejects a cached binary.
+    def __init__(self, cache_dir=SHADER_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.supported = None   # whether the driver can save program binaries, checked with the first program
+        self.binary_formats = set()
+        self.num_hits = 0
+        self.num_compiled = 0
+        self.hit_time = 0.
+        self.compile_time = 0.
+
+    def is_supported(self):
+        if self.supported is None:
+            try:
+                self.supported = bool(glProgramBinary) and glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+                if self.supported:
+                    self.binary_formats = set(int(binary_format) for binary_format in np.ravel(glGetIntegerv(GL_PROGRAM_BINARY_FORMATS)))
+            except GLError:
+                self.supported = False
+        return self.supported
+
+    def get_entry_path(self, vertex_shader_source, fragment_shader_source):
+        # sources already contain the defines; the driver string changes whenever binaries become invalid
+        driver = '|'.join(glGetString(name).decode() for name in (GL_VENDOR, GL_RENDERER, GL_VERSION))
+        key = hashlib.sha256('\0'.join([vertex_shader_source, fragment_shader_source, driver]).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'{key[:32]}.bin')
+
+    def load(self, entry):
+        # program linked from a cached binary, or None on a miss or a rejected binary (whose entry is removed, get_program rewrites it)
+        try:
+            with open(entry, 'rb') as file:
+                magic, binary_format = _HEADER.unpack(file.read(_HEADER.size))
+                binary = file.read()
+        except (OSError, struct.error):
+            return None
+        if magic != _MAGIC or binary_format not in self.binary_formats:
+            self.discard(entry)
+            return None
+        program = glCreateProgram()
+        try:
+            # drivers raise GL_INVALID_ENUM / GL_INVALID_VALUE for binaries they cannot read at all
+            glProgramBinary(program, binary_format, binary, len(binary))
+            linked = glGetProgramiv(program, GL_LINK_STATUS)
+        except GLError:
+            linked = False
+        if not linked:
+            glDeleteProgram(program)
+            self.discard(entry)
+            return None
+        return program
+
+    def discard(self, entry):
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    def store(self, entry, program):
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if not length:
+            return
+        binary = (ctypes.c_ubyte * length)()
+        written, binary_format = GLsizei(0), GLenum(0)
+        glGetProgramBinary(program, length, ctypes.byref(written), ctypes.byref(binary_format), binary)
+        # write to a temporary file first so other viewers never read a partial entry
+        tmp = f'{entry}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp, 'wb') as file:
+                file.write(_HEADER.pack(_MAGIC, binary_format.value))
+                file.write(bytes(binary)[:written.value])
+            os.replace(tmp, entry)
+        except IOError:
+            print(f"Error: Could not write file {entry}")
+
+    def get_program(self, vertex_shader_source, fragment_shader_source):
+        start_time = time.perf_counter()
+        entry = None
+        if self.is_supported():
+            entry = self.get_entry_path(vertex_shader_source, fragment_shader_source)
+            program = self.load(entry)
+            if program is not None:
+                self.num_hits += 1
+                self.hit_time += time.perf_counter() - start_time
+                return program
+
+        program = compile_program(vertex_shader_source, fragment_shader_source, retrievable=entry is not None)
+        if entry is not None and glGetProgramiv(program, GL_LINK_STATUS):
+            self.store(entry, program)
+        self.num_compiled += 1
+        self.compile_time += time.perf_counter() - start_time
+        return program
+
+    def report(self):
+        print(f'shader programs: {self.num_hits} from the binary cache in {self.hit_time * 1000:.1f} ms, '
+              f'{self.num_compiled} compiled from source in {self.compile_time * 1000:.1f} ms')
+        print('----------------------------------------------------------')
+
+g_program_cache = ProgramCache()
+
+def load_shaders(vertex_shader_source, fragment_shader_source, defines=None):
+    # defines: {name: value} added to both stages, e.g. {'INSTANCED': 1}
+    shader_program = g_program_cache.get_program(add_defines(vertex_shader_source, defines), add_defines(fragment_shader_source, defines))
+
+    # every program reads the camera from the shared per-frame uniform buffer; block bindings are not part of the program binary
+    camera_block = glGetUniformBlockIndex(shader_program, 'Camera')
+    if camera_block != GL_INVALID_INDEX:
+        glUniformBlockBinding(shader_program, camera_block, CAMERA_BINDING)
+
+    return shader_program    # return the shader program